@@ -1,2 +1,100 @@
-from .zodb import ZODBBTreeBackend
+"""
+The graph backends, and a registry to open them by URL.
+
+Backends are opened with open_backend() (or Graph.open()) from a URL whose
+scheme names the backend, e.g. 'memory://' or 'zodb:///path/to/data.fs'.
+A backend's module is only imported the first time it is opened, so the
+ZODB backend doesn't load ZODB unless it is used.
+
+Other packages can provide backends by registering an opener in the
+'adhara.backends' entry point group under the name of their URL scheme.
+An opener is a callable taking the URL and returning a backend object.
+"""
 from .in_memory import DictionaryBackend
+from .sharded import ShardedBackend
+
+
+ENTRY_POINT_GROUP = 'adhara.backends'
+
+#scheme -> opener, or the 'module:attribute' name of the opener
+_openers = {
+    'memory': 'backends.in_memory:open_url',
+    'zodb': 'backends.zodb:open_url',
+}
+
+#backends imported on first access, as the attributes of this package
+_lazy = {
+    'ZODBBTreeBackend': 'backends.zodb',
+}
+
+
+def __getattr__(name):
+    module = _lazy.get(name)
+    if module is None:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    import importlib
+    return getattr(importlib.import_module(module), name)
+
+
+def register_backend(scheme, opener):
+    '''
+    Register a backend under the URL scheme scheme.
+
+    Args:
+        scheme: the scheme of the URLs opened by the backend, e.g. 'memory'
+        opener: a callable taking the URL and returning a backend object, or
+        its name as 'module:attribute', imported only when first used
+    '''
+    _openers[scheme] = opener
+
+
+def _resolve(name):
+    import importlib
+    module, attribute = name.split(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
+def _entry_point(scheme):
+    '''
+    Returns:
+        the opener registered for scheme by an installed package, or None
+    '''
+    from importlib import metadata
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        found = entry_points.select(group=ENTRY_POINT_GROUP, name=scheme)
+    else:
+        found = [e for e in entry_points.get(ENTRY_POINT_GROUP, ()) if e.name == scheme]
+    for entry_point in found:
+        return entry_point.load()
+    return None
+
+
+def open_backend(url):
+    '''
+    Open the backend for url.
+
+    Args:
+        url: a URL whose scheme names the backend: 'memory://' for a
+        DictionaryBackend, 'zodb:///path/to/data.fs' for a ZODBBTreeBackend
+        on a FileStorage (or 'zodb://' for an in-memory ZODB database), or
+        the scheme of a registered backend
+
+    Returns:
+        the backend object
+
+    Raises:
+        ValueError: if no backend is registered for the scheme
+    '''
+    scheme, separator, rest = url.partition('://')
+    if not separator:
+        raise ValueError('%r is not a backend URL, e.g. memory:// or zodb:///path' % url)
+    opener = _openers.get(scheme)
+    if opener is None:
+        opener = _entry_point(scheme)
+        if opener is None:
+            raise ValueError('no backend registered for %r URLs' % scheme)
+    if isinstance(opener, str):
+        opener = _resolve(opener)
+    _openers[scheme] = opener
+    return opener(url)
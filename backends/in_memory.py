@@ -1,19 +1,75 @@
+import itertools
+from bisect import bisect_left, insort
+
+
 class DictionaryBackend():
     '''
     we use an dict to store our adjacency lists
     see https://www.python.org/doc/essays/graphs/
+
+    Args:
+        snapshots (optional): Boolean value, True to keep the stores in
+        versioned dictionaries (see mvcc.py) so snapshot() works.  Writes are
+        a little slower with them.
     '''
 
-    def __init__(self):
+    persistent = False
+
+    def __init__(self, snapshots=False):
         '''
         We store our data in a dictionary
         '''
         
-        self.node_store = {}
-        self.attribute_store = {}
-        self.edge_store = {}
-        self.weight_store = {}
-        self.direction_store = []
+        #the pair_store maps (node1, node2) -> the edge from node1 to node2,
+        #or a frozenset of the edges if there are several, and the
+        #incoming_store maps node2 -> {edge: node1}
+        #for the directed edges to node2
+        self.versions = None
+        if snapshots:
+            from .mvcc import Versions, VersionedDict, VersionedSet
+            self.versions = Versions()
+            self.node_store = VersionedDict(self.versions, nested=True)
+            self.attribute_store = VersionedDict(self.versions, nested=True)
+            self.edge_store = VersionedDict(self.versions)
+            self.weight_store = VersionedDict(self.versions)
+            self.direction_store = VersionedSet(self.versions)
+            self.pair_store = VersionedDict(self.versions)
+            self.incoming_store = VersionedDict(self.versions, nested=True)
+        else:
+            self.node_store = {}
+            self.attribute_store = {}
+            self.edge_store = {}
+            self.weight_store = {}
+            self.direction_store = DirectionSet()
+            self.pair_store = {}
+            self.incoming_store = {}
+        #used by the optional component index, see components.py
+        self.component_store = {}
+        #used by WeightedGraph, see weighted_graph.py
+        self.node_weight_index = WeightIndex()
+        self.edge_weight_index = WeightIndex()
+        #used by the change feed, see changefeed.py
+        self.counter_store = {}
+
+    def scan_adjacency(self):
+        '''
+        Returns:
+            an iterator of (node, adjacency) pairs over the whole node_store
+        '''
+        return iter(self.node_store.items())
+
+    def snapshot(self):
+        '''
+        Returns:
+            a Snapshot (see mvcc.py) of the stores as they are now
+
+        Raises:
+            TypeError: if the backend was created without snapshots=True
+        '''
+        if self.versions is None:
+            raise TypeError('snapshots need a DictionaryBackend(snapshots=True)')
+        from .mvcc import Snapshot
+        return Snapshot(self)
 
     def commit(self):
         '''Simply commits the transaction'''
@@ -22,3 +78,152 @@ class DictionaryBackend():
     def abort(self):
         '''Simply aborts the transaction'''
         pass
+
+
+class DirectionSet(set):
+    '''
+    A set of the directed edges, with the append method of the list
+    it replaces, so membership tests and removals don't scan every
+    directed edge.
+    '''
+
+    def append(self, key):
+        self.add(key)
+
+
+def open_url(url):
+    '''
+    Returns:
+        a new DictionaryBackend, for 'memory://' URLs
+    '''
+    return DictionaryBackend()
+
+
+class WeightIndex():
+    '''
+    The (weight, element) pairs of a graph, kept sorted in a list of chunks
+    with bisect, with the methods of the TreeSet used by the ZODB backend.
+
+    A pair is found by bisecting the last pair of each chunk, then the
+    chunk, so adding or removing one costs O(log N) comparisons and moves
+    at most 2 * load pairs, rather than shifting the whole list.
+    '''
+
+    load = 1000
+
+    def __init__(self):
+        self.clear()
+
+    def _locate(self, key):
+        '''
+        Returns:
+            the index of the first chunk ending at or after key, and the
+            position of key in that chunk, or (len(chunks), 0) if key sorts
+            after every pair
+        '''
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return i, 0
+        return i, bisect_left(self.chunks[i], key)
+
+    def add(self, key):
+        chunks = self.chunks
+        maxes = self.maxes
+        self.size += 1
+        if not chunks:
+            chunks.append([key])
+            maxes.append(key)
+            return
+        i = bisect_left(maxes, key)
+        if i == len(maxes):
+            i -= 1
+            chunks[i].append(key)
+            maxes[i] = key
+        else:
+            insort(chunks[i], key)
+        chunk = chunks[i]
+        if len(chunk) > 2 * self.load:
+            half = chunk[self.load:]
+            del chunk[self.load:]
+            chunks.insert(i + 1, half)
+            maxes[i] = chunk[-1]
+            maxes.insert(i + 1, half[-1])
+
+    def remove(self, key):
+        i, position = self._locate(key)
+        if i == len(self.chunks) or self.chunks[i][position] != key:
+            raise KeyError(key)
+        chunk = self.chunks[i]
+        del chunk[position]
+        self.size -= 1
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+
+    def clear(self):
+        #the chunks, and the last pair of each
+        self.chunks = []
+        self.maxes = []
+        self.size = 0
+
+    def __contains__(self, key):
+        i, position = self._locate(key)
+        return i < len(self.chunks) and self.chunks[i][position] == key
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.chunks)
+
+    def __len__(self):
+        return self.size
+
+    def ascending(self, lo=None, hi=None):
+        '''
+        Returns:
+            an iterator of the pairs with lo <= weight <= hi, lightest first
+        '''
+        chunks = self.chunks
+        i, position = (0, 0) if lo is None else self._locate((lo,))
+        while i < len(chunks):
+            chunk = chunks[i]
+            while position < len(chunk):
+                key = chunk[position]
+                if hi is not None and key[0] > hi:
+                    return
+                yield key
+                position += 1
+            i += 1
+            position = 0
+
+    def descending(self, lo=None, hi=None):
+        '''
+        Returns:
+            an iterator of the pairs with lo <= weight <= hi, heaviest first
+        '''
+        chunks = self.chunks
+        i = len(chunks)
+        if hi is not None:
+            #(hi,) sorts before every pair of weight hi
+            i, position = self._locate((hi,))
+            while i < len(chunks):
+                chunk = chunks[i]
+                while position < len(chunk) and chunk[position][0] <= hi:
+                    position += 1
+                if position < len(chunk):
+                    break
+                i += 1
+                position = 0
+        if i == len(chunks):
+            i -= 1
+            position = len(chunks[i]) if chunks else 0
+        while i >= 0:
+            chunk = chunks[i]
+            while position > 0:
+                position -= 1
+                key = chunk[position]
+                if lo is not None and key[0] < lo:
+                    return
+                yield key
+            i -= 1
+            position = len(chunks[i]) if i >= 0 else 0
@@ -0,0 +1,390 @@
+'''
+Versioned dictionaries, for point in time snapshots of in-memory graphs.
+
+A DictionaryBackend(snapshots=True) keeps its stores in VersionedDicts.
+They are dictionaries, read at full speed, but while a snapshot is open a
+write first saves the value it replaces in a per-key history, tagged with
+the epoch it was written in.  A snapshot reads each key as it was in its
+epoch: the current value if it was written before the snapshot, or else the
+newest older version in the history.  Taking a snapshot is O(1), writers
+never wait for readers (only, briefly, for snapshots being taken), and the
+history is dropped again as soon as no open snapshot can see it.
+'''
+import threading
+import weakref
+from bisect import bisect_left
+from collections.abc import Mapping
+
+
+MISSING = object()
+
+
+class Versions():
+    '''
+    The epoch clock shared by the versioned stores of a backend, and the
+    epochs of the open snapshots.
+
+    Writes are tagged with the current epoch.  A snapshot sees the writes
+    made in epochs up to its own, and taking one starts a new epoch.
+
+    Writes, taking snapshots and dropping versions all hold the lock, so a
+    write either happens before a snapshot or is recorded for it.  Closing
+    a snapshot never waits for the lock, as it may be garbage collected in
+    the middle of a write: the holder of the lock closes it instead.
+    '''
+
+    def __init__(self):
+        self.epoch = 0
+        #epoch -> number of open snapshots of that epoch
+        self.open = {}
+        #the stores with a history, by id
+        self.dirty = {}
+        #the epochs of the snapshots closed but not released yet
+        self.closing = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Open a snapshot of the current epoch.
+
+        Returns:
+            the epoch of the snapshot
+        '''
+        with self.lock:
+            epoch = self.epoch
+            self.open[epoch] = self.open.get(epoch, 0) + 1
+            self.epoch += 1
+        if self.closing:
+            self.collect()
+        return epoch
+
+    def release(self, epoch):
+        '''
+        Close a snapshot of epoch, and drop the versions no open snapshot can
+        see anymore.
+        '''
+        self.closing.append(epoch)
+        self.collect()
+
+    def collect(self):
+        '''
+        Release the closed snapshots, unless the lock is held, in which case
+        its holder calls this again once it lets go of it.
+        '''
+        while self.closing:
+            if not self.lock.acquire(blocking=False):
+                return
+            try:
+                while self.closing:
+                    self._release(self.closing.pop())
+            finally:
+                self.lock.release()
+
+    def _release(self, epoch):
+        count = self.open[epoch] - 1
+        if count:
+            self.open[epoch] = count
+            return
+        del self.open[epoch]
+        dirty = list(self.dirty.values())
+        if not self.open:
+            self.dirty = {}
+            for store in dirty:
+                store.written = store.history = None
+            return
+        epochs = sorted(self.open)
+        for store in dirty:
+            if not store._prune(epochs):
+                del self.dirty[id(store)]
+
+
+class VersionedDict(dict):
+    '''
+    A dictionary keeping the versions of its values that open snapshots of
+    its Versions can see.
+
+    Args:
+        versions: the shared Versions
+        nested (optional): Boolean value, True to turn dictionaries stored in
+        it into VersionedDicts too, e.g. the adjacency lists of the node_store
+    '''
+
+    __slots__ = ('versions', 'nested', 'written', 'history', '__weakref__')
+
+    def __init__(self, versions, contents=(), nested=False):
+        dict.__init__(self, contents)
+        self.versions = versions
+        self.nested = nested
+        #key -> epoch of the current value, for keys written while a
+        #snapshot was open.  Other keys were written before every open
+        #snapshot.
+        self.written = None
+        #key -> list of (epoch, value) of its older versions, oldest first
+        self.history = None
+
+    def _record(self, key):
+        '''
+        Save the current version of key before it is changed, if an open
+        snapshot can see it.  Called with the lock of the Versions held.
+        '''
+        versions = self.versions
+        if self.written is None:
+            #the history must exist before the new value can be seen
+            self.history = {}
+            self.written = {}
+            versions.dirty[id(self)] = self
+        epoch = versions.epoch
+        written = self.written.get(key, 0)
+        if written == epoch:
+            #no snapshot saw the current value
+            return
+        value = dict.get(self, key, MISSING)
+        #appending doesn't disturb a reader walking the list backwards
+        if value is not MISSING:
+            self.history.setdefault(key, []).append((written, value))
+        else:
+            older = self.history.get(key)
+            if older is not None:
+                older.append((written, value))
+        self.written[key] = epoch
+
+    def _wrap(self, value):
+        if self.nested and type(value) is dict:
+            return VersionedDict(self.versions, value)
+        return value
+
+    def __setitem__(self, key, value):
+        value = self._wrap(value)
+        versions = self.versions
+        with versions.lock:
+            if versions.open:
+                self._record(key)
+            dict.__setitem__(self, key, value)
+        if versions.closing:
+            versions.collect()
+
+    def __delitem__(self, key):
+        versions = self.versions
+        with versions.lock:
+            if versions.open and key in self:
+                self._record(key)
+            dict.__delitem__(self, key)
+        if versions.closing:
+            versions.collect()
+
+    def pop(self, key, *default):
+        versions = self.versions
+        with versions.lock:
+            if versions.open and key in self:
+                self._record(key)
+            value = dict.pop(self, key, *default)
+        if versions.closing:
+            versions.collect()
+        return value
+
+    def popitem(self):
+        key = next(reversed(self.keys()))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        versions = self.versions
+        with versions.lock:
+            if versions.open:
+                for key in list(self.keys()):
+                    self._record(key)
+            dict.clear(self)
+        if versions.closing:
+            versions.collect()
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def version(self, key, epoch):
+        '''
+        Returns:
+            the value of key as of epoch, or MISSING if it had none
+        '''
+        #the current value is read before its epoch, so a concurrent write
+        #is either seen as newer than epoch, or not seen at all
+        value = dict.get(self, key, MISSING)
+        written = self.written
+        if written is None or written.get(key, 0) <= epoch:
+            return value
+        for version, old in reversed(self.history.get(key, ())):
+            if version <= epoch:
+                return old
+        return MISSING
+
+    def version_keys(self, epoch):
+        '''
+        Returns:
+            a list of the keys that had a value as of epoch
+        '''
+        keys = list(self)
+        history = self.history
+        if history is not None:
+            current = set(keys)
+            keys.extend(key for key in list(history) if key not in current)
+        return [key for key in keys if self.version(key, epoch) is not MISSING]
+
+    def _prune(self, epochs):
+        '''
+        Drop the versions none of the snapshots of epochs (sorted) can see.
+
+        Returns:
+            True if some history is left
+        '''
+        written = self.written
+        if written is None:
+            return False
+        history = self.history
+        oldest = epochs[0]
+        for key, epoch in list(written.items()):
+            if epoch <= oldest:
+                #every open snapshot sees the current value
+                history.pop(key, None)
+                del written[key]
+                continue
+            versions = history.get(key)
+            if not versions:
+                continue
+            kept = []
+            for i, (version, value) in enumerate(versions):
+                following = versions[i + 1][0] if i + 1 < len(versions) else epoch
+                position = bisect_left(epochs, version)
+                if position < len(epochs) and epochs[position] < following:
+                    kept.append((version, value))
+            if kept:
+                history[key] = kept
+            else:
+                del history[key]
+        if not written:
+            self.written = self.history = None
+            return False
+        return True
+
+
+class VersionedSet(VersionedDict):
+    '''
+    A VersionedDict of keys to True, used as a set with the append method
+    of the direction_store.
+    '''
+
+    __slots__ = ()
+
+    def add(self, key):
+        self[key] = True
+
+    append = add
+
+    def remove(self, key):
+        del self[key]
+
+    def discard(self, key):
+        self.pop(key, None)
+
+
+class Snapshot():
+    '''
+    The stores of a backend as of the epoch the snapshot was taken in.
+
+    Args:
+        backend: a DictionaryBackend with snapshots enabled
+    '''
+
+    def __init__(self, backend):
+        versions = backend.versions
+        self.epoch = versions.acquire()
+        self.backend = backend
+        self.node_store = StoreVersion(backend.node_store, self.epoch)
+        self.attribute_store = StoreVersion(backend.attribute_store, self.epoch)
+        self.edge_store = StoreVersion(backend.edge_store, self.epoch)
+        self.weight_store = StoreVersion(backend.weight_store, self.epoch)
+        self.direction_store = SetVersion(backend.direction_store, self.epoch)
+        self.pair_store = StoreVersion(backend.pair_store, self.epoch)
+        #released when closed, or when the snapshot is garbage collected
+        self._release = weakref.finalize(self, versions.release, self.epoch)
+
+    def close(self):
+        '''
+        Release the versions kept for the snapshot.  It must not be read
+        afterwards.
+        '''
+        self._release()
+
+    @property
+    def closed(self):
+        return not self._release.alive
+
+
+class StoreVersion(Mapping):
+    '''
+    A read-only mapping of a VersionedDict as of an epoch.
+    '''
+
+    __slots__ = ('store', 'epoch')
+
+    def __init__(self, store, epoch):
+        self.store = store
+        self.epoch = epoch
+
+    def _value(self, value):
+        if isinstance(value, VersionedDict):
+            return StoreVersion(value, self.epoch)
+        return value
+
+    def __getitem__(self, key):
+        value = self.store.version(key, self.epoch)
+        if value is MISSING:
+            raise KeyError(key)
+        return self._value(value)
+
+    def __contains__(self, key):
+        return self.store.version(key, self.epoch) is not MISSING
+
+    def get(self, key, default=None):
+        value = self.store.version(key, self.epoch)
+        if value is MISSING:
+            return default
+        return self._value(value)
+
+    def keys(self):
+        return self.store.version_keys(self.epoch)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class SetVersion(StoreVersion):
+    '''
+    A read-only set of a VersionedSet as of an epoch.
+    '''
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return iter(self.keys())
@@ -0,0 +1,217 @@
+import heapq
+import itertools
+
+
+class ShardedBackend():
+    '''
+    A backend that partitions the graph across several other backends.
+
+    Every element is assigned to a shard by hashing its UUID, so the
+    adjacency list of a node lives in the node's shard, and an edge's record
+    lives in the edge's shard.  An edge connecting nodes in different shards
+    is therefore recorded on both sides: each endpoint's shard holds its own
+    adjacency entry for the edge.
+
+    Args:
+        backends: a list of backend objects (for example several
+        ZODBBTreeBackends, each on its own database, or several
+        DictionaryBackends) to use as shards.
+
+    Note:
+        When the shards are ZODB backends opened in the same thread, they all
+        join the same transaction, so a single commit is a two-phase commit
+        across every database involved.
+    '''
+
+    def __init__(self, backends):
+        '''
+        We store our data in the stores of the shard backends
+        '''
+        if not backends:
+            raise ValueError('ShardedBackend needs at least one backend')
+
+        self.backends = list(backends)
+        self.persistent = any(getattr(b, 'persistent', False) for b in self.backends)
+
+        self.node_store = ShardedStore(b.node_store for b in self.backends)
+        self.attribute_store = ShardedStore(b.attribute_store for b in self.backends)
+        self.edge_store = ShardedStore(b.edge_store for b in self.backends)
+        self.weight_store = ShardedStore(b.weight_store for b in self.backends)
+        self.direction_store = ShardedDirectionStore(b.direction_store for b in self.backends)
+        self.pair_store = ShardedStore(b.pair_store for b in self.backends)
+        self.incoming_store = ShardedStore(b.incoming_store for b in self.backends)
+        self.component_store = ShardedStore(b.component_store for b in self.backends)
+        self.node_weight_index = ShardedWeightIndex(b.node_weight_index for b in self.backends)
+        self.edge_weight_index = ShardedWeightIndex(b.edge_weight_index for b in self.backends)
+        #the counters aren't keyed by elements, so the first shard keeps them
+        self.counter_store = self.backends[0].counter_store
+        #elements are pickled with the graph_id of the first shard, see
+        #Element.__reduce__
+        self.graph_id = getattr(self.backends[0], 'graph_id', None)
+
+    def shard_of(self, element):
+        '''
+        Returns:
+            the backend that holds element
+        '''
+        return self.backends[shard_index(element, len(self.backends))]
+
+    def scan_adjacency(self):
+        '''
+        Returns:
+            an iterator of (node, adjacency) pairs over the whole node_store,
+            scanning one shard after the other
+        '''
+        return itertools.chain.from_iterable(b.scan_adjacency() for b in self.backends)
+
+    def close(self):
+        '''
+        Close every shard that can be closed.
+        '''
+        for backend in self.backends:
+            if hasattr(backend, 'close'):
+                backend.close()
+
+    def commit(self):
+        '''
+        Commits the transaction on every shard.
+
+        ZODB shards share the thread's transaction manager, so the first
+        commit already commits all of them in two phases and the following
+        ones find nothing left to do.
+        '''
+        for backend in self.backends:
+            backend.commit()
+
+    def abort(self):
+        '''Aborts the transaction on every shard'''
+        for backend in self.backends:
+            backend.abort()
+
+
+def shard_index(key, num_shards):
+    '''
+    Returns:
+        the index of the shard that key belongs to.  Elements are routed by
+        their UUID, so the result is stable across processes, and tuples of
+        elements (the keys of the pair_store) by their first element.
+    '''
+    if isinstance(key, tuple):
+        key = key[0]
+    return key.id.int % num_shards
+
+
+class ShardedStore():
+    '''
+    A mapping spread over several underlying mappings, one per shard.
+    '''
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+
+    def shard(self, key):
+        return self.shards[shard_index(key, len(self.shards))]
+
+    def __getitem__(self, key):
+        return self.shard(key)[key]
+
+    def __setitem__(self, key, value):
+        self.shard(key)[key] = value
+
+    def __delitem__(self, key):
+        del self.shard(key)[key]
+
+    def __contains__(self, key):
+        return key in self.shard(key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def get(self, key, default=None):
+        return self.shard(key).get(key, default)
+
+    def pop(self, key, *default):
+        return self.shard(key).pop(key, *default)
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def keys(self):
+        return itertools.chain.from_iterable(s.keys() for s in self.shards)
+
+    def values(self):
+        return itertools.chain.from_iterable(s.values() for s in self.shards)
+
+    def items(self):
+        return itertools.chain.from_iterable(s.items() for s in self.shards)
+
+
+class ShardedDirectionStore():
+    '''
+    The direction store of a sharded graph, holding each directed edge in
+    the shard of the edge.
+    '''
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+
+    def shard(self, edge):
+        return self.shards[shard_index(edge, len(self.shards))]
+
+    def append(self, edge):
+        self.shard(edge).append(edge)
+
+    def remove(self, edge):
+        self.shard(edge).remove(edge)
+
+    def __contains__(self, edge):
+        return edge in self.shard(edge)
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.shards)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+
+class ShardedWeightIndex():
+    '''
+    The weight index of a sharded graph, holding each (weight, element) pair
+    in the shard of the element.  Ranges are merged from every shard.
+    '''
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+
+    def shard(self, key):
+        return self.shards[shard_index(key[1], len(self.shards))]
+
+    def add(self, key):
+        self.shard(key).add(key)
+
+    def remove(self, key):
+        self.shard(key).remove(key)
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def __contains__(self, key):
+        return key in self.shard(key)
+
+    def __iter__(self):
+        return self.ascending()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def ascending(self, lo=None, hi=None):
+        return heapq.merge(*(shard.ascending(lo, hi) for shard in self.shards))
+
+    def descending(self, lo=None, hi=None):
+        return heapq.merge(*(shard.descending(lo, hi) for shard in self.shards),
+                           reverse=True)
@@ -1,27 +1,115 @@
+import uuid
+
 from BTrees import OOBTree
+from persistent.mapping import PersistentMapping
 import transaction
 
 
+def open_url(url):
+    '''
+    Open a ZODB database for a 'zodb:///path/to/data.fs' URL, on a
+    FileStorage at the path, or in memory for 'zodb://'.
+
+    Returns:
+        a ZODBBTreeBackend on the root of the database, whose close()
+        closes the database
+    '''
+    from ZODB import DB
+    from ZODB.FileStorage import FileStorage
+
+    path = url.partition('://')[2]
+    storage = FileStorage(path) if path else None
+    connection = DB(storage).open()
+    backend = ZODBBTreeBackend(connection.root)
+    #close() closes the database too
+    backend._owns_db = True
+    return backend
+
+
 class ZODBBTreeBackend():
     '''
     A ZODB backed graph object.
     '''
 
+    #the stores are saved in the database, see Graph.set_attribute_schema()
+    persistent = True
+
     def __init__(self, root):
         '''
         We store our data in a ZODB database, using BTrees
         '''
-        root.node_store = OOBTree.BTree()
-        root.attribute_store = OOBTree.BTree()
-        root.edge_store = OOBTree.BTree()
-        root.weight_store = OOBTree.BTree()
-        root.direction_store = TreeSet()
+        #stores already in the database are kept, so a graph can be reopened
+        for name, store_type in (('node_store', NodeStore),
+                                 ('attribute_store', AttributeStore),
+                                 ('edge_store', OOBTree.BTree),
+                                 ('weight_store', OOBTree.BTree),
+                                 ('direction_store', TreeSet),
+                                 ('pair_store', OOBTree.BTree),
+                                 ('component_store', OOBTree.BTree),
+                                 ('node_weight_index', WeightIndex),
+                                 ('edge_weight_index', WeightIndex),
+                                 ('counter_store', OOBTree.BTree)):
+            if getattr(root, name, None) is None:
+                setattr(root, name, store_type())
+        if getattr(root, 'incoming_store', None) is None:
+            root.incoming_store = NodeStore()
+            #index the directed edges of databases written before it existed
+            for edge in root.direction_store:
+                node1, node2 = root.edge_store[edge]
+                incoming = root.incoming_store.get(node2)
+                if incoming is None:
+                    root.incoming_store[node2] = {edge: node1}
+                else:
+                    incoming[edge] = node1
+
+        #names the database in the pickles of elements, see
+        #Element.__reduce__
+        if getattr(root, 'graph_id', None) is None:
+            root.graph_id = uuid.uuid4().hex
+        self.graph_id = root.graph_id
 
+        #RootConvenience objects (connection.root) wrap the root mapping
+        self.connection = root.__dict__.get('_root', root)._p_jar
+        #set by open_url(), whose database is closed with the backend
+        self._owns_db = False
         self.node_store = root.node_store
         self.attribute_store = root.attribute_store
         self.edge_store = root.edge_store
         self.weight_store = root.weight_store
         self.direction_store = root.direction_store
+        self.pair_store = root.pair_store
+        self.incoming_store = root.incoming_store
+        self.component_store = root.component_store
+        self.counter_store = root.counter_store
+        self.node_weight_index = root.node_weight_index
+        self.edge_weight_index = root.edge_weight_index
+
+    def scan_adjacency(self):
+        '''
+        Returns:
+            an iterator of (node, adjacency) pairs over the whole node_store
+
+        The node_store is read one bucket at a time, and each bucket is
+        turned back into a ghost once it has been read, so scanning a large
+        database doesn't pull all of it into the object cache.
+        '''
+        bucket = self.node_store._firstbucket
+        while bucket is not None:
+            for item in bucket.items():
+                yield item
+            following = bucket._next
+            bucket._p_deactivate()
+            bucket = following
+
+    def close(self):
+        '''
+        Close the connection, and the database if it was opened by
+        open_url().
+        '''
+        db = self.connection.db()
+        self.connection.close()
+        if self._owns_db:
+            db.close()
 
     def commit(self):
         '''Simply commits the transaction'''
@@ -32,6 +120,32 @@ class ZODBBTreeBackend():
         transaction.abort()
 
 
+class NodeStore(OOBTree.BTree):
+    '''
+    The node_store, turning the dictionaries the graph stores as adjacency
+    lists into BTrees, so that adding and removing edges is persisted.
+    '''
+
+    def __setitem__(self, key, value):
+        if type(value) is dict:
+            adjacency = OOBTree.BTree()
+            adjacency.update(value)
+            value = adjacency
+        super().__setitem__(key, value)
+
+
+class AttributeStore(OOBTree.BTree):
+    '''
+    The attribute_store, turning the dictionaries of attributes the graph
+    stores into PersistentMappings, so that updating them is persisted.
+    '''
+
+    def __setitem__(self, key, value):
+        if type(value) is dict:
+            value = PersistentMapping(value)
+        super().__setitem__(key, value)
+
+
 class TreeSet(OOBTree.TreeSet):
     '''
     The provided TreeSet does not support append, so I have added
@@ -40,3 +154,65 @@ class TreeSet(OOBTree.TreeSet):
 
     def append(self, key):
         self.add(key)
+
+
+class WeightIndex(OOBTree.TreeSet):
+    '''
+    The (weight, element) pairs of a graph, in a TreeSet so any range of
+    weights is found in O(log N).
+    '''
+
+    def ascending(self, lo=None, hi=None):
+        '''
+        Returns:
+            an iterator of the pairs with lo <= weight <= hi, lightest first
+        '''
+        keys = self.keys() if lo is None else self.keys(min=(lo,))
+        for key in keys:
+            if hi is not None and key[0] > hi:
+                return
+            yield key
+
+    def descending(self, lo=None, hi=None):
+        '''
+        Returns:
+            an iterator of the pairs with lo <= weight <= hi, heaviest first
+
+        TreeSets only iterate forwards, so each pair is found from the one
+        after it with maxKey(), the largest key up to a bound.
+        '''
+        if hi is not None:
+            #(hi,) sorts before every pair of weight hi, so those are
+            #read forwards first
+            for key in reversed(list(self.ascending(hi, hi))):
+                if lo is not None and key[0] < lo:
+                    return
+                yield key
+            bound = (hi,)
+        elif len(self):
+            key = self.maxKey()
+            yield key
+            bound = _below(key)
+        else:
+            return
+        while True:
+            try:
+                key = self.maxKey(bound)
+            except ValueError:
+                return
+            if lo is not None and key[0] < lo:
+                return
+            yield key
+            bound = _below(key)
+
+
+def _below(key):
+    '''
+    Returns:
+        the largest bound sorting strictly before the pair key, with the
+        element whose UUID is one less than the element of key
+    '''
+    weight, element = key
+    if not element.id.int:
+        return (weight,)
+    return (weight, element.__class__(element.graph, int=element.id.int - 1))
@@ -0,0 +1,578 @@
+"""
+Benchmarks for the core Graph operations on each backend.
+
+Run all the benchmarks on the default sizes with::
+
+    python benchmark.py
+
+Save the results to compare against after a change or an upgrade::
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json
+
+The comparison exits with status 1 if any benchmark got slower than the
+baseline by more than the tolerance (20% by default).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from db import Graph
+from backends import DictionaryBackend
+
+
+BENCHMARKS = OrderedDict()
+
+BACKENDS = OrderedDict()
+
+
+def benchmark(name):
+    """
+    Register a benchmark function under name.
+
+    The function is called as func(graph, size, rng) and must return a tuple
+    (seconds, operations) measured around the code being benchmarked only.
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def backend(name):
+    """
+    Register a generator function yielding a fresh backend object under name.
+
+    The generator is resumed once the benchmark is done with the backend, so
+    it can close the backend and remove any files it created.
+    """
+    def register(func):
+        BACKENDS[name] = contextmanager(func)
+        return func
+    return register
+
+
+@backend('memory')
+def memory_backend():
+    yield DictionaryBackend()
+
+
+@backend('zodb')
+def zodb_backend():
+    from ZODB import DB
+    from ZODB.FileStorage import FileStorage
+    from backends import ZODBBTreeBackend
+
+    #FileStorage adds .index, .lock and .tmp files next to the .fs file
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB(FileStorage(os.path.join(directory, 'graph.fs')))
+        backend = ZODBBTreeBackend(db.open().root)
+        try:
+            yield backend
+        finally:
+            backend.abort()
+            backend.close()
+            db.close()
+
+
+def timed(func, *args):
+    """
+    Returns:
+        a tuple (seconds, result) for calling func(*args)
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def generate_nodes(graph, size):
+    """
+    Add size nodes to graph, each with a small attribute dict.
+
+    Returns:
+        a list of the new nodes
+    """
+    return [graph.add_node({'index': i}) for i in range(size)]
+
+
+def generate_edge_list(nodes, rng, degree=4):
+    """
+    Generate a random edge list for nodes, with an average degree of degree.
+
+    Every node is linked to the next one, so the graph is connected and
+    traversals reach the whole graph.  The edge list has no self loops.
+
+    Returns:
+        a list of (node1, node2) tuples
+    """
+    edges = [(nodes[i], nodes[i + 1]) for i in range(len(nodes) - 1)]
+    for i in range(len(nodes) * (degree // 2 - 1)):
+        node1, node2 = rng.sample(nodes, 2)
+        edges.append((node1, node2))
+    return edges
+
+
+def generate_graph(graph, size, rng, degree=4):
+    """
+    Populate graph with size nodes and a random edge list between them.
+
+    Returns:
+        a list of the nodes
+    """
+    nodes = generate_nodes(graph, size)
+    graph.add_edges(generate_edge_list(nodes, rng, degree))
+    return nodes
+
+
+def generate_power_law_edge_list(nodes, rng, links=4, directed=0.5):
+    """
+    Generate a scale free edge list for nodes by preferential attachment
+    (the Barabasi-Albert model): each node links to links earlier nodes,
+    picked with a probability proportional to their degree, so the degrees
+    follow a power law with a few large hubs.
+
+    Args:
+        directed: the fraction of the edges that are directed
+
+    Returns:
+        a list of (node1, node2, attributes, directed) tuples
+    """
+    edges = []
+    #every node appears once per edge end, so picking from it is picking by degree
+    ends = list(nodes[:links])
+    for node in nodes[links:]:
+        targets = set()
+        while len(targets) < links:
+            targets.add(rng.choice(ends))
+        for target in targets:
+            edges.append((node, target, None, rng.random() < directed))
+            ends.append(target)
+            ends.append(node)
+    return edges
+
+
+@benchmark('add_node')
+def bench_add_node(graph, size, rng):
+    seconds, nodes = timed(generate_nodes, graph, size)
+    return seconds, size
+
+
+@benchmark('add_nodes')
+def bench_add_nodes(graph, size, rng):
+    seconds, nodes = timed(graph.add_nodes, size, {'index': 0})
+    return seconds, size
+
+
+@benchmark('add_edge')
+def bench_add_edge(graph, size, rng):
+    nodes = generate_nodes(graph, size)
+    edge_list = generate_edge_list(nodes, rng)
+
+    def add():
+        for node1, node2 in edge_list:
+            graph.add_edge(node1, node2)
+
+    seconds, result = timed(add)
+    return seconds, len(edge_list)
+
+
+@benchmark('add_edges')
+def bench_add_edges(graph, size, rng):
+    nodes = generate_nodes(graph, size)
+    edge_list = generate_edge_list(nodes, rng)
+    seconds, edges = timed(graph.add_edges, edge_list)
+    return seconds, len(edge_list)
+
+
+@benchmark('del_node')
+def bench_del_node(graph, size, rng):
+    nodes = generate_graph(graph, size, rng)
+    victims = rng.sample(nodes, max(1, size // 10))
+
+    def delete():
+        for node in victims:
+            graph.del_node(node)
+
+    seconds, result = timed(delete)
+    return seconds, len(victims)
+
+
+@benchmark('del_nodes')
+def bench_del_nodes(graph, size, rng):
+    nodes = generate_graph(graph, size, rng)
+    victims = rng.sample(nodes, max(1, size // 10))
+    seconds, result = timed(graph.del_nodes, victims)
+    return seconds, len(victims)
+
+
+@benchmark('neighbors')
+def bench_neighbors(graph, size, rng):
+    nodes = generate_graph(graph, size, rng)
+
+    def iterate():
+        count = 0
+        for node in nodes:
+            for neighbor in node.neighbors:
+                count += 1
+        return count
+
+    seconds, count = timed(iterate)
+    return seconds, count
+
+
+@benchmark('frozen_neighbors')
+def bench_frozen_neighbors(graph, size, rng):
+    generate_graph(graph, size, rng)
+    nodes = list(graph.freeze().nodes)
+
+    def iterate():
+        count = 0
+        for node in nodes:
+            for neighbor in node.neighbors:
+                count += 1
+        return count
+
+    seconds, count = timed(iterate)
+    return seconds, count
+
+
+@benchmark('attributes')
+def bench_attributes(graph, size, rng):
+    nodes = generate_nodes(graph, size)
+
+    def get_set():
+        for node in nodes:
+            node['visited'] = node['index']
+
+    seconds, result = timed(get_set)
+    return seconds, 2 * size
+
+
+@benchmark('traversal')
+def bench_traversal(graph, size, rng):
+    nodes = generate_graph(graph, size, rng)
+    seeds = rng.sample(nodes, min(10, size))
+
+    def traverse(hops=3):
+        visited = set(seeds)
+        frontier = deque((seed, 0) for seed in seeds)
+        while frontier:
+            node, depth = frontier.popleft()
+            if depth == hops:
+                continue
+            for neighbor in node.neighbors:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    frontier.append((neighbor, depth + 1))
+        return len(visited)
+
+    seconds, count = timed(traverse)
+    return seconds, count
+
+
+@benchmark('khop')
+def bench_khop(graph, size, rng):
+    nodes = generate_graph(graph, size, rng)
+    seeds = rng.sample(nodes, min(10, size))
+
+    def traverse(hops=3):
+        return sum(len(level) for depth, level in graph.khop(seeds, hops))
+
+    seconds, count = timed(traverse)
+    return seconds, count
+
+
+@benchmark('top_k')
+def bench_top_k(graph, size, rng):
+    from weighted_graph import WeightedGraph
+
+    nodes = generate_nodes(graph, size)
+    graph = WeightedGraph(graph.backend)
+    for node1, node2 in generate_edge_list(nodes, rng):
+        graph.add_edge(node1, node2, weight=rng.randrange(size))
+
+    def query(times=100):
+        for i in range(times):
+            graph.top_k_edges(100)
+            graph.top_k_edges(100, lightest=True)
+        return times * 2
+
+    seconds, count = timed(query)
+    return seconds, count
+
+
+@benchmark('snapshot_writes')
+def bench_snapshot_writes(graph, size, rng):
+    """
+    Time adding edges while a snapshot of the graph is open.  Runs on a
+    DictionaryBackend(snapshots=True) whatever the backend.
+    """
+    graph = Graph(DictionaryBackend(snapshots=True))
+    nodes = generate_graph(graph, size, rng)
+    edge_list = generate_edge_list(nodes, rng)
+    snapshot = graph.snapshot()
+
+    def add():
+        for node1, node2 in edge_list:
+            graph.add_edge(node1, node2)
+
+    seconds, result = timed(add)
+    snapshot.close()
+    return seconds, len(edge_list)
+
+
+@benchmark('cached_aggregate')
+def bench_cached_aggregate(graph, size, rng):
+    """
+    Time repeating a neighbor aggregation for single nodes through the query
+    cache, while other nodes' attributes change.
+    """
+    nodes = generate_graph(graph, size, rng)
+    cache = graph.enable_query_cache()
+    queried = rng.sample(nodes, min(100, len(nodes)))
+    scopes = {node: cache.neighborhood([node]) for node in queried}
+    others = [node for node in nodes if not any(node in scope for scope in scopes.values())]
+
+    def query(rounds=20):
+        for i in range(rounds):
+            graph[rng.choice(others)] = {'round': i}
+            for node in queried:
+                graph.cached('aggregate_neighbors', 'count', nodes=[node],
+                             depends_on=scopes[node])
+        return rounds * len(queried)
+
+    seconds, count = timed(query)
+    return seconds, count
+
+
+def bench_walks(weighted, p=1, q=1):
+    """
+    Returns:
+        a benchmark sampling a walk of 20 nodes from every node of a power
+        law graph of size nodes, timing the tables and the walks
+    """
+    def bench(graph, size, rng):
+        nodes = generate_nodes(graph, size)
+        graph.add_edges(generate_power_law_edge_list(nodes, rng))
+        for edge in graph.edges:
+            edge.weight = rng.random()
+
+        def walk():
+            return graph.sampler(weighted).walks(20, p=p, q=q, seed=0)
+
+        seconds, walks = timed(walk)
+        return seconds, walks.size
+    return bench
+
+
+benchmark('walks')(bench_walks(False))
+benchmark('weighted_walks')(bench_walks(True))
+benchmark('node2vec_walks')(bench_walks(False, p=0.5, q=2))
+
+
+@benchmark('import')
+def bench_import_time(graph, size, rng):
+    """
+    Time importing db and opening an empty graph on the backend in a new
+    interpreter, less the startup time of the interpreter.  The backend is
+    opened by the URL scheme of its name, and size is ignored.
+    """
+    import subprocess
+
+    backend_name = graph.backend.__class__.__name__
+    scheme = 'zodb' if backend_name == 'ZODBBTreeBackend' else 'memory'
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def start(code):
+        started = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code], cwd=here)
+        return time.perf_counter() - started
+
+    baseline = min(start('pass') for i in range(3))
+    seconds = min(start("from db import Graph; Graph.open('%s://')" % scheme)
+                  for i in range(3))
+    return max(seconds - baseline, 0.0), 1
+
+
+def bench_triangles(method):
+    """
+    Returns:
+        a benchmark counting the triangles of a power law graph of size
+        nodes with method
+    """
+    def bench(graph, size, rng):
+        from triangles import TriangleCounter
+
+        nodes = generate_nodes(graph, size)
+        edge_list = generate_power_law_edge_list(nodes, rng)
+        graph.add_edges(edge_list)
+        seconds, count = timed(lambda: TriangleCounter(graph, method).node_triangles())
+        return seconds, len(edge_list)
+    return bench
+
+
+for method in ('sets', 'sparse'):
+    benchmark('triangles_' + method)(bench_triangles(method))
+
+
+@benchmark('motifs')
+def bench_motifs(graph, size, rng):
+    nodes = generate_nodes(graph, size)
+    edge_list = generate_power_law_edge_list(nodes, rng)
+    graph.add_edges(edge_list)
+    seconds, census = timed(graph.motif_counts)
+    return seconds, len(edge_list)
+
+
+def bench_import(format):
+    """
+    Returns:
+        a benchmark importing an edge list file in format, with one edge
+        per line between size nodes
+    """
+    def bench(graph, size, rng):
+        with tempfile.NamedTemporaryFile('w', suffix='.' + format, delete=False) as f:
+            for i in range(size * 2):
+                source, target = rng.randrange(size), rng.randrange(size)
+                if format == 'jsonl':
+                    f.write(json.dumps({'source': source, 'target': target, 'weight': i}))
+                    f.write('\n')
+                else:
+                    f.write('%d%s%d%s%d\n' % (source, DELIMITERS[format], target,
+                                              DELIMITERS[format], i))
+        weight_field = 'weight' if format == 'jsonl' else 2
+        seconds, count = timed(lambda: graph.import_edges(f.name, format,
+                                                          weight_field=weight_field))
+        os.remove(f.name)
+        return seconds, count
+    return bench
+
+
+DELIMITERS = {'csv': ',', 'tsv': '\t'}
+
+for format in ('csv', 'tsv', 'jsonl'):
+    benchmark('import_' + format)(bench_import(format))
+
+
+def run(names, backends, sizes, repeat=1, seed=0):
+    """
+    Run the named benchmarks on each backend and size.
+
+    Every run gets a fresh graph and a random generator seeded with seed, so
+    repeated runs work on identical graphs.  The fastest of repeat runs is
+    kept.
+
+    Returns:
+        a list of result dictionaries
+    """
+    results = []
+    for size in sizes:
+        for backend_name in backends:
+            for name in names:
+                best = None
+                for i in range(repeat):
+                    with BACKENDS[backend_name]() as graph_backend:
+                        seconds, ops = BENCHMARKS[name](Graph(graph_backend), size,
+                                                        random.Random(seed))
+                    if best is None or seconds < best[0]:
+                        best = (seconds, ops)
+                result = OrderedDict([
+                    ('benchmark', name),
+                    ('backend', backend_name),
+                    ('size', size),
+                    ('seconds', best[0]),
+                    ('operations', best[1]),
+                    ('ops_per_second', best[1] / best[0] if best[0] else None),
+                ])
+                results.append(result)
+                print('%-12s %-8s %10d %12.6fs %14.1f ops/s' % (
+                    name, backend_name, size, best[0],
+                    result['ops_per_second'] or 0), file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against the results of a baseline run.
+
+    Returns:
+        a list of (result, baseline_seconds, ratio) tuples for every result
+        that got slower than the baseline by more than tolerance
+    """
+    previous = {}
+    for result in baseline['results']:
+        previous[(result['benchmark'], result['backend'], result['size'])] = result
+
+    regressions = []
+    for result in results:
+        key = (result['benchmark'], result['backend'], result['size'])
+        if key not in previous:
+            continue
+        old = previous[key]['seconds']
+        ratio = result['seconds'] / old if old else float('inf')
+        result['baseline_seconds'] = old
+        result['ratio'] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append((result, old, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS), metavar='NAME',
+                        help='benchmarks to run (default: all of %s)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS),
+                        default=list(BACKENDS), metavar='NAME',
+                        help='backends to run on (default: all of %s)' % ', '.join(BACKENDS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10 ** 3, 10 ** 4],
+                        help='graph sizes in nodes, e.g. --sizes 1000 10000000')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per benchmark, the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the synthetic graph generators')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown against the baseline (default 0.2)')
+    args = parser.parse_args(argv)
+
+    results = run(args.benchmarks, args.backends, args.sizes, args.repeat, args.seed)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    report = OrderedDict([
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('seed', args.seed),
+        ('repeat', args.repeat),
+        ('results', results),
+    ])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    for result, old, ratio in regressions:
+        print('REGRESSION %s on %s at size %d: %.6fs -> %.6fs (%.2fx)' % (
+            result['benchmark'], result['backend'], result['size'],
+            old, result['seconds'], ratio), file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
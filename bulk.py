@@ -0,0 +1,248 @@
+"""
+Streaming import and export of edge lists.
+
+Files are read and written one record at a time, so memory use doesn't
+depend on the size of the file.  Each line of an imported file is an edge
+between two nodes named by external keys (for example user names or ids
+from another system).  The keys are resolved to nodes through key_map, a
+mapping of key to node UUID string: pass a shelve or dbm object to keep it
+on disk for graphs with more nodes than fit in memory.
+"""
+import csv
+import json
+
+
+FORMATS = ('csv', 'tsv', 'jsonl')
+
+#the default number of edges per commit, and on a persistent backend, which
+#holds every object changed since the last commit in memory
+COMMIT_EVERY = 10000
+PERSISTENT_COMMIT_EVERY = 1000
+
+
+def _open(path_or_file, mode):
+    '''
+    Returns:
+        a tuple of the open file and whether we opened it (and must close it)
+    '''
+    if hasattr(path_or_file, 'read' if mode == 'r' else 'write'):
+        return path_or_file, False
+    return open(path_or_file, mode, newline='', encoding='utf-8'), True
+
+
+def _number(value):
+    '''
+    Convert a weight read from a file to an int, or a float if it has to be.
+    An empty csv or tsv column, as written for a weight of None, is None.
+    '''
+    if isinstance(value, (int, float)) or value is None:
+        return value
+    if value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _flag(value):
+    '''
+    Convert a directed flag read from a file to a Boolean.
+    '''
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def _records(f, format, header, delimiter):
+    '''
+    Returns:
+        an iterator of records read from f: lists for csv and tsv files
+        without a header, dictionaries otherwise
+    '''
+    if format == 'jsonl':
+        return (json.loads(line) for line in f if line.strip())
+    if delimiter is None:
+        delimiter = '\t' if format == 'tsv' else ','
+    if header:
+        return csv.DictReader(f, delimiter=delimiter)
+    return csv.reader(f, delimiter=delimiter)
+
+
+class NodeResolver():
+    '''
+    Resolves external node keys to the nodes of a graph, adding a node the
+    first time a key is seen.
+
+    Args:
+        graph: the graph
+        key_map: a mapping of key (as a string) to node UUID string
+        key_attribute: the node attribute to store the key in, or None
+    '''
+
+    def __init__(self, graph, key_map, key_attribute):
+        self.graph = graph
+        self.key_map = key_map
+        self.key_attribute = key_attribute
+
+    def __call__(self, key):
+        key = str(key)
+        graph = self.graph
+        node_id = self.key_map.get(key)
+        if node_id is not None:
+            return graph.node_type(graph, hex=node_id)
+        attributes = {self.key_attribute: key} if self.key_attribute else {}
+        node = graph._add_node(attributes, 0)
+        self.key_map[key] = str(node)
+        return node
+
+
+def import_edges(graph, source, format='csv', source_field=0, target_field=1,
+                 weight_field=None, attribute_fields=(), attributes_field=None,
+                 directed=False, directed_field=None, key_map=None, key_attribute='key', header=False,
+                 delimiter=None, commit_every=None):
+    '''
+    Stream an edge list from a file into graph.
+
+    Args:
+        graph: the graph to add the edges (and any new nodes) to
+        source: a path or an open file
+        format (optional): 'csv', 'tsv' or 'jsonl' (one JSON object per line)
+        source_field (optional): the column number (or, with a header or for
+        jsonl, the field name) of the key of the first node of each edge.
+        Defaults to the first column, or the 'source' field.
+        target_field (optional): the same for the second node, defaulting
+        to the second column, or the 'target' field
+        weight_field (optional): the column or field holding the edge weight
+        attribute_fields (optional): the columns or fields to copy into the
+        edge attributes, under their field name (or column number)
+        attributes_field (optional): the jsonl field holding a dictionary of
+        edge attributes, like the 'attributes' written by export_edges()
+        directed (optional): Boolean value, True to add directed edges
+        directed_field (optional): the column or field telling whether each
+        edge is directed ('1', 'true' or 'yes'), instead of directed
+        key_map (optional): the mapping of node key to node UUID string,
+        shared between imports to connect to nodes imported before.  It is
+        filled with the keys of the new nodes.  Defaults to a new dict.
+        key_attribute (optional): the node attribute to store the key of new
+        nodes in, or None not to store it
+        header (optional): Boolean value, True if the first line of a csv or
+        tsv file names the columns
+        delimiter (optional): the column separator, ',' for csv and a tab
+        for tsv by default
+        commit_every (optional): commit after this many edges, by default
+        COMMIT_EVERY, or PERSISTENT_COMMIT_EVERY if the backend is
+        persistent.  A persistent backend keeps everything changed since
+        the last commit in memory, and edges between nodes with random
+        UUIDs change objects all over the database, so there the memory used
+        grows with commit_every (and with the graph, up to that bound).
+
+    Returns:
+        the number of edges imported
+    '''
+    if format not in FORMATS:
+        raise ValueError('unsupported format %r, use one of %s' % (format, ', '.join(FORMATS)))
+    if key_map is None:
+        key_map = {}
+    if commit_every is None:
+        persistent = getattr(graph.backend, 'persistent', False)
+        commit_every = PERSISTENT_COMMIT_EVERY if persistent else COMMIT_EVERY
+    if (format == 'jsonl' or header) and source_field == 0 and target_field == 1:
+        source_field, target_field = 'source', 'target'
+
+    resolve = NodeResolver(graph, key_map, key_attribute)
+    add_edge = graph._add_edge
+    count = 0
+    f, close = _open(source, 'r')
+    try:
+        for record in _records(f, format, header, delimiter):
+            attributes = {}
+            if attributes_field is not None:
+                attributes.update(record[attributes_field] or {})
+            for field in attribute_fields:
+                attributes[field] = record[field]
+            weight = _number(record[weight_field]) if weight_field is not None else 0
+            if directed_field is not None:
+                directed = _flag(record[directed_field])
+            add_edge(resolve(record[source_field]), resolve(record[target_field]),
+                     attributes, directed, weight)
+            count += 1
+            if count % commit_every == 0:
+                graph.commit()
+    finally:
+        if close:
+            f.close()
+    graph.commit()
+    return count
+
+
+def export_edges(graph, destination, format='csv', key_attribute='key',
+                 header=True, delimiter=None):
+    '''
+    Stream the edges of graph to a file.
+
+    csv and tsv files get the columns source, target, directed and weight.
+    jsonl files get one object per edge, with the same fields and the edge's
+    attributes under 'attributes'.  Both can be read back with
+    import_edges(..., header=True, weight_field='weight',
+    directed_field='directed'), adding attributes_field='attributes' for
+    jsonl to restore the attributes.  Attribute values that aren't JSON types
+    are written as strings.
+
+    Args:
+        graph: the graph to export
+        destination: a path or an open file
+        format (optional): 'csv', 'tsv' or 'jsonl'
+        key_attribute (optional): the node attribute to name nodes by, as set
+        by import_edges().  Nodes without it are named by their UUID.
+        header (optional): Boolean value, False to leave out the header line
+        of csv and tsv files
+        delimiter (optional): the column separator, ',' for csv and a tab
+        for tsv by default
+
+    Returns:
+        the number of edges exported
+    '''
+    if format not in FORMATS:
+        raise ValueError('unsupported format %r, use one of %s' % (format, ', '.join(FORMATS)))
+
+    attribute_store = graph.attribute_store
+    weight_store = graph.weight_store
+    direction_store = graph.direction_store
+
+    def name(node):
+        if key_attribute is not None:
+            key = attribute_store[node].get(key_attribute)
+            if key is not None:
+                return key
+        return str(node)
+
+    count = 0
+    f, close = _open(destination, 'w')
+    try:
+        if format == 'jsonl':
+            for edge, (node1, node2) in graph.edge_store.items():
+                f.write(json.dumps({
+                    'source': name(node1),
+                    'target': name(node2),
+                    'directed': edge in direction_store,
+                    'weight': weight_store.get(edge),
+                    'attributes': dict(attribute_store[edge]),
+                }, default=str))
+                f.write('\n')
+                count += 1
+        else:
+            if delimiter is None:
+                delimiter = '\t' if format == 'tsv' else ','
+            writer = csv.writer(f, delimiter=delimiter)
+            if header:
+                writer.writerow(('source', 'target', 'directed', 'weight'))
+            for edge, (node1, node2) in graph.edge_store.items():
+                writer.writerow((name(node1), name(node2),
+                                 int(edge in direction_store),
+                                 weight_store.get(edge)))
+                count += 1
+    finally:
+        if close:
+            f.close()
+    return count
@@ -0,0 +1,276 @@
+"""
+A cache of query results, invalidated by the changes to the graph, see
+Graph.enable_query_cache().
+"""
+import threading
+import time
+import types
+from collections import OrderedDict
+
+from db import Edge, GraphListener
+
+
+class Entry():
+    '''
+    A cached result.
+
+    Args:
+        result: the result of the query
+        version: the graph-wide version it was computed at, or None if it
+        only depends on nodes
+        nodes: the nodes it depends on, or None if it depends on the whole
+        graph
+        expires: the time.monotonic() after which it is stale, or None
+    '''
+
+    __slots__ = ('result', 'version', 'nodes', 'expires')
+
+    def __init__(self, result, version, nodes, expires):
+        self.result = result
+        self.version = version
+        self.nodes = nodes
+        self.expires = expires
+
+
+class _Pending():
+    '''
+    Stands for the key of a result being computed, in the watched sets.
+    '''
+
+
+class QueryCache(GraphListener):
+    '''
+    Memoizes query results, keyed by query and arguments.
+
+    A result depends either on the whole graph, or on a set of nodes.  The
+    graph-wide version counts every change to the graph, so a result
+    depending on the whole graph is stale once it has moved on.  Each node
+    a cached result depends on also has a version, counting the changes to
+    the node: it being added or deleted, its attributes or weight being set,
+    an edge to or from it being added or deleted, or the attributes or
+    weight of such an edge being set.  Changing a node drops the results
+    depending on it straight away.
+
+    The least recently used results are evicted beyond maxsize, and
+    results older than ttl seconds are recomputed.
+
+    Args:
+        graph: the graph
+        maxsize (optional): the most results to keep
+        ttl (optional): the most seconds to keep a result, by default
+        results are kept until they are invalidated or evicted
+    '''
+
+    def __init__(self, graph, maxsize=1024, ttl=None):
+        self.graph = graph
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.entries = OrderedDict()
+        #node -> [version, set of the keys of the results depending on it]
+        self.watched = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.RLock()
+
+    def get(self, query, *args, depends_on=None, **kwargs):
+        '''
+        Get the result of a query from the cache, or compute and cache it.
+
+        Args:
+            query: the name of a Graph method, or a callable taking the graph
+            and the arguments
+            *args, **kwargs: the arguments of the query.  Lists, sets and
+            dictionaries are compared by value.
+            depends_on (optional): an iterable of the nodes the result
+            depends on: it may only read their adjacency lists, attributes
+            and weights, and those of their edges.  By default the result
+            depends on the whole graph.  See neighborhood().
+
+        Returns:
+            the result, shared with later callers, so it must not be
+            modified.  Generators are stored as lists.
+        '''
+        key = (query, _freeze(args), _freeze(kwargs))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry.expires is not None and time.monotonic() > entry.expires:
+                    self.expirations += 1
+                    self._drop(key)
+                elif entry.version is not None and entry.version != self.version:
+                    self.invalidations += 1
+                    self._drop(key)
+                else:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.result
+            self.misses += 1
+            version = self.version
+            nodes = None
+            if depends_on is not None:
+                #watch the nodes while computing, to see changes made meanwhile
+                token = _Pending()
+                nodes = {}
+                for node in depends_on:
+                    watch = self.watched.setdefault(node, [0, set()])
+                    watch[1].add(token)
+                    nodes[node] = watch[0]
+
+        try:
+            if isinstance(query, str):
+                result = getattr(self.graph, query)(*args, **kwargs)
+            else:
+                result = query(self.graph, *args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                result = list(result)
+        except BaseException:
+            if nodes is not None:
+                with self.lock:
+                    self._unwatch_all(nodes, token)
+            raise
+
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            if nodes is None:
+                if version == self.version:
+                    self._store(key, Entry(result, version, None, expires))
+            else:
+                if all(self.watched[node][0] == seen for node, seen in nodes.items()):
+                    self._store(key, Entry(result, None, tuple(nodes), expires))
+                self._unwatch_all(nodes, token)
+        return result
+
+    def neighborhood(self, nodes, hops=1):
+        '''
+        Returns:
+            a set of nodes and their neighbors up to hops hops away, e.g. as
+            depends_on for a query reading the attributes of the neighbors
+            of nodes
+        '''
+        found = set()
+        for depth, level in self.graph.khop(nodes, hops):
+            found.update(level)
+        return found
+
+    def _store(self, key, entry):
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = entry
+        if entry.nodes is not None:
+            for node in entry.nodes:
+                self.watched.setdefault(node, [0, set()])[1].add(key)
+        while len(self.entries) > self.maxsize:
+            self.evictions += 1
+            self._drop(next(iter(self.entries)))
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        if entry.nodes is not None:
+            self._unwatch_all(entry.nodes, key)
+
+    def _unwatch_all(self, nodes, key):
+        for node in nodes:
+            self._unwatch(node, key)
+
+    def _unwatch(self, node, key):
+        watch = self.watched.get(node)
+        if watch is not None:
+            watch[1].discard(key)
+            if not watch[1]:
+                del self.watched[node]
+
+    def clear(self):
+        '''
+        Drop every cached result.  The statistics are kept.
+        '''
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+            for node, watch in list(self.watched.items()):
+                #keep watching the nodes of the queries being computed
+                watch[0] += 1
+                watch[1] = {key for key in watch[1] if isinstance(key, _Pending)}
+                if not watch[1]:
+                    del self.watched[node]
+
+    def stats(self):
+        '''
+        Returns:
+            a dictionary of the number of hits, misses, invalidations (stale
+            results dropped), evictions (results dropped beyond maxsize),
+            expirations (results older than ttl), the cached results
+            ('size') and the hit rate, hits / (hits + misses)
+        '''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self.entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _changed(self, *nodes):
+        with self.lock:
+            self.version += 1
+            for node in nodes:
+                watch = self.watched.get(node)
+                if watch is None:
+                    continue
+                watch[0] += 1
+                for key in list(watch[1]):
+                    if key in self.entries:
+                        self.invalidations += 1
+                        self._drop(key)
+
+    def _element_changed(self, element):
+        if isinstance(element, Edge):
+            nodes = self.graph.edge_store.get(element)
+            if nodes is not None:
+                self._changed(*nodes)
+                return
+        self._changed(element)
+
+    def node_added(self, node):
+        self._changed(node)
+
+    def edge_added(self, edge, node1, node2, directed):
+        self._changed(node1, node2)
+
+    def node_deleted(self, node):
+        self._changed(node)
+
+    def edge_deleted(self, edge, node1, node2):
+        self._changed(node1, node2)
+
+    def attributes_updated(self, element, attributes):
+        self._element_changed(element)
+
+    def weight_changed(self, element, weight):
+        self._element_changed(element)
+
+    def aborted(self):
+        #the backend rolled back changes we may have cached results of
+        self.clear()
+
+
+def _freeze(value):
+    '''
+    Returns:
+        value with its lists, sets and dictionaries turned into tuples and
+        frozensets, so it can be used in a key
+    '''
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return dict, frozenset((key, _freeze(item)) for key, item in value.items())
+    return value
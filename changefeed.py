@@ -0,0 +1,144 @@
+"""
+A feed of the changes made to a graph, see Graph.subscribe().
+"""
+from collections import deque, namedtuple
+
+from db import GraphListener
+
+
+Event = namedtuple('Event', ['sequence', 'kind', 'element', 'data'])
+Event.__doc__ = '''
+A change to a graph.
+
+Attributes:
+    sequence: the number of the event, increasing with every event
+    kind: one of 'node_added', 'edge_added', 'node_deleted', 'edge_deleted',
+    'attributes_updated' or 'weight_changed'
+    element: the node or edge changed
+    data: for 'edge_added' and 'edge_deleted' a tuple of the edge's nodes,
+    for 'attributes_updated' a dictionary of the attributes set, for
+    'weight_changed' the new weight, None otherwise
+'''
+
+
+class ChangeFeed(GraphListener):
+    '''
+    Records the changes to a graph as Events, and delivers them to the
+    subscribers in a batch every time the graph commits.
+
+    Delivered events are kept in a ring buffer of capacity events, so a
+    subscriber can resume from a sequence number it has seen, as long as the
+    feed kept recording since: the graph only listens to the feed while it
+    has subscribers, and the changes made in between are unknown to it.
+
+    The last sequence number is saved in the counter_store, so the numbers
+    keep increasing when a persistent graph is reopened.
+
+    Args:
+        capacity (optional): how many delivered events to keep
+        counter_store (optional): the backend's counter_store
+    '''
+
+    def __init__(self, capacity=65536, counter_store=None):
+        self.buffer = deque(maxlen=capacity)
+        self.pending = []
+        self.counter_store = counter_store
+        self.sequence = 0
+        #the lowest sequence number events can be resumed from: the last
+        #event pushed out of the buffer, or the next one after changes the
+        #feed didn't record
+        self.evicted = 0
+        if counter_store is not None and counter_store.get('changefeed'):
+            self.sequence = counter_store['changefeed']
+            self.evicted = self.sequence + 1
+        self.subscribers = []
+
+    def _record(self, kind, element, data=None):
+        self.sequence += 1
+        if self.counter_store is not None:
+            self.counter_store['changefeed'] = self.sequence
+        self.pending.append(Event(self.sequence, kind, element, data))
+
+    def subscribe(self, callback, since=None):
+        '''
+        Add callback to the subscribers, first sending it the buffered events
+        after sequence number since if given.
+
+        Raises:
+            LookupError: if events after since are no longer in the buffer,
+            or weren't recorded because the feed had no subscribers
+            ValueError: if since is above the last sequence number
+        '''
+        if since is not None:
+            missed = self.events(since)
+            if missed:
+                callback(missed)
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+        if not self.subscribers:
+            #the graph stops notifying the feed, see Graph.unsubscribe()
+            self.buffer.clear()
+            self.pending = []
+            self.evicted = self.sequence + 1
+
+    def events(self, since=0):
+        '''
+        Returns:
+            a list of the delivered events with a sequence number above since
+
+        Raises:
+            LookupError: if some of those events are no longer in the buffer
+            ValueError: if since is above the last sequence number
+        '''
+        if since > self.sequence:
+            raise ValueError('no event after %d yet, the feed is at %d'
+                             % (since, self.sequence))
+        if since < self.evicted:
+            raise LookupError('events after %d are no longer buffered, or '
+                              'weren\'t recorded' % since)
+        if not self.buffer or self.buffer[-1].sequence <= since:
+            return []
+        #sequence numbers in the buffer are increasing but may have gaps
+        #left by aborted transactions, so find the start from the end
+        start = len(self.buffer)
+        while start > 0 and self.buffer[start - 1].sequence > since:
+            start -= 1
+        return [self.buffer[i] for i in range(start, len(self.buffer))]
+
+    def node_added(self, node):
+        self._record('node_added', node)
+
+    def edge_added(self, edge, node1, node2, directed):
+        self._record('edge_added', edge, (node1, node2))
+
+    def node_deleted(self, node):
+        self._record('node_deleted', node)
+
+    def edge_deleted(self, edge, node1, node2):
+        self._record('edge_deleted', edge, (node1, node2))
+
+    def attributes_updated(self, element, attributes):
+        self._record('attributes_updated', element, dict(attributes))
+
+    def weight_changed(self, element, weight):
+        self._record('weight_changed', element, weight)
+
+    def committed(self):
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = []
+        overflow = len(self.buffer) + len(batch) - self.buffer.maxlen
+        if overflow > 0:
+            if overflow <= len(self.buffer):
+                self.evicted = self.buffer[overflow - 1].sequence
+            else:
+                self.evicted = batch[overflow - len(self.buffer) - 1].sequence
+        self.buffer.extend(batch)
+        for callback in list(self.subscribers):
+            callback(batch)
+
+    def aborted(self):
+        self.pending = []
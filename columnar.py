@@ -0,0 +1,449 @@
+"""
+Column-wise storage for typed attributes.
+
+Graph.set_attribute_schema() replaces a graph's attribute_store with a
+ColumnarAttributeStore.  Attributes named in the schema are kept in numpy
+arrays indexed by a dense row number per element, with a mask marking which
+rows have a value, so they cost a few bytes per element and can be filtered
+and aggregated without a Python loop.  Any other attributes are kept in
+per-element dictionaries as before.
+
+This module requires numpy.
+
+Note:
+    The columns are held in memory, so persistent backends such as ZODB
+    don't support attribute schemas.
+"""
+import numbers
+import operator
+from collections.abc import MutableMapping
+
+import numpy
+
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class Column():
+    '''
+    A growable typed array with a null mask.
+
+    Values are stored without loss: a value of another type raises
+    TypeError rather than being converted.
+    '''
+
+    dtype = None
+    #the schema name of the column type, the types of the values it takes,
+    #and their description
+    name = None
+    types = ()
+    takes = None
+
+    def __init__(self, capacity=1024):
+        self.values = numpy.zeros(capacity, dtype=self.dtype)
+        self.mask = numpy.zeros(capacity, dtype=bool)
+
+    def reserve(self, rows):
+        '''
+        Make room for at least rows rows, doubling the capacity as needed.
+        '''
+        capacity = len(self.values)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        values = numpy.zeros(capacity, dtype=self.dtype)
+        values[:len(self.values)] = self.values
+        mask = numpy.zeros(capacity, dtype=bool)
+        mask[:len(self.mask)] = self.mask
+        self.values = values
+        self.mask = mask
+
+    def check(self, value):
+        '''
+        Raises:
+            TypeError: if the column doesn't take value
+        '''
+        #bools are ints too, but would be read back as 0 and 1
+        if not isinstance(value, self.types) or (isinstance(value, bool) and
+                                                  bool not in self.types):
+            raise TypeError('%r columns only take %s, not %r' % (self.name, self.takes, value))
+
+    def encode(self, value):
+        self.check(value)
+        return self.dtype(value)
+
+    def decode(self, value):
+        return value.item()
+
+    def get(self, row):
+        if not self.mask[row]:
+            raise KeyError(row)
+        return self.decode(self.values[row])
+
+    def set(self, row, value):
+        self.values[row] = self.encode(value)
+        self.mask[row] = True
+
+    def clear(self, row):
+        self.mask[row] = False
+
+    def compare(self, op, value, rows):
+        '''
+        Returns:
+            a boolean array of whether each of the first rows values
+            compares to value with op, one of OPERATORS
+        '''
+        return OPERATORS[op](self.values[:rows], value)
+
+
+class IntColumn(Column):
+    dtype = numpy.int64
+    name = 'int'
+    types = (numbers.Integral,)
+    takes = 'ints'
+
+
+class FloatColumn(Column):
+    '''
+    A column of floats.  Ints are taken too, and read back as floats.
+    '''
+    dtype = numpy.float64
+    name = 'float'
+    types = (numbers.Real,)
+    takes = 'ints and floats'
+
+
+class BoolColumn(Column):
+    dtype = numpy.bool_
+    name = 'bool'
+    types = (bool, numpy.bool_)
+    takes = 'bools'
+
+
+class CategoryColumn(Column):
+    '''
+    A column of strings drawn from a small set, stored as integer codes into
+    the list of categories.
+    '''
+    dtype = numpy.int32
+    name = 'category'
+    types = (str,)
+    takes = 'strings'
+
+    def __init__(self, capacity=1024):
+        super().__init__(capacity)
+        self.categories = []
+        self.codes = {}
+
+    def encode(self, value):
+        try:
+            return self.codes[value]
+        except KeyError:
+            pass
+        self.check(value)
+        code = self.codes[value] = len(self.categories)
+        self.categories.append(value)
+        return code
+
+    def decode(self, value):
+        return self.categories[value]
+
+    def compare(self, op, value, rows):
+        #the codes are in the order the categories were first stored, so
+        #the categories are compared, and the rows look their code up
+        compare = OPERATORS[op]
+        matches = numpy.zeros(max(len(self.categories), 1), dtype=bool)
+        for code, category in enumerate(self.categories):
+            matches[code] = compare(category, value)
+        return matches[self.values[:rows]]
+
+
+COLUMN_TYPES = {
+    int: IntColumn,
+    float: FloatColumn,
+    bool: BoolColumn,
+    str: CategoryColumn,
+    'int': IntColumn,
+    'float': FloatColumn,
+    'bool': BoolColumn,
+    'category': CategoryColumn,
+}
+
+
+class ColumnarAttributeStore():
+    '''
+    An attribute_store keeping the attributes named in schema in columns.
+
+    Args:
+        store: the mapping to keep the other attributes in, usually the
+        backend's attribute_store.  Elements without such attributes have
+        None as their value.
+        schema: a dictionary of attribute name to type, one of int, float,
+        bool or str (for categorical strings), or their names 'int',
+        'float', 'bool' and 'category'
+    '''
+
+    def __init__(self, store, schema):
+        self.store = store
+        self.columns = {}
+        self.rows = {}
+        self.elements = []
+        self.free_rows = []
+        for name, kind in schema.items():
+            try:
+                self.columns[name] = COLUMN_TYPES[kind]()
+            except KeyError:
+                raise ValueError('unsupported attribute type %r for %r' % (kind, name))
+
+    def _new_row(self, element):
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.elements[row] = element
+        else:
+            row = len(self.elements)
+            self.elements.append(element)
+            for column in self.columns.values():
+                column.reserve(row + 1)
+        self.rows[element] = row
+        return row
+
+    def __getitem__(self, element):
+        if element not in self.rows:
+            raise KeyError(element)
+        return ElementAttributes(self, element)
+
+    def get(self, element, default=None):
+        if element not in self.rows:
+            return default
+        return ElementAttributes(self, element)
+
+    def _check(self, attributes):
+        '''
+        Raises:
+            TypeError: if a column doesn't take its value in attributes
+        '''
+        for name, value in attributes.items():
+            column = self.columns.get(name)
+            if column is not None and value is not None:
+                column.check(value)
+
+    def __setitem__(self, element, attributes):
+        #the values are checked first, so a bad one changes nothing
+        self._check(attributes)
+        row = self.rows.get(element)
+        if row is None:
+            row = self._new_row(element)
+        else:
+            for column in self.columns.values():
+                column.clear(row)
+        self.store[element] = None
+        ElementAttributes(self, element).update(attributes)
+
+    def __delitem__(self, element):
+        row = self.rows.pop(element)
+        for column in self.columns.values():
+            column.clear(row)
+        self.elements[row] = None
+        self.free_rows.append(row)
+        del self.store[element]
+
+    def pop(self, element, *default):
+        if element not in self.rows:
+            if default:
+                return default[0]
+            raise KeyError(element)
+        attributes = dict(self[element])
+        del self[element]
+        return attributes
+
+    def __contains__(self, element):
+        return element in self.rows
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def keys(self):
+        return self.store.keys()
+
+    def values(self):
+        return (ElementAttributes(self, element) for element in self.store.keys())
+
+    def items(self):
+        return ((element, ElementAttributes(self, element))
+                for element in self.store.keys())
+
+    def _column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise KeyError('%r is not a column of the attribute schema' % name)
+
+    def _valid(self, column):
+        return column.mask[:len(self.elements)]
+
+    def filter(self, name, op, value):
+        '''
+        Returns:
+            a list of the elements whose attribute name compares to value
+            with op, one of '==', '!=', '<', '<=', '>' or '>='.  Elements
+            without the attribute never match.
+        '''
+        column = self._column(name)
+        rows = len(self.elements)
+        selected = column.compare(op, value, rows)
+        selected &= column.mask[:rows]
+        elements = self.elements
+        return [elements[row] for row in numpy.flatnonzero(selected)]
+
+    def count(self, name):
+        '''
+        Returns:
+            the number of elements with a value for attribute name
+        '''
+        return int(numpy.count_nonzero(self._valid(self._column(name))))
+
+    def sum(self, name):
+        '''
+        Returns:
+            the sum of attribute name over the elements that have it
+        '''
+        column = self._column(name)
+        values = column.values[:len(self.elements)][self._valid(column)]
+        return values.sum().item()
+
+    def mean(self, name):
+        '''
+        Returns:
+            the mean of attribute name over the elements that have it, or
+            None if no element has it
+        '''
+        column = self._column(name)
+        values = column.values[:len(self.elements)][self._valid(column)]
+        if not len(values):
+            return None
+        return values.mean().item()
+
+    def groupby(self, by, name=None, agg='count'):
+        '''
+        Aggregate attribute name over the groups of elements sharing a value
+        of attribute by.
+
+        Args:
+            by: the column to group on
+            name (optional): the column to aggregate, not needed for 'count'
+            agg (optional): one of 'count', 'sum' or 'mean'
+
+        Returns:
+            a dictionary of group value to aggregate.  Elements without a
+            value for by (or for name) are left out.
+        '''
+        key_column = self._column(by)
+        rows = len(self.elements)
+        valid = key_column.mask[:rows].copy()
+        if agg != 'count' or name is not None:
+            column = self._column(name)
+            valid &= column.mask[:rows]
+        keys = key_column.values[:rows][valid]
+        groups, inverse = numpy.unique(keys, return_inverse=True)
+        counts = numpy.bincount(inverse, minlength=len(groups))
+        if agg == 'count':
+            results = counts
+        elif agg in ('sum', 'mean'):
+            values = column.values[:rows][valid].astype(numpy.float64)
+            results = numpy.bincount(inverse, weights=values, minlength=len(groups))
+            if agg == 'mean':
+                results = results / counts
+            elif column.dtype != numpy.float64:
+                results = results.astype(numpy.int64)
+        else:
+            raise ValueError('unsupported aggregation %r' % agg)
+        return {key_column.decode(group): result.item()
+                for group, result in zip(groups, results)}
+
+
+class ElementAttributes(MutableMapping):
+    '''
+    The attributes of one element in a ColumnarAttributeStore.  Behaves like
+    the attribute dictionary it replaces.
+    '''
+
+    __slots__ = ('attribute_store', 'element')
+
+    def __init__(self, attribute_store, element):
+        self.attribute_store = attribute_store
+        self.element = element
+
+    def _extra(self):
+        return self.attribute_store.store[self.element] or {}
+
+    def __getitem__(self, name):
+        store = self.attribute_store
+        column = store.columns.get(name)
+        if column is None:
+            return self._extra()[name]
+        try:
+            return column.get(store.rows[self.element])
+        except KeyError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        store = self.attribute_store
+        column = store.columns.get(name)
+        if column is None:
+            extra = dict(self._extra())
+            extra[name] = value
+            #replaced rather than changed in place, so persistent stores
+            #notice the change
+            store.store[self.element] = extra
+        elif value is None:
+            column.clear(store.rows[self.element])
+        else:
+            column.set(store.rows[self.element], value)
+
+    def __delitem__(self, name):
+        store = self.attribute_store
+        column = store.columns.get(name)
+        if column is None:
+            extra = dict(self._extra())
+            del extra[name]
+            store.store[self.element] = extra or None
+        else:
+            row = store.rows[self.element]
+            if not column.mask[row]:
+                raise KeyError(name)
+            column.clear(row)
+
+    def __iter__(self):
+        store = self.attribute_store
+        row = store.rows[self.element]
+        for name, column in store.columns.items():
+            if column.mask[row]:
+                yield name
+        for name in self._extra():
+            yield name
+
+    def __len__(self):
+        return sum(1 for name in self)
+
+    def update(self, *args, **kwargs):
+        attributes = dict(*args, **kwargs)
+        #checked first, so a bad value changes nothing
+        self.attribute_store._check(attributes)
+        super().update(attributes)
+
+    def copy(self):
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
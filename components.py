@@ -0,0 +1,132 @@
+"""
+An incrementally maintained index of the connected components of a graph.
+"""
+from db import GraphListener
+
+
+class ComponentIndex(GraphListener):
+    '''
+    A union-find structure over the nodes of a graph, with union by size and
+    path compression.
+
+    The structure lives in store, a mapping holding the parent of every
+    node, except for the root of each component, which maps to the number of
+    nodes in the component.  An empty store for a graph with nodes means
+    the index is stale: graphs not maintaining the index clear it when they
+    commit changes, see Graph.enable_component_index().  The index checks
+    whether one did before every use, and rebuilds itself.
+
+    Args:
+        graph: the graph to index
+        store: the mapping to keep the structure in
+    '''
+
+    def __init__(self, graph, store):
+        self.graph = graph
+        self.store = store
+        self._stale = not store and bool(len(graph.node_store))
+        self.generation = graph._index_generation('component_store')
+
+    @property
+    def stale(self):
+        '''
+        True if the index must be rebuilt before it is used, because of a
+        deletion or a graph on the same backend clearing it
+        '''
+        return (self._stale or
+                self.generation != self.graph._index_generation('component_store'))
+
+    def rebuild(self):
+        '''
+        Rebuild the index from the node_store and edge_store.
+        '''
+        self.store.clear()
+        self._stale = False
+        self.generation = self.graph._index_generation('component_store')
+        for node in self.graph.node_store.keys():
+            self.store[node] = 1
+        for node1, node2 in self.graph.edge_store.values():
+            self.union(node1, node2)
+
+    def _invalidate(self):
+        #clearing the store marks the index stale for the next session too
+        if not self.stale:
+            self.store.clear()
+            self._stale = True
+
+    def find(self, node):
+        '''
+        Returns:
+            the root of the component of node
+        '''
+        if self.stale:
+            self.rebuild()
+        store = self.store
+        root = node
+        parent = store[root]
+        while not isinstance(parent, int):
+            root = parent
+            parent = store[root]
+        #path compression
+        while node != root:
+            parent = store[node]
+            if parent == root:
+                break
+            store[node] = root
+            node = parent
+        return root
+
+    def union(self, node1, node2):
+        root1 = self.find(node1)
+        root2 = self.find(node2)
+        if root1 == root2:
+            return root1
+        size1 = self.store[root1]
+        size2 = self.store[root2]
+        if size1 < size2:
+            root1, root2 = root2, root1
+        self.store[root2] = root1
+        self.store[root1] = size1 + size2
+        return root1
+
+    def size(self, node):
+        '''
+        Returns:
+            the number of nodes in the component of node
+        '''
+        return self.store[self.find(node)]
+
+    def sizes(self):
+        '''
+        Returns:
+            a dictionary of the root of each component to its size
+        '''
+        if self.stale:
+            self.rebuild()
+        return {node: value for node, value in self.store.items()
+                if isinstance(value, int)}
+
+    def node_added(self, node):
+        if not self.stale:
+            self.store[node] = 1
+
+    def edge_added(self, edge, node1, node2, directed):
+        if not self.stale:
+            self.union(node1, node2)
+
+    def node_deleted(self, node):
+        #a node without edges is a component of its own, and can just go
+        size = self.store.get(node)
+        if not self.stale and isinstance(size, int) and size == 1:
+            del self.store[node]
+        else:
+            self._invalidate()
+
+    def edge_deleted(self, edge, node1, node2):
+        if self.stale:
+            return
+        #another edge between the same nodes keeps them connected
+        pair_store = self.graph.pair_store
+        if (node1, node2) in pair_store or (node2, node1) in pair_store:
+            return
+        self._invalidate()
@@ -1,5 +1,8 @@
 import uuid, itertools
-from backends import DictionaryBackend
+import weakref
+from collections.abc import MutableMapping
+from backends import DictionaryBackend, open_backend
+import instrumentation
 
 class Graph():
     """
@@ -21,6 +24,20 @@ class Graph():
     """
 #To Do: Make more methods into properties.
 
+    #operations timed and stores counted when metrics are enabled
+    instrumented_operations = ('add_node', 'add_nodes', 'add_edge', 'add_edges',
+                               'del_node', 'del_nodes', 'del_edge', 'del_edges',
+                               'compact', '__getitem__',
+                               '__setitem__', 'commit', 'khop',
+                               'aggregate_neighbors', 'import_edges',
+                               'export_edges', 'triangle_count', 'clustering',
+                               'motif_counts', 'sampler')
+    instrumented_stores = ('node_store', 'attribute_store', 'edge_store',
+                           'weight_store', 'direction_store', 'pair_store')
+    #the backend stores of the optional indexes, the component index and
+    #the weight indexes of WeightedGraph
+    persisted_indexes = ('component_store', 'node_weight_index', 'edge_weight_index')
+
     def __init__(self, backend=None):
 
         if backend == None:
@@ -33,10 +50,53 @@ class Graph():
         self.commit_func = backend.commit
         self.abort_func = backend.abort
         self.direction_store = backend.direction_store
+        self.pair_store = backend.pair_store
+        #target node -> {directed edge: source node}, None for backends
+        #without one, whose direction_store is scanned instead
+        self.incoming_store = getattr(backend, 'incoming_store', None)
         #the default node and edge types
         self.node_type = Node
         self.edge_type = Edge
+        self._metrics = None
+        self._listeners = []
+        self._components = None
+        self._changes = None
+        self._cache = None
+        #the names of the persisted indexes this graph doesn't keep up to
+        #date, cleared when it commits changes so they are rebuilt when next
+        #used
+        self._unmaintained = [name for name in self.persisted_indexes
+                              if getattr(backend, name, None) is not None]
+        self._changed = False
+        #elements read back from the backend's databases are rebuilt bound
+        #to this graph, see Element.__reduce__
+        graph_id = getattr(backend, 'graph_id', None)
+        if graph_id is not None:
+            _graphs[graph_id] = self
+        #a component index maintained by another graph on the backend is
+        #kept up to date by this one too
+        index = _component_indexes.get(backend)
+        if index is not None and index() is not None:
+            self._adopt_component_index(index())
+
+
+    @classmethod
+    def open(cls, url):
+        """
+        Open a graph on the backend for url.
+
+        Args:
+            url: a URL whose scheme names the backend, e.g. 'memory://' or
+            'zodb:///path/to/data.fs', see backends.open_backend()
+
+        Returns:
+            the graph
 
+        Note:
+            A backend's module is imported the first time it is opened, so
+            in-memory graphs never load ZODB.
+        """
+        return cls(open_backend(url))
 
     def __iter__(self):
         """
@@ -57,8 +117,18 @@ class Graph():
         Args:
             element: An element(node or edge) object that belongs to the graph
 
+        Note:
+            While listeners are registered (see add_listener()) the
+            dictionary is wrapped in an ObservedAttributes, which tells them
+            about the attributes set or deleted through it.
         """
-        return self.attribute_store[element]
+        return self._attributes(element)
+
+    def _attributes(self, element):
+        attributes = self.attribute_store[element]
+        if self._listeners:
+            return ObservedAttributes(self, element, attributes)
+        return attributes
 
     def __setitem__(self, element, attributes):
         """
@@ -77,9 +147,11 @@ class Graph():
             keys which aren't duplicated in item won't be overwritten.
         """
         self.attribute_store[element].update(attributes)
+        if self._listeners:
+            self._notify('attributes_updated', element, attributes)
         self.commit()
 
-        return self.attribute_store[element]
+        return self._attributes(element)
 
 
     @property
@@ -114,10 +186,7 @@ class Graph():
         if not attributes:
             attributes = {}
 
-        node = self.node_type(self)
-        self.node_store[node] = {}
-        self.attribute_store[node] = attributes
-        self.weight_store[node] = weight
+        node = self._add_node(attributes, weight)
         self.commit()
         return node
 
@@ -149,7 +218,7 @@ class Graph():
         return nodes
 
 
-    def add_edge(self, node1, node2, attributes=None, directed=False, weight=0, *args, **kwargs):
+    def add_edge(self, node1, node2, attributes=None, directed=False, weight=0, unique=False, *args, **kwargs):
         """
         Creates an edge between node1 and node2.
 
@@ -159,6 +228,9 @@ class Graph():
             attributes (optional): dictionary of attributes to apply to the edge
             directed (optional): Boolean value, to create a directional edge,set True (False by default)
             weight (optional): an integer representing the edges initial weight
+            unique (optional): Boolean value, if True and there already is an
+            edge from node1 to node2 with the same direction, that edge is
+            updated with attributes and weight instead of adding a new one
 
         Keyword Args:
             directional: Boolean value, to create a directional edge, you supply
@@ -176,15 +248,17 @@ class Graph():
         if not isinstance(attributes, dict):
             raise ValueError('attributes must be a dict')
 
-        edge = self.edge_type(self)
-        self.node_store[node1][edge] = node2
-        if directed:
-            self.direction_store.append(edge)
-        else:
-            self.node_store[node2][edge] = node1
-        self.attribute_store[edge] = attributes.copy()
-        self.edge_store[edge] = (node1, node2)
-        self.weight_store[edge] = weight
+        if unique:
+            for edge in self.edges_between(node1, node2):
+                if (edge in self.direction_store) == bool(directed):
+                    self.attribute_store[edge].update(attributes)
+                    if self._listeners:
+                        self._notify('attributes_updated', edge, attributes)
+                    self._store_weight(edge, weight)
+                    self.commit()
+                    return edge
+
+        edge = self._add_edge(node1, node2, attributes.copy(), directed, weight)
         self.commit()
         return edge
 
@@ -208,20 +282,84 @@ class Graph():
         return keys
 
 
+    def import_edges(self, source, format='csv', **kwargs):
+        """
+        Stream an edge list from a file into the graph.
+
+        Args:
+            source: a path or an open file
+            format (optional): 'csv', 'tsv' or 'jsonl'
+
+        The other keyword arguments are those of bulk.import_edges(), which
+        also documents how nodes are matched to the keys in the file.
+
+        Returns:
+            the number of edges imported
+        """
+        import bulk
+        return bulk.import_edges(self, source, format, **kwargs)
+
+    def export_edges(self, destination, format='csv', **kwargs):
+        """
+        Stream the edges of the graph to a file.
+
+        Args:
+            destination: a path or an open file
+            format (optional): 'csv', 'tsv' or 'jsonl'
+
+        The other keyword arguments are those of bulk.export_edges().
+
+        Returns:
+            the number of edges exported
+        """
+        import bulk
+        return bulk.export_edges(self, destination, format, **kwargs)
+
+    def has_edge(self, node1, node2):
+        """
+        Returns:
+            True if there is an edge from node1 to node2, that is an
+            undirected edge between them or a directed edge from node1 to
+            node2
+
+        Note:
+            Edges are looked up in an index of node pairs, so this takes the
+            same time no matter how many edges the nodes have.
+        """
+        return (node1, node2) in self.pair_store
+
+    def edges_between(self, node1, node2):
+        """
+        Returns:
+            A frozenset of the edges from node1 to node2, that is the
+            undirected edges between them and the directed edges from node1
+            to node2
+        """
+        return _pair_edges(self.pair_store.get((node1, node2), frozenset()))
+
     def del_node(self, node):
         """
-        delete node
+        delete node, and every edge connected to it
 
         Args:
             node: node object that is a member of the graph, to be deleted
 
         """
-        #Note: Must create shallow copy here with copy() method
-        #because we are altering the attributes dict within the node_dict
-        for edge in self.node_store[node].copy():
-            self.del_edge(edge)
-        del self.node_store[node]
-        del self.attribute_store[node]
+        self._remove_nodes((node,))
+        self.commit()
+
+    def del_nodes(self, nodes):
+        """
+        Delete several nodes at once, and every edge connected to them.
+
+        Args:
+            nodes: an iterable of node objects that are members of the graph
+
+        Note:
+            All the stores are cleaned up in one pass and committed once, so
+            this is much cheaper than calling del_node() for each node.
+        """
+        self._remove_nodes(nodes)
         self.commit()
 
     def del_edge(self, edge):
@@ -232,11 +370,229 @@ class Graph():
             edge: edge object that is a member of the graph, to be deleted
 
         """
-        for node in self.edge_store[edge]:
-            del self.node_store[node][edge]
+        self._remove_edge(edge)
+        self.commit()
+
+    def del_edges(self, edges):
+        """
+        Delete several edges at once, committing once.
+
+        Args:
+            edges: an iterable of edge objects that are members of the graph
+        """
+        for edge in set(edges):
+            self._remove_edge(edge)
+        self.commit()
+
+    def compact(self):
+        """
+        Remove orphaned entries left in the stores.
+
+        Graphs changed by older versions leaked the weights and directions
+        of deleted elements, and directed edges pointing at a deleted node.
+        This reclaims all of them in one pass, indexes any edges missing
+        from the pair_store and incoming_store, and commits once.  Listeners
+        are told about the edges removed because one of their nodes was
+        deleted.
+
+        Returns:
+            the number of entries removed
+        """
+        self._changed = True
+        removed = 0
+
+        #edges with a deleted endpoint, the rest of their entries are
+        #removed below along with the other orphans
+        orphans = []
+        for edge, (node1, node2) in list(self.edge_store.items()):
+            if node1 not in self.node_store or node2 not in self.node_store:
+                del self.edge_store[edge]
+                orphans.append((edge, node1, node2))
+                removed += 1
+
+        for node, adjacency in self.node_store.items():
+            for edge in [e for e in adjacency if e not in self.edge_store]:
+                del adjacency[edge]
+                removed += 1
+
+        for store in (self.attribute_store, self.weight_store):
+            for element in [e for e in store.keys()
+                            if e not in self.node_store and e not in self.edge_store]:
+                del store[element]
+                removed += 1
+
+        for edge in [e for e in self.direction_store if e not in self.edge_store]:
+            self.direction_store.remove(edge)
+            removed += 1
+
+        for pair, value in list(self.pair_store.items()):
+            edges = _pair_edges(value)
+            live = frozenset(e for e in edges if e in self.edge_store)
+            removed += len(edges) - len(live)
+            if not live:
+                del self.pair_store[pair]
+            elif live != edges or len(live) == 1 and value is edges:
+                #also unwraps the single edges older versions stored in sets
+                self.pair_store[pair] = _pair_value(live)
+
+        #the incoming_store indexes the direction_store, whose orphans are
+        #already counted
+        if self.incoming_store is not None:
+            for node, incoming in list(self.incoming_store.items()):
+                for edge in [e for e in incoming if e not in self.direction_store]:
+                    del incoming[edge]
+                if not len(incoming):
+                    del self.incoming_store[node]
+
+        #index edges added before the pair_store and incoming_store existed
+        for edge, (node1, node2) in self.edge_store.items():
+            if edge not in _pair_edges(self.pair_store.get((node1, node2), ())):
+                self._index_edge(edge, node1, node2, edge in self.direction_store)
+        if self.incoming_store is not None:
+            for edge in self.direction_store:
+                node1, node2 = self.edge_store[edge]
+                if edge not in self.incoming_store.get(node2, ()):
+                    self._index_incoming(edge, node1, node2)
+
+        #once the stores are clean, so listeners see the graph without them
+        if self._listeners:
+            for edge, node1, node2 in orphans:
+                self._notify('edge_deleted', edge, node1, node2)
+
+        self.commit()
+        return removed
+
+    def _add_node(self, attributes, weight):
+        """
+        Add a node to every store, without committing.
+        """
+        self._changed = True
+        node = self.node_type(self)
+        self.node_store[node] = {}
+        self.attribute_store[node] = attributes
+        self.weight_store[node] = weight
+        if self._listeners:
+            self._notify('node_added', node)
+        return node
+
+    def _add_edge(self, node1, node2, attributes, directed, weight):
+        """
+        Add an edge to every store, without committing.
+        """
+        self._changed = True
+        edge = self.edge_type(self)
+        self.node_store[node1][edge] = node2
+        if directed:
+            self.direction_store.append(edge)
+            if self.incoming_store is not None:
+                self._index_incoming(edge, node1, node2)
+        else:
+            self.node_store[node2][edge] = node1
+        self.attribute_store[edge] = attributes
+        self.edge_store[edge] = (node1, node2)
+        self.weight_store[edge] = weight
+        self._index_edge(edge, node1, node2, directed)
+        if self._listeners:
+            self._notify('edge_added', edge, node1, node2, directed)
+        return edge
+
+    def _remove_nodes(self, nodes):
+        """
+        Remove nodes and their edges from every store, without committing.
+        """
+        self._changed = True
+        nodes = set(nodes)
+        edges = set()
+        for node in nodes:
+            edges.update(self.node_store[node].keys())
+
+        #directed edges are only in the adjacency list of their source node,
+        #so edges pointing at the nodes are found in the incoming_store, or
+        #else the direction_store
+        if self.incoming_store is not None:
+            for node in nodes:
+                incoming = self.incoming_store.get(node)
+                if incoming is not None:
+                    edges.update(incoming.keys())
+        elif len(self.direction_store):
+            for edge in self.direction_store:
+                if edge not in edges and self.edge_store[edge][1] in nodes:
+                    edges.add(edge)
+
+        for edge in edges:
+            self._remove_edge(edge)
+
+        for node in nodes:
+            del self.node_store[node]
+            del self.attribute_store[node]
+            self.weight_store.pop(node, None)
+            if self._listeners:
+                self._notify('node_deleted', node)
+
+    def _remove_edge(self, edge):
+        """
+        Remove edge from every store, without committing.
+        """
+        self._changed = True
+        node1, node2 = self.edge_store[edge]
+        self.node_store[node1].pop(edge, None)
+        #directed edges are not in the adjacency list of node2
+        if node2 != node1:
+            self.node_store[node2].pop(edge, None)
+        if edge in self.direction_store:
+            self.direction_store.remove(edge)
+            if self.incoming_store is not None:
+                incoming = self.incoming_store.get(node2)
+                if incoming is not None:
+                    incoming.pop(edge, None)
+                    if not len(incoming):
+                        del self.incoming_store[node2]
         del self.attribute_store[edge]
         del self.edge_store[edge]
-        self.commit()
+        self.weight_store.pop(edge, None)
+        self._unindex_edge(edge, node1, node2)
+        if self._listeners:
+            self._notify('edge_deleted', edge, node1, node2)
+
+    def _index_edge(self, edge, node1, node2, directed):
+        """
+        Add edge to the pair_store under (node1, node2), and (node2, node1)
+        if it is undirected.
+        """
+        pairs = ((node1, node2),) if directed or node1 == node2 else \
+            ((node1, node2), (node2, node1))
+        #a pair with one edge maps to the edge itself, only parallel edges
+        #take a frozenset.  Frozensets are replaced rather than changed in
+        #place, so persistent stores notice the change.
+        for pair in pairs:
+            edges = self.pair_store.get(pair)
+            if edges is None:
+                self.pair_store[pair] = edge
+            else:
+                self.pair_store[pair] = _pair_edges(edges) | {edge}
+
+    def _unindex_edge(self, edge, node1, node2):
+        """
+        Remove edge from the pair_store.
+        """
+        for pair in ((node1, node2), (node2, node1)):
+            edges = _pair_edges(self.pair_store.get(pair, ()))
+            if edge in edges:
+                edges = edges - {edge}
+                if edges:
+                    self.pair_store[pair] = _pair_value(edges)
+                else:
+                    del self.pair_store[pair]
+
+    def _index_incoming(self, edge, node1, node2):
+        """
+        Add the directed edge from node1 to node2 to the incoming_store.
+        """
+        incoming = self.incoming_store.get(node2)
+        if incoming is None:
+            self.incoming_store[node2] = {edge: node1}
+        else:
+            incoming[edge] = node1
 
     def commit(self):
         """
@@ -244,13 +600,870 @@ class Graph():
 
         Used as an integration point for transactional stores
         """
-        self.commit_func
+        if self._changed:
+            self._changed = False
+            if self._unmaintained:
+                self._clear_indexes()
+        self.commit_func()
+        if self._listeners:
+            self._notify('committed')
+
+    def _clear_indexes(self):
+        '''
+        Clear the persisted indexes this graph doesn't maintain, and tell
+        the objects maintaining them in this process to rebuild them.
+        '''
+        cleared = _cleared.setdefault(self.backend, {})
+        for name in self._unmaintained:
+            store = getattr(self.backend, name)
+            if store:
+                store.clear()
+            cleared[name] = cleared.get(name, 0) + 1
+
+    def _index_generation(self, name):
+        '''
+        Returns:
+            the number of times a graph on the backend cleared the persisted
+            index name, see commit()
+        '''
+        return _cleared.get(self.backend, {}).get(name, 0)
 
     def abort(self):
         """
         Used as an integration point for transactional stores
         """
-        self.abort_func
+        self.abort_func()
+        if self._listeners:
+            self._notify('aborted')
+
+    def close(self):
+        """
+        Close the backend, e.g. the database of a graph opened with open().
+        The graph must not be used afterwards.
+
+        Graphs are also context managers, closed on leaving the with block.
+        Backends without a close() method, such as the in-memory one, need
+        no closing.
+        """
+        close = getattr(self.backend, 'close', None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _set_weight(self, element, weight):
+        """
+        Set the weight of element, used by the Element.weight setter.
+        """
+        self._store_weight(element, weight)
+        self.commit()
+
+    def _store_weight(self, element, weight):
+        """
+        Change the weight of element, without committing.
+        """
+        self._changed = True
+        self.weight_store[element] = weight
+        if self._listeners:
+            self._notify('weight_changed', element, weight)
+
+    def khop(self, seeds, k, edge_filter=None, node_filter=None, max_nodes=None,
+             directed=None, min_weight=None, max_weight=None, fanout=None):
+        """
+        Find the nodes within k hops of seeds, level by level.
+
+        Each level is found by expanding the whole frontier at once and
+        removing the nodes already visited with set operations, so no node is
+        expanded twice.
+
+        Args:
+            seeds: an iterable of nodes to start from
+            k: the maximum number of hops
+            edge_filter (optional): a callable taking an edge, only edges for
+            which it returns True are followed
+            node_filter (optional): a callable taking a node, only nodes for
+            which it returns True are returned and expanded
+            max_nodes (optional): stop once this many nodes (seeds included)
+            have been returned
+            directed (optional): if True, only follow directed edges, if False
+            only undirected ones.  By default both are followed.
+            min_weight (optional): only follow edges with at least this weight
+            max_weight (optional): only follow edges with at most this weight
+            fanout (optional): expand at most this many edges of each node,
+            to bound the cost of hub nodes
+
+        Returns:
+            A generator of (depth, nodes) tuples, where nodes is the set of
+            nodes first reached after depth hops.  The seeds are returned at
+            depth 0.
+
+        Note:
+            Like Node.neighbors, directed edges are only followed from their
+            first node to their second.
+        """
+        node_store = self.node_store
+        weight_store = self.weight_store
+        direction_store = self.direction_store
+        simple = (edge_filter is None and directed is None and
+                  min_weight is None and max_weight is None)
+
+        frontier = set(seeds)
+        if node_filter is not None:
+            frontier = {node for node in frontier if node_filter(node)}
+        if max_nodes is not None and len(frontier) > max_nodes:
+            frontier = set(itertools.islice(frontier, max_nodes))
+        visited = set(frontier)
+        if not frontier:
+            return
+        yield 0, frontier
+
+        for depth in range(1, k + 1):
+            found = set()
+            for node in frontier:
+                adjacency = node_store[node]
+                if simple:
+                    if fanout is None:
+                        found.update(adjacency.values())
+                    else:
+                        found.update(itertools.islice(adjacency.values(), fanout))
+                    continue
+                items = adjacency.items()
+                if fanout is not None:
+                    items = itertools.islice(items, fanout)
+                for edge, neighbor in items:
+                    if directed is not None and (edge in direction_store) != directed:
+                        continue
+                    if min_weight is not None or max_weight is not None:
+                        weight = weight_store.get(edge)
+                        if min_weight is not None and weight < min_weight:
+                            continue
+                        if max_weight is not None and weight > max_weight:
+                            continue
+                    if edge_filter is not None and not edge_filter(edge):
+                        continue
+                    found.add(neighbor)
+
+            found -= visited
+            if node_filter is not None:
+                found = {node for node in found if node_filter(node)}
+            if max_nodes is not None and len(visited) + len(found) > max_nodes:
+                found = set(itertools.islice(found, max_nodes - len(visited)))
+            if not found:
+                return
+            visited |= found
+            yield depth, found
+            frontier = found
+
+    def aggregate_neighbors(self, agg='count', of=None, group_by=None, where=None, nodes=None):
+        """
+        Aggregate over the neighbors of every node in one pass.
+
+        For example, the sum of the weights of each node's edges is
+        aggregate_neighbors('sum', of='weight'), and the number of
+        neighbors of each type with status 'active' is
+        aggregate_neighbors(group_by='type', where={'status': 'active'}).
+
+        Args:
+            agg (optional): one of 'count', 'sum', 'mean', 'min' or 'max'
+            of (optional): what to aggregate: 'weight' for the weights of the
+            edges, or the name of a neighbor attribute.  Neighbors without the
+            attribute are skipped.  Not needed for 'count'.
+            group_by (optional): the name of a neighbor attribute to group
+            the neighbors of each node by
+            where (optional): a dictionary of attributes, only neighbors
+            having all of them with the same values are included
+            nodes (optional): an iterable of the nodes to aggregate for,
+            by default all of them
+
+        Returns:
+            A dictionary of node to aggregate, or to a dictionary of group to
+            aggregate if group_by is given.  Nodes with no matching neighbors
+            get 0 for 'count' and 'sum' and None for the others (or an empty
+            dictionary when grouping).
+
+        Note:
+            Neighbors are the same as Node.neighbors: directed edges only
+            count for their first node.  Without a nodes argument the
+            backend's scan_adjacency() is used when it has one, e.g. the ZODB
+            backend scans its node_store one bucket at a time.
+        """
+        if agg not in ('count', 'sum', 'mean', 'min', 'max'):
+            raise ValueError('unsupported aggregation %r' % agg)
+        if of is None and agg != 'count':
+            raise ValueError("'of' is needed for %r" % agg)
+
+        node_store = self.node_store
+        if nodes is not None:
+            adjacencies = ((node, node_store[node]) for node in nodes)
+        elif node_store is self.backend.node_store and hasattr(self.backend, 'scan_adjacency'):
+            adjacencies = self.backend.scan_adjacency()
+        else:
+            adjacencies = node_store.items()
+
+        attribute_store = self.attribute_store
+        weight_store = self.weight_store
+        edge_weight = of == 'weight'
+        neighbor_attribute = of if not edge_weight else None
+        read_neighbor = bool(group_by is not None or where or neighbor_attribute is not None)
+        missing = object()
+        #(group, value, included) of each neighbor, so the attributes of a
+        #neighbor shared by many nodes are only read once
+        neighbors = {}
+        empty = 0 if agg in ('count', 'sum') else None
+
+        results = {}
+        for node, adjacency in adjacencies:
+            #group -> [count, total, minimum, maximum]
+            groups = {}
+            for edge, neighbor in adjacency.items():
+                group = value = None
+                if read_neighbor:
+                    try:
+                        group, value, included = neighbors[neighbor]
+                    except KeyError:
+                        attributes = attribute_store[neighbor]
+                        included = True
+                        if where:
+                            for key, expected in where.items():
+                                if attributes.get(key, missing) != expected:
+                                    included = False
+                                    break
+                        if group_by is not None:
+                            group = attributes.get(group_by)
+                        if neighbor_attribute is not None:
+                            value = attributes.get(neighbor_attribute)
+                        neighbors[neighbor] = (group, value, included)
+                    if not included:
+                        continue
+                if edge_weight:
+                    value = weight_store.get(edge)
+                elif neighbor_attribute is None:
+                    value = 1
+                if value is None:
+                    continue
+
+                state = groups.get(group)
+                if state is None:
+                    groups[group] = [1, value, value, value]
+                else:
+                    state[0] += 1
+                    state[1] += value
+                    if value < state[2]:
+                        state[2] = value
+                    if value > state[3]:
+                        state[3] = value
+
+            for group, (count, total, minimum, maximum) in groups.items():
+                if agg == 'count':
+                    groups[group] = count
+                elif agg == 'sum':
+                    groups[group] = total
+                elif agg == 'mean':
+                    groups[group] = total / count
+                elif agg == 'min':
+                    groups[group] = minimum
+                else:
+                    groups[group] = maximum
+            if group_by is not None:
+                results[node] = groups
+            else:
+                results[node] = groups.get(None, empty)
+        return results
+
+    def triangle_count(self, method='sets'):
+        """
+        Count the triangles of the graph, ignoring the direction of edges.
+
+        Args:
+            method (optional): 'sets' to intersect degree ordered neighbor
+            sets, or 'sparse' to multiply scipy sparse matrices (which needs
+            scipy)
+
+        Returns:
+            the number of triangles
+
+        Note:
+            To run several triangle queries on the same graph, make one
+            triangles.TriangleCounter and query it.
+        """
+        from triangles import TriangleCounter
+        return TriangleCounter(self, method).count()
+
+    def clustering(self, nodes=None, method='sets'):
+        """
+        Args:
+            nodes (optional): an iterable of nodes, by default all of them
+            method (optional): 'sets' or 'sparse', see triangle_count()
+
+        Returns:
+            a dictionary of node to its local clustering coefficient, the
+            fraction of the pairs of its neighbors that are connected
+        """
+        from triangles import TriangleCounter
+        return TriangleCounter(self, method).clustering(nodes)
+
+    def motif_counts(self):
+        """
+        Count the connected three node motifs, following the direction_store.
+
+        Returns:
+            a dictionary of triad census name ('021D' to '300') to count,
+            see triangles.TriangleCounter.motifs()
+        """
+        from triangles import TriangleCounter
+        return TriangleCounter(self).motifs()
+
+    def sampler(self, weighted=False):
+        """
+        Precompute the tables to sample random walks and neighborhoods of
+        the graph in batches.
+
+        Args:
+            weighted (optional): Boolean value, True to follow edges in
+            proportion to their weight
+
+        Returns:
+            a sampling.Sampler, with walks() (uniform, weighted or node2vec
+            biased) and sample_neighbors() methods.  It needs numpy.
+
+        Note:
+            The sampler reads the graph once, and doesn't follow later
+            changes to it.
+        """
+        from sampling import Sampler
+        return Sampler(self, weighted)
+
+    def set_attribute_schema(self, schema):
+        """
+        Store the attributes named in schema column-wise.
+
+        Replaces the attribute_store with a ColumnarAttributeStore holding
+        each attribute in schema in a typed array, with one row per element.
+        Existing attributes are moved over.  Reading and setting attributes
+        works as before, and the new store adds vectorized filter(), sum(),
+        mean() and groupby() methods.
+
+        Args:
+            schema: a dictionary of attribute name to type, one of int,
+            float, bool or str (for categorical strings)
+
+        Returns:
+            The new attribute_store
+
+        Raises:
+            TypeError: if the backend is persistent, as the columns are only
+            held in memory, or if an existing attribute isn't of the type of
+            its column (the graph is then left as it was)
+
+        Note:
+            Requires numpy.
+        """
+        from columnar import ColumnarAttributeStore
+
+        if getattr(self.backend, 'persistent', False):
+            raise TypeError('the columns of an attribute schema are not persisted, '
+                            'use an in-memory backend')
+        store = instrumentation.unwrap(self, 'attribute_store')
+        base = store.store if isinstance(store, ColumnarAttributeStore) else store
+        attributes = [(element, dict(value or {})) for element, value in store.items()]
+        columnar = ColumnarAttributeStore(base, schema)
+        for element, value in attributes:
+            columnar._check(value)
+        for element, value in attributes:
+            columnar[element] = value
+        instrumentation.replace_store(self, 'attribute_store', columnar)
+        return columnar
+
+    def memory_usage(self):
+        """
+        Estimate the memory used by the graph.
+
+        Returns:
+            A dictionary with:
+            'stores': the bytes used by each store for its entries, not
+            counting the node and edge objects themselves,
+            'elements': the bytes used by the node and edge objects,
+            'types': the bytes of the entries of each element type (e.g.
+            'Node' and 'Edge') across the stores, plus the elements
+            themselves,
+            'total': the overall bytes
+
+        Note:
+            Objects referenced from several places are counted once.  With
+            the ZODB backend this reads every object of the graph into memory.
+        """
+        import memory
+        return memory.memory_usage(self, self.instrumented_stores)
+
+    def compact_attributes(self):
+        """
+        Store attributes with shared key tables, to save memory.
+
+        Replaces the attribute_store with a SharedKeyAttributeStore.  The
+        attributes of each element are then stored as a tuple of values,
+        and elements with the same attribute keys share a single table of
+        the keys, instead of each having its own dictionary.  Existing
+        attributes are converted, and so are the attributes of new elements.
+        Attributes still read and update like dictionaries.
+
+        Returns:
+            The new attribute_store
+
+        Raises:
+            TypeError: if the backend is persistent, as changes to the
+            shared key attributes are not saved
+        """
+        from memory import SharedKeyAttributeStore
+
+        if getattr(self.backend, 'persistent', False):
+            raise TypeError('shared key attributes are not persisted, '
+                            'use an in-memory backend')
+        store = instrumentation.unwrap(self, 'attribute_store')
+        if isinstance(store, SharedKeyAttributeStore):
+            return store
+        compacted = SharedKeyAttributeStore(store)
+        for element, attributes in list(store.items()):
+            compacted[element] = attributes
+        instrumentation.replace_store(self, 'attribute_store', compacted)
+        return compacted
+
+    def freeze(self):
+        """
+        Make an immutable, compact copy of the graph for read-only use.
+
+        Returns:
+            a FrozenGraph (see frozen.py) with the nodes, edges, attributes and
+            weights of the graph.  It supports the read API of Graph, Node and
+            Edge, and can be shared between threads without locks.
+
+        Note:
+            Later changes to the graph don't show in the copy.
+        """
+        from frozen import FrozenGraph
+        return FrozenGraph(self)
+
+    def subgraph(self, nodes):
+        """
+        Returns:
+            A read-only view of the subgraph induced by nodes: the nodes and
+            every edge between two of them.
+
+        Args:
+            nodes: an iterable of nodes of the graph
+
+        Note:
+            The view filters this graph's stores on access rather than
+            copying them, so it is cheap to create and always up to date.
+            Elements returned by the view belong to it, so for example a
+            node's neighbors are limited to the subgraph.
+        """
+        from views import SubgraphView
+        return SubgraphView(self, nodes)
+
+    def edge_subgraph(self, edges):
+        """
+        Returns:
+            A read-only view of the subgraph made of edges and the nodes
+            they connect.  See subgraph().
+
+        Args:
+            edges: an iterable of edges of the graph
+        """
+        from views import EdgeSubgraphView
+        return EdgeSubgraphView(self, edges)
+
+    def snapshot(self):
+        """
+        Take a point in time snapshot of the graph, in O(1).
+
+        Returns:
+            A read-only view of the graph as it is now (see SnapshotView in
+            views.py).  Writes to the graph go on while it is open, without
+            waiting for its readers, and don't show in it.
+
+        Raises:
+            TypeError: if the backend doesn't support snapshots.  Create the
+            graph with a DictionaryBackend(snapshots=True) for them.
+
+        Note:
+            Close the snapshot when done with it, so the backend can drop the
+            old versions it keeps for it.  Attributes stored outside the
+            backend (see set_attribute_schema() and compact_attributes())
+            aren't versioned.
+        """
+        snapshot = getattr(self.backend, 'snapshot', None)
+        if snapshot is None:
+            raise TypeError("'%s' backends don't support snapshots" % type(self.backend).__name__)
+        from views import SnapshotView
+        return SnapshotView(self, snapshot())
+
+    def add_listener(self, listener):
+        """
+        Register a GraphListener to be told about every change to the graph.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Unregister a GraphListener added with add_listener()
+        """
+        self._listeners.remove(listener)
+
+    def _notify(self, event, *args):
+        for listener in self._listeners:
+            getattr(listener, event)(*args)
+
+    def subscribe(self, callback, since=None):
+        """
+        Subscribe to the changes made to the graph.
+
+        Every change (nodes and edges added or deleted, attributes updated,
+        weights changed) is recorded as an Event with a sequence number that
+        keeps increasing.  Events are delivered in batches when the graph
+        commits, by calling callback with a list of events.
+
+        Args:
+            callback: a callable taking a list of Event objects
+            since (optional): a sequence number already seen, to be sent the
+            events after it that are still in the feed's buffer first, e.g.
+            to resume after a restart of the consumer
+
+        Returns:
+            the ChangeFeed of the graph
+
+        Raises:
+            LookupError: if the events after since are no longer buffered, or
+            weren't recorded
+            ValueError: if since is above the feed's last sequence number
+
+        Note:
+            Changes are only recorded while the feed has subscribers, so a
+            graph no one is subscribed to pays nothing for it.  A consumer
+            can resume from the last event it saw while other subscribers
+            kept the feed recording, otherwise LookupError tells it to
+            reload the graph.  Sequence numbers are kept in the backend's
+            counter_store, so they keep increasing across reopens of a
+            persistent graph.
+        """
+        if self._changes is None:
+            from changefeed import ChangeFeed
+            self._changes = ChangeFeed(
+                counter_store=getattr(self.backend, 'counter_store', None))
+        self._changes.subscribe(callback, since)
+        if self._changes not in self._listeners:
+            self.add_listener(self._changes)
+        return self._changes
+
+    def unsubscribe(self, callback):
+        """
+        Unsubscribe a callback added with subscribe()
+
+        Note:
+            The feed stops recording changes when its last subscriber leaves,
+            see subscribe().
+        """
+        self._changes.unsubscribe(callback)
+        if not self._changes.subscribers:
+            self.remove_listener(self._changes)
+
+    def enable_component_index(self):
+        """
+        Start maintaining an index of the connected components of the graph.
+
+        The index is a union-find structure kept in the backend's
+        component_store, so it is persisted with the rest of the graph.
+        Adding nodes and edges updates it in near constant time.  Deletions
+        that may split a component mark it stale, and it is rebuilt the
+        next time it is queried.
+
+        Returns:
+            the ComponentIndex
+
+        Note:
+            Components are weakly connected: edge direction is ignored.
+            Graphs on the same backend created while the index is enabled
+            keep it up to date too.  Other graphs on the backend clear it
+            when they commit changes, so it is rebuilt rather than trusted
+            after changes it missed.
+        """
+        if self._components is None:
+            index = _component_indexes.get(self.backend)
+            index = index() if index is not None else None
+            if index is None:
+                from components import ComponentIndex
+                index = ComponentIndex(self, self.backend.component_store)
+                _component_indexes[self.backend] = weakref.ref(index)
+            self._adopt_component_index(index)
+        return self._components
+
+    def _adopt_component_index(self, index):
+        self._unmaintained = [name for name in self._unmaintained
+                              if name != 'component_store']
+        self._components = index
+        self.add_listener(index)
+
+    def _component_index(self):
+        if self._components is None:
+            raise ValueError('the component index is not enabled, '
+                             'call enable_component_index() first')
+        return self._components
+
+    def component_of(self, node):
+        """
+        Returns:
+            the node representing the connected component of node.  Two nodes
+            are in the same component if they have the same representative,
+            until the graph changes.
+        """
+        return self._component_index().find(node)
+
+    def same_component(self, node1, node2):
+        """
+        Returns:
+            True if node1 and node2 are in the same connected component
+        """
+        index = self._component_index()
+        return index.find(node1) == index.find(node2)
+
+    def component_size(self, node):
+        """
+        Returns:
+            the number of nodes in the connected component of node
+        """
+        return self._component_index().size(node)
+
+    def component_sizes(self):
+        """
+        Returns:
+            a dictionary of the representative node of each connected
+            component to the number of nodes in it
+        """
+        return self._component_index().sizes()
+
+    def enable_query_cache(self, maxsize=1024, ttl=None):
+        """
+        Start caching the results of queries run with cached().
+
+        Results are dropped as soon as the graph changes in a way that can
+        affect them, so a cached result is never stale.
+
+        Args:
+            maxsize (optional): the most results to keep, the least recently
+            used are evicted beyond it
+            ttl (optional): the most seconds to keep a result
+
+        Returns:
+            the QueryCache (see cache.py), whose stats() give its hit rate
+        """
+        if self._cache is None:
+            from cache import QueryCache
+            self._cache = QueryCache(self, maxsize, ttl)
+            self.add_listener(self._cache)
+        return self._cache
+
+    def cached(self, query, *args, depends_on=None, **kwargs):
+        """
+        Run a query, or return its cached result if the graph hasn't changed
+        in a way that affects it since.
+
+        For example cached('aggregate_neighbors', 'sum', of='weight') for
+        the whole graph, or cached('aggregate_neighbors', nodes=[node],
+        depends_on=cache.neighborhood([node])) for one node, which stays
+        cached while the rest of the graph changes.
+
+        Args:
+            query: the name of a Graph method, or a callable taking the graph
+            and the arguments
+            *args, **kwargs: the arguments of the query
+            depends_on (optional): an iterable of the nodes the result
+            depends on, see QueryCache.get().  By default any change to the
+            graph invalidates the result.
+
+        Returns:
+            the result of the query, which must not be modified
+
+        Raises:
+            ValueError: if the query cache isn't enabled
+        """
+        if self._cache is None:
+            raise ValueError('the query cache is not enabled, '
+                             'call enable_query_cache() first')
+        return self._cache.get(query, *args, depends_on=depends_on, **kwargs)
+
+    def enable_metrics(self, hook=None):
+        """
+        Start recording metrics for this graph.
+
+        Every operation named in instrumented_operations is counted and
+        timed, and every read and write to the stores named in
+        instrumented_stores is counted.
+
+        Args:
+            hook (optional): a callable to add with add_metrics_hook()
+
+        Note:
+            Metrics are off by default, and a graph that has never enabled
+            them (or has disabled them again) runs no instrumentation code.
+        """
+        instrumentation.enable(self)
+        if hook is not None:
+            self.add_metrics_hook(hook)
+
+    def disable_metrics(self):
+        """
+        Stop recording metrics.  Metrics recorded so far are kept.
+        """
+        instrumentation.disable(self)
+
+    def add_metrics_hook(self, hook):
+        """
+        Register a callable to be called after every timed operation.
+
+        Args:
+            hook: a callable taking the operation name and its latency in
+            seconds, e.g. to forward them to a metrics pipeline
+        """
+        if self._metrics is None:
+            self._metrics = instrumentation.Metrics()
+        self._metrics.hooks.append(hook)
+
+    def remove_metrics_hook(self, hook):
+        """
+        Unregister a callable added with add_metrics_hook()
+        """
+        self._metrics.hooks.remove(hook)
+
+    def metrics(self):
+        """
+        Returns:
+            A dictionary with an 'operations' dictionary, holding the call
+            count and latency statistics and histogram of each timed
+            operation, and a 'stores' dictionary holding the read and write
+            counts of each store.
+        """
+        if self._metrics is None:
+            return {'operations': {}, 'stores': {}}
+        return self._metrics.as_dict()
+
+
+class GraphListener():
+    """
+    Base class for objects that follow the changes to a graph, registered
+    with Graph.add_listener().  Override the methods for the events you are
+    interested in, the others do nothing.
+    """
+
+    def node_added(self, node):
+        pass
+
+    def edge_added(self, edge, node1, node2, directed):
+        pass
+
+    def node_deleted(self, node):
+        pass
+
+    def edge_deleted(self, edge, node1, node2):
+        pass
+
+    def attributes_updated(self, element, attributes):
+        pass
+
+    def weight_changed(self, element, weight):
+        pass
+
+    def committed(self):
+        pass
+
+    def aborted(self):
+        pass
+
+
+class ObservedAttributes(MutableMapping):
+    '''
+    The attribute dictionary of an element of a graph with listeners,
+    telling them about the changes made through it, see
+    Graph.__getitem__().  Setting an attribute is reported as an
+    attributes_updated event with that attribute, and deleting one as
+    setting it to None.  Like the dictionary, it doesn't commit.
+    '''
+
+    __slots__ = ('graph', 'element', 'attributes')
+
+    def __init__(self, graph, element, attributes):
+        self.graph = graph
+        self.element = element
+        self.attributes = attributes
+
+    def __getitem__(self, name):
+        return self.attributes[name]
+
+    def __setitem__(self, name, value):
+        self.attributes[name] = value
+        self.graph._notify('attributes_updated', self.element, {name: value})
+
+    def __delitem__(self, name):
+        del self.attributes[name]
+        self.graph._notify('attributes_updated', self.element, {name: None})
+
+    def __iter__(self):
+        return iter(self.attributes)
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def copy(self):
+        return dict(self.attributes)
+
+    def __repr__(self):
+        return repr(dict(self.attributes))
+
+
+#backend -> {name of a persisted index: the number of times a graph not
+#maintaining it cleared it}, so the objects maintaining it in this process
+#know to rebuild it
+_cleared = weakref.WeakKeyDictionary()
+#backend -> weak reference to the ComponentIndex of the graphs on it
+_component_indexes = weakref.WeakKeyDictionary()
+#the graph_id of a backend -> the last graph opened on it, which unpickled
+#elements are bound to
+_graphs = weakref.WeakValueDictionary()
+
+
+def _pair_edges(value):
+    '''
+    Returns:
+        the edges of a pair_store value, which is a single edge, or a
+        frozenset of parallel edges
+    '''
+    if isinstance(value, Element):
+        return frozenset((value,))
+    return value
+
+
+def _pair_value(edges):
+    '''
+    Returns:
+        the pair_store value for a non-empty frozenset of edges
+    '''
+    if len(edges) == 1:
+        return next(iter(edges))
+    return edges
+
+
+def _load_element(cls, int, graph_id=None):
+    '''
+    Returns:
+        the element of class cls with the UUID int, e.g. unpickled, bound to
+        the graph opened on the backend with graph_id, or to None
+    '''
+    element = cls.__new__(cls)
+    element.__dict__['graph'] = _graphs.get(graph_id) if graph_id is not None else None
+    element.__dict__['id'] = uuid.UUID(int=int)
+    return element
 
 
 class Element():
@@ -278,7 +1491,7 @@ class Element():
 
     def __setattr__(self, name, value):
         if name == 'weight':
-            self.graph.weight_store[self] = value
+            self.graph._set_weight(self, value)
         else:
             raise TypeError("'" + self.__class__.__name__ + "' objects are immutable")
 
@@ -286,6 +1499,17 @@ class Element():
     def weight(self):
         return self.graph.weight_store.get(self)
 
+    def _bind(self, graph):
+        """
+        Returns:
+            a copy of this element belonging to graph, e.g. a view of the
+            element's graph
+        """
+        element = self.__class__.__new__(self.__class__)
+        element.__dict__['graph'] = graph
+        element.__dict__['id'] = self.id
+        return element
+
     def __eq__(self, other):
 
         try:
@@ -344,6 +1568,15 @@ class Element():
 
         return self.id.__hash__()
 
+    def __reduce__(self):
+        #pickled as the class and UUID, and the graph_id of the backend to
+        #find the graph again: the graph is a live object, which may span
+        #several databases
+        graph_id = getattr(getattr(self.graph, 'backend', None), 'graph_id', None)
+        if graph_id is None:
+            return _load_element, (self.__class__, self.id.int)
+        return _load_element, (self.__class__, self.id.int, graph_id)
+
     def __repr__(self):
 
         return 'Element(%r)' % str(self)
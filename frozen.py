@@ -0,0 +1,491 @@
+"""
+Immutable, compact copies of graphs for read-only serving.
+
+Graph.freeze() copies a graph into a FrozenGraph.  The adjacency lists of all
+the nodes are laid out one after the other (in compressed sparse row form):
+node i's edges and neighbors are the slices offsets[i]:offsets[i + 1] of two
+flat tuples, sorted by neighbor, so a node's neighbors are a single tuple
+slice, its degree is a subtraction, and has_edge() is a binary search.
+Attributes are stored as tuples of values with shared key tables, as with
+Graph.compact_attributes().
+
+A FrozenGraph is a Graph with read-only stores, so the whole read API works
+on it unchanged, but nothing in it can be changed: it is safe to share
+between threads without locks.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from types import MappingProxyType
+
+from db import Graph, Node, Edge
+from memory import KeyTables, SharedKeyAttributes
+
+
+def _index_array(values, size):
+    '''
+    Returns:
+        an array of the indexes values, of the smallest type holding indexes
+        up to size
+    '''
+    return array('I' if size < 2 ** 32 else 'Q', values)
+
+
+_frozen_classes = {}
+
+
+def frozen_class(cls):
+    '''
+    Returns:
+        a subclass of the element class cls reading its neighbors, edges,
+        nodes and weight straight from the arrays of its frozen graph.  The
+        subclass is created once per element class.
+    '''
+    try:
+        return _frozen_classes[cls]
+    except KeyError:
+        pass
+
+    namespace = {'__doc__': cls.__doc__}
+    if issubclass(cls, Node):
+        def neighbors(self):
+            graph = self.graph
+            offsets = graph._offsets
+            return graph._neighbors[offsets[self.index]:offsets[self.index + 1]]
+
+        def edges(self):
+            graph = self.graph
+            offsets = graph._offsets
+            return graph._adjacent_edges[offsets[self.index]:offsets[self.index + 1]]
+
+        def weight(self):
+            return self.graph._node_weights[self.index]
+
+        namespace.update(neighbors=property(neighbors), edges=property(edges),
+                         weight=property(weight))
+    elif issubclass(cls, Edge):
+        def nodes(self):
+            graph = self.graph
+            return (graph._nodes[graph._sources[self.index]],
+                    graph._nodes[graph._targets[self.index]])
+
+        def directed(self):
+            return bool(self.graph._directed[self.index])
+
+        def weight(self):
+            return self.graph._edge_weights[self.index]
+
+        namespace.update(nodes=property(nodes), directed=property(directed),
+                         weight=property(weight))
+    def _bind(self, graph):
+        #elements of views of the frozen graph are plain elements again
+        element = cls.__new__(cls)
+        element.__dict__.update(graph=graph, id=self.id)
+        return element
+
+    namespace['_bind'] = _bind
+    subclass = type('Frozen' + cls.__name__, (cls,), namespace)
+    _frozen_classes[cls] = subclass
+    return subclass
+
+
+class FrozenGraph(Graph):
+    '''
+    An immutable copy of a graph.
+
+    Args:
+        graph: the graph to copy
+
+    Note:
+        The attribute dictionaries are copied, but not the values in them,
+        which should not be changed afterwards.
+    '''
+
+    def __init__(self, graph):
+
+        source_nodes = list(graph.node_store.keys())
+        source_edges = list(graph.edge_store.items())
+        node_index = {node: i for i, node in enumerate(source_nodes)}
+
+        self._nodes = tuple(self._element(node, i) for i, node in enumerate(source_nodes))
+        self._edges = tuple(self._element(edge, i) for i, (edge, nodes) in enumerate(source_edges))
+        self._node_index = {node: i for i, node in enumerate(self._nodes)}
+        self._edge_index = {edge: i for i, edge in enumerate(self._edges)}
+        self._sources = _index_array((node_index[nodes[0]] for edge, nodes in source_edges),
+                                     len(self._nodes))
+        self._targets = _index_array((node_index[nodes[1]] for edge, nodes in source_edges),
+                                     len(self._nodes))
+        direction_store = graph.direction_store
+        self._directed = bytes(edge in direction_store for edge, nodes in source_edges)
+        self._directed_count = sum(self._directed)
+
+        offsets = [0]
+        neighbor_indexes = []
+        edge_indexes = []
+        edge_index = self._edge_index
+        for node in source_nodes:
+            row = sorted((node_index[neighbor], edge_index[edge])
+                         for edge, neighbor in graph.node_store[node].items())
+            neighbor_indexes.extend(neighbor for neighbor, edge in row)
+            edge_indexes.extend(edge for neighbor, edge in row)
+            offsets.append(len(neighbor_indexes))
+        self._offsets = _index_array(offsets, len(neighbor_indexes) + 1)
+        self._neighbor_indexes = _index_array(neighbor_indexes, len(self._nodes))
+        self._neighbors = tuple(self._nodes[i] for i in neighbor_indexes)
+        self._adjacent_edges = tuple(self._edges[i] for i in edge_indexes)
+
+        registry = KeyTables()
+        weight_store = graph.weight_store
+        attribute_store = graph.attribute_store
+        self._node_weights = tuple(weight_store.get(node) for node in source_nodes)
+        self._edge_weights = tuple(weight_store.get(edge) for edge, nodes in source_edges)
+        self._node_attributes = tuple(self._compact(registry, attribute_store[node])
+                                      for node in source_nodes)
+        self._edge_attributes = tuple(self._compact(registry, attribute_store[edge])
+                                      for edge, nodes in source_edges)
+
+        self.backend = self
+        self.node_store = FrozenNodeStore(self)
+        self.attribute_store = FrozenAttributeStore(self)
+        self.edge_store = FrozenEdgeStore(self)
+        self.weight_store = FrozenWeightStore(self)
+        self.direction_store = FrozenDirectionStore(self)
+        self.pair_store = FrozenPairStore(self)
+        self.commit_func = None
+        self.abort_func = None
+        self.node_type = graph.node_type
+        self.edge_type = graph.edge_type
+        self._metrics = None
+        self._listeners = []
+        self._components = None
+        self._changes = None
+        self._unmaintained = []
+        self._cache = None
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("'" + self.__class__.__name__ + "' objects are read-only")
+
+    add_node = add_nodes = add_edge = add_edges = _read_only
+    del_node = del_nodes = del_edge = del_edges = compact = _read_only
+    __setitem__ = _set_weight = import_edges = _read_only
+    set_attribute_schema = compact_attributes = _read_only
+    #a frozen graph never changes, so there is nothing to follow.  Listeners
+    #may be added, e.g. by enable_query_cache(), but are never called.
+    subscribe = enable_component_index = _read_only
+
+    def _element(self, element, index):
+        '''
+        Returns:
+            a copy of element belonging to the frozen graph, of a subclass
+            of its class from frozen_class().  It knows its index, so looking
+            it up needs no hashing.
+        '''
+        cls = frozen_class(element.__class__)
+        frozen = cls.__new__(cls)
+        frozen.__dict__.update(graph=self, id=element.id, index=index)
+        return frozen
+
+    def _node_position(self, node):
+        if node.__dict__.get('graph') is self:
+            return node.index
+        return self._node_index[node]
+
+    def _edge_position(self, edge):
+        if edge.__dict__.get('graph') is self:
+            return edge.index
+        return self._edge_index[edge]
+
+    def _position(self, element):
+        '''
+        Returns:
+            a tuple of whether element is a node, and its index
+        '''
+        if element.__dict__.get('graph') is self:
+            index = element.index
+            nodes = self._nodes
+            return index < len(nodes) and nodes[index] is element, index
+        index = self._node_index.get(element)
+        if index is not None:
+            return True, index
+        return False, self._edge_index[element]
+
+    @staticmethod
+    def _compact(registry, attributes):
+        attributes = dict(attributes)
+        return SharedKeyAttributes(registry.get(tuple(attributes)),
+                                   tuple(attributes.values()))
+
+    def freeze(self):
+        """
+        Returns:
+            the graph itself, it is frozen already
+        """
+        return self
+
+    def snapshot(self):
+        """
+        Returns:
+            the graph itself, it never changes
+        """
+        return self
+
+    def scan_adjacency(self):
+        """
+        Returns:
+            an iterator of (node, adjacency) pairs over the whole node_store,
+            as the backend of the frozen graph
+        """
+        return self.node_store.items()
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def close(self):
+        pass
+
+    def degree(self, node):
+        """
+        Returns:
+            the number of edges in the adjacency list of node, that is its
+            undirected edges and the directed edges starting from it
+        """
+        i = self._node_position(node)
+        return self._offsets[i + 1] - self._offsets[i]
+
+    def _pair(self, node1, node2):
+        '''
+        Returns:
+            the start and end of the edges from node1 to node2 in the flat
+            adjacency tuples
+        '''
+        try:
+            i = self._node_position(node1)
+            j = self._node_position(node2)
+        except KeyError:
+            return 0, 0
+        neighbors = self._neighbor_indexes
+        end = self._offsets[i + 1]
+        start = bisect_left(neighbors, j, self._offsets[i], end)
+        return start, bisect_right(neighbors, j, start, end)
+
+
+class FrozenStore():
+    '''
+    Base class for the stores of a frozen graph.
+    '''
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        return (self[key] for key in self.keys())
+
+    def items(self):
+        return ((key, self[key]) for key in self.keys())
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('frozen graphs are read-only')
+
+    __setitem__ = __delitem__ = pop = append = remove = clear = _read_only
+
+
+class FrozenNodeStore(FrozenStore):
+
+    def __getitem__(self, node):
+        graph = self.graph
+        i = graph._node_position(node)
+        offsets = graph._offsets
+        return FrozenAdjacency(graph, i, offsets[i], offsets[i + 1])
+
+    def __contains__(self, node):
+        return node in self.graph._node_index
+
+    def keys(self):
+        return self.graph._nodes
+
+    def __len__(self):
+        return len(self.graph._nodes)
+
+    def items(self):
+        graph = self.graph
+        offsets = graph._offsets
+        return ((node, FrozenAdjacency(graph, i, offsets[i], offsets[i + 1]))
+                for i, node in enumerate(graph._nodes))
+
+
+class FrozenEdgeStore(FrozenStore):
+
+    def __getitem__(self, edge):
+        graph = self.graph
+        i = graph._edge_position(edge)
+        return graph._nodes[graph._sources[i]], graph._nodes[graph._targets[i]]
+
+    def __contains__(self, edge):
+        return edge in self.graph._edge_index
+
+    def keys(self):
+        return self.graph._edges
+
+    def __len__(self):
+        return len(self.graph._edges)
+
+
+class FrozenAttributeStore(FrozenStore):
+
+    def _lookup(self, element):
+        graph = self.graph
+        node, i = graph._position(element)
+        return graph._node_attributes if node else graph._edge_attributes, i
+
+    def __getitem__(self, element):
+        values, i = self._lookup(element)
+        return MappingProxyType(values[i])
+
+    def __contains__(self, element):
+        graph = self.graph
+        return element in graph._node_index or element in graph._edge_index
+
+    def keys(self):
+        return self.graph._nodes + self.graph._edges
+
+    def __len__(self):
+        return len(self.graph._nodes) + len(self.graph._edges)
+
+
+class FrozenWeightStore(FrozenAttributeStore):
+
+    def _lookup(self, element):
+        graph = self.graph
+        node, i = graph._position(element)
+        return graph._node_weights if node else graph._edge_weights, i
+
+    def __getitem__(self, element):
+        values, i = self._lookup(element)
+        return values[i]
+
+
+class FrozenDirectionStore(FrozenStore):
+
+    def __getitem__(self, edge):
+        #a set of the directed edges, read as a mapping of them to True
+        if edge not in self:
+            raise KeyError(edge)
+        return True
+
+    def __contains__(self, edge):
+        graph = self.graph
+        return edge in graph._edge_index and bool(graph._directed[graph._edge_position(edge)])
+
+    def keys(self):
+        graph = self.graph
+        return [edge for edge, directed in zip(graph._edges, graph._directed) if directed]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self.graph._directed_count
+
+
+class FrozenPairStore(FrozenStore):
+
+    def __getitem__(self, pair):
+        start, end = self.graph._pair(*pair)
+        if start == end:
+            raise KeyError(pair)
+        return frozenset(self.graph._adjacent_edges[start:end])
+
+    def __contains__(self, pair):
+        start, end = self.graph._pair(*pair)
+        return start != end
+
+    def keys(self):
+        graph = self.graph
+        neighbors = graph._neighbors
+        offsets = graph._offsets
+        pairs = []
+        for i, node in enumerate(graph._nodes):
+            previous = None
+            for position in range(offsets[i], offsets[i + 1]):
+                neighbor = neighbors[position]
+                if neighbor is not previous:
+                    pairs.append((node, neighbor))
+                    previous = neighbor
+        return pairs
+
+    def __len__(self):
+        return len(self.keys())
+
+
+class FrozenAdjacency():
+    '''
+    The adjacency list of a node of a frozen graph, a slice of the flat
+    adjacency tuples.
+    '''
+
+    __slots__ = ('graph', 'node', 'start', 'end')
+
+    def __init__(self, graph, node, start, end):
+        self.graph = graph
+        self.node = node
+        self.start = start
+        self.end = end
+
+    def __getitem__(self, edge):
+        graph = self.graph
+        i = graph._edge_position(edge)
+        source, target = graph._sources[i], graph._targets[i]
+        if source == self.node:
+            return graph._nodes[target]
+        if target == self.node and not graph._directed[i]:
+            return graph._nodes[source]
+        raise KeyError(edge)
+
+    def __contains__(self, edge):
+        try:
+            self[edge]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, edge, default=None):
+        try:
+            return self[edge]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.graph._adjacent_edges[self.start:self.end]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        return self.graph._neighbors[self.start:self.end]
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def __len__(self):
+        return self.end - self.start
+
+    def copy(self):
+        return dict(self.items())
@@ -0,0 +1,273 @@
+"""
+Opt-in operation metrics for Graph objects.
+
+Instrumentation is switched on per graph with Graph.enable_metrics().  It
+swaps the graph's class for a subclass whose public operations are timed,
+and wraps the graph's stores in counting proxies.  Graph.disable_metrics()
+restores the original class and stores, so a graph that never enabled
+metrics runs exactly the same code as before.
+"""
+import time
+import types
+
+
+#Histogram buckets are powers of two of microseconds: <=1us, <=2us, ... <=~67s
+BUCKETS = tuple(2 ** i / 1000000 for i in range(27))
+
+
+class OperationStats():
+    '''
+    Call count and latency histogram for one operation.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        bucket = 0
+        while bucket < len(BUCKETS) and seconds > BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def as_dict(self):
+        '''
+        Returns:
+            a dictionary with the count, total, mean, min and max latency in
+            seconds, and the histogram as a dictionary of bucket upper bound
+            (in seconds, None for the overflow bucket) to count.  Empty buckets
+            are left out.
+        '''
+        histogram = {}
+        for bucket, count in enumerate(self.histogram):
+            if count:
+                bound = BUCKETS[bucket] if bucket < len(BUCKETS) else None
+                histogram[bound] = count
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'histogram': histogram,
+        }
+
+
+class Metrics():
+    '''
+    Holds the operation statistics and store counters of a graph, and the
+    hooks to call after every timed operation.
+    '''
+
+    def __init__(self):
+        self.operations = {}
+        self.stores = {}
+        self.hooks = []
+
+    def record(self, operation, seconds):
+        try:
+            stats = self.operations[operation]
+        except KeyError:
+            stats = self.operations[operation] = OperationStats()
+        stats.record(seconds)
+        for hook in self.hooks:
+            hook(operation, seconds)
+
+    def as_dict(self):
+        return {
+            'operations': {name: stats.as_dict()
+                           for name, stats in self.operations.items()},
+            'stores': {name: {'reads': store.reads, 'writes': store.writes}
+                       for name, store in self.stores.items()},
+        }
+
+
+class CountingStore():
+    '''
+    Proxy for a graph store that counts reads and writes going through it.
+    '''
+
+    def __init__(self, store):
+        self.__dict__['store'] = store
+        self.__dict__['reads'] = 0
+        self.__dict__['writes'] = 0
+
+    def _read(self):
+        self.__dict__['reads'] += 1
+        return self.store
+
+    def _write(self):
+        self.__dict__['writes'] += 1
+        return self.store
+
+    def __getitem__(self, key):
+        return self._read()[key]
+
+    def __contains__(self, key):
+        return key in self._read()
+
+    def __iter__(self):
+        return iter(self._read())
+
+    def __len__(self):
+        return len(self._read())
+
+    def get(self, key, default=None):
+        return self._read().get(key, default)
+
+    def keys(self):
+        return self._read().keys()
+
+    def values(self):
+        return self._read().values()
+
+    def items(self):
+        return self._read().items()
+
+    def __setitem__(self, key, value):
+        self._write()[key] = value
+
+    def __delitem__(self, key):
+        del self._write()[key]
+
+    def pop(self, key, *default):
+        return self._write().pop(key, *default)
+
+    def append(self, key):
+        self._write().append(key)
+
+    def remove(self, key):
+        self._write().remove(key)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def timed(name, method):
+    '''
+    Returns:
+        a function calling method and recording its latency as operation name
+        in the graph's metrics.  For methods returning a generator, such as
+        traversals, the time spent iterating over it is recorded instead.
+    '''
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException:
+            self._metrics.record(name, time.perf_counter() - start)
+            raise
+        if isinstance(result, types.GeneratorType):
+            return timed_iteration(self._metrics, name, result)
+        self._metrics.record(name, time.perf_counter() - start)
+        return result
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def timed_iteration(metrics, name, iterator):
+    '''
+    Yield the items of iterator, recording the total time spent producing
+    them as operation name once it is exhausted or closed.
+    '''
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        metrics.record(name, elapsed)
+
+
+_instrumented_classes = {}
+
+
+def instrumented_class(cls):
+    '''
+    Returns:
+        a subclass of the graph class cls whose instrumented operations are
+        timed.  The subclass is created once per graph class.
+    '''
+    try:
+        return _instrumented_classes[cls]
+    except KeyError:
+        pass
+    namespace = {'_uninstrumented_class': cls}
+    for name in cls.instrumented_operations:
+        method = getattr(cls, name, None)
+        if method is not None:
+            namespace[name] = timed(name, method)
+    subclass = type('Instrumented' + cls.__name__, (cls,), namespace)
+    _instrumented_classes[cls] = subclass
+    return subclass
+
+
+def unwrap(graph, name):
+    '''
+    Returns:
+        the store name of graph, without its counting proxy while
+        instrumentation is on
+    '''
+    store = getattr(graph, name)
+    if isinstance(store, CountingStore):
+        return store.store
+    return store
+
+
+def replace_store(graph, name, store):
+    '''
+    Replace the store name of graph.  While instrumentation is on the new
+    store goes behind the counting proxy, so disable() restores it.
+    '''
+    counter = getattr(graph, name)
+    if isinstance(counter, CountingStore):
+        counter.__dict__['store'] = store
+    else:
+        setattr(graph, name, store)
+
+
+def enable(graph):
+    '''
+    Switch on instrumentation for graph, keeping any metrics already recorded.
+    '''
+    if getattr(graph, '_uninstrumented_class', None) is not None:
+        return
+    if graph._metrics is None:
+        graph._metrics = Metrics()
+    for name in graph.instrumented_stores:
+        counter = graph._metrics.stores.get(name)
+        if counter is None:
+            counter = graph._metrics.stores[name] = CountingStore(getattr(graph, name))
+        else:
+            counter.__dict__['store'] = getattr(graph, name)
+        setattr(graph, name, counter)
+    graph.__class__ = instrumented_class(graph.__class__)
+
+
+def disable(graph):
+    '''
+    Switch off instrumentation for graph.  The metrics recorded so far are
+    kept, and are still returned by Graph.metrics().
+    '''
+    cls = getattr(graph, '_uninstrumented_class', None)
+    if cls is None:
+        return
+    graph.__class__ = cls
+    for name in graph.instrumented_stores:
+        setattr(graph, name, graph._metrics.stores[name].store)
@@ -0,0 +1,267 @@
+"""
+Memory accounting, and compact attribute storage with shared key tables.
+
+Most elements of a graph tend to have attributes with the same keys, yet
+each attribute dictionary pays for its own hash table.  With
+Graph.compact_attributes(), attributes are instead stored as a tuple of
+values plus a reference to a KeyTable shared by every element with the
+same keys.  An element that gains or loses a key switches to another key
+table, so tables are never changed once shared.
+
+Note:
+    Shared key tables are meant for in-memory graphs.  With the ZODB backend
+    every record would be pickled with its own copy of its key table.
+"""
+import sys
+from collections.abc import Mapping, MutableMapping
+
+from db import Element
+
+
+class KeyTables():
+    '''
+    The registry of the key tables in use, so each set of keys (in order)
+    has a single table.
+    '''
+
+    def __init__(self):
+        self.tables = {}
+
+    def get(self, keys):
+        '''
+        Returns:
+            the KeyTable for the tuple keys
+        '''
+        table = self.tables.get(keys)
+        if table is None:
+            table = self.tables[keys] = KeyTable(self, keys)
+        return table
+
+
+class KeyTable():
+    '''
+    An ordered tuple of attribute keys, with their positions.
+    '''
+
+    __slots__ = ('registry', 'keys', 'index', 'extensions')
+
+    def __init__(self, registry, keys):
+        self.registry = registry
+        self.keys = keys
+        self.index = {key: position for position, key in enumerate(keys)}
+        #the tables with one more key, cached as they are asked for
+        self.extensions = {}
+
+    def extend(self, key):
+        '''
+        Returns:
+            the table with key added at the end
+        '''
+        table = self.extensions.get(key)
+        if table is None:
+            table = self.extensions[key] = self.registry.get(self.keys + (key,))
+        return table
+
+    def without(self, key):
+        '''
+        Returns:
+            the table with key removed
+        '''
+        return self.registry.get(tuple(k for k in self.keys if k != key))
+
+
+class SharedKeyAttributes(MutableMapping):
+    '''
+    The attributes of an element, as a tuple of values whose keys are in a
+    shared KeyTable.  Behaves like the attribute dictionary it replaces.
+    '''
+
+    __slots__ = ('table', 'values')
+
+    def __init__(self, table, values):
+        self.table = table
+        self.values = values
+
+    def __getitem__(self, key):
+        position = self.table.index.get(key)
+        if position is None:
+            raise KeyError(key)
+        return self.values[position]
+
+    def __setitem__(self, key, value):
+        position = self.table.index.get(key)
+        if position is None:
+            self.table = self.table.extend(key)
+            self.values = self.values + (value,)
+        else:
+            values = list(self.values)
+            values[position] = value
+            self.values = tuple(values)
+
+    def __delitem__(self, key):
+        position = self.table.index.get(key)
+        if position is None:
+            raise KeyError(key)
+        self.table = self.table.without(key)
+        self.values = self.values[:position] + self.values[position + 1:]
+
+    def __contains__(self, key):
+        return key in self.table.index
+
+    def __iter__(self):
+        return iter(self.table.keys)
+
+    def __len__(self):
+        return len(self.values)
+
+    def copy(self):
+        return dict(zip(self.table.keys, self.values))
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class SharedKeyAttributeStore():
+    '''
+    An attribute_store converting the attribute dictionaries stored in it
+    to SharedKeyAttributes.
+
+    Args:
+        store: the mapping to keep the attributes in, usually the backend's
+        attribute_store
+        registry (optional): the KeyTables to use
+    '''
+
+    def __init__(self, store, registry=None):
+        self.store = store
+        self.registry = registry if registry is not None else KeyTables()
+
+    def compact(self, attributes):
+        '''
+        Returns:
+            attributes as SharedKeyAttributes
+        '''
+        if isinstance(attributes, SharedKeyAttributes):
+            return attributes
+        attributes = dict(attributes)
+        return SharedKeyAttributes(self.registry.get(tuple(attributes)),
+                                   tuple(attributes.values()))
+
+    def __setitem__(self, element, attributes):
+        self.store[element] = self.compact(attributes)
+
+    def __getitem__(self, element):
+        return self.store[element]
+
+    def __delitem__(self, element):
+        del self.store[element]
+
+    def __contains__(self, element):
+        return element in self.store
+
+    def __iter__(self):
+        return iter(self.store.keys())
+
+    def __len__(self):
+        return len(self.store)
+
+    def get(self, element, default=None):
+        return self.store.get(element, default)
+
+    def pop(self, element, *default):
+        return self.store.pop(element, *default)
+
+    def keys(self):
+        return self.store.keys()
+
+    def values(self):
+        return self.store.values()
+
+    def items(self):
+        return self.store.items()
+
+
+class MemoryCounter():
+    '''
+    Adds up the sizes of objects, counting each object once however often
+    it is referenced.  Elements are counted apart, by their class name.
+    '''
+
+    def __init__(self):
+        self.seen = set()
+        self.elements = {}
+
+    def element(self, element):
+        '''
+        Count the memory of element under its class name.
+
+        Returns:
+            the number of bytes newly counted
+        '''
+        if id(element) in self.seen:
+            return 0
+        self.seen.add(id(element))
+        size = (sys.getsizeof(element) + sys.getsizeof(element.__dict__) +
+                sys.getsizeof(element.id) + sys.getsizeof(element.id.int))
+        name = element.__class__.__name__
+        self.elements[name] = self.elements.get(name, 0) + size
+        return size
+
+    def size(self, obj):
+        '''
+        Returns:
+            the number of bytes of obj and what it contains not counted yet.
+            Elements it contains are counted with element() instead.
+        '''
+        if isinstance(obj, Element):
+            self.element(obj)
+            return 0
+        if id(obj) in self.seen:
+            return 0
+        self.seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        if isinstance(obj, SharedKeyAttributes):
+            size += self.size(obj.values) + self.size(obj.table)
+        elif isinstance(obj, KeyTable):
+            size += self.size(obj.keys) + self.size(obj.index)
+        elif isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+            pass
+        elif isinstance(obj, Mapping):
+            for key, value in obj.items():
+                size += self.size(key) + self.size(value)
+        elif isinstance(obj, (tuple, list, set, frozenset)):
+            for item in obj:
+                size += self.size(item)
+        return size
+
+
+def memory_usage(graph, stores=('node_store', 'attribute_store', 'edge_store',
+                                'weight_store', 'direction_store', 'pair_store')):
+    '''
+    Estimate the memory used by graph, see Graph.memory_usage().
+    '''
+    counter = MemoryCounter()
+    by_store = {}
+    by_type = {}
+    for name in stores:
+        store = getattr(graph, name)
+        #sets of edges like the direction_store have keys but no values
+        items = store.items() if hasattr(store, 'items') else ((key, None) for key in store)
+        total = sys.getsizeof(store)
+        for key, value in items:
+            size = counter.size(key) + counter.size(value)
+            if isinstance(key, Element):
+                type_name = key.__class__.__name__
+                by_type[type_name] = by_type.get(type_name, 0) + size
+            total += size
+        by_store[name] = total
+
+    for type_name, size in counter.elements.items():
+        by_type[type_name] = by_type.get(type_name, 0) + size
+    elements = sum(counter.elements.values())
+    return {
+        'stores': by_store,
+        'elements': elements,
+        'types': by_type,
+        'total': sum(by_store.values()) + elements,
+    }
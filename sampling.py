@@ -0,0 +1,319 @@
+"""
+Batched random walks and neighborhood sampling, e.g. to generate training
+data for graph embeddings and GNN mini-batches.
+
+A Sampler reads the adjacency lists of a graph once into compressed sparse
+row arrays, numbering the nodes from 0, with an alias table per node for
+weighted sampling.  Walks are then generated step by step for a whole batch
+of walkers at once, with numpy, so each step costs a few vectorized array
+operations instead of Python calls per walker.
+
+Walks follow the adjacency lists: undirected edges both ways and directed
+edges from their first node only.  Node2vec walks are biased by rejection
+sampling: a proposed next node is accepted with probability 1/p if it goes
+back to the previous node, 1 if it is a neighbor of the previous node, and
+1/q otherwise (all relative to the largest of the three).
+
+Walks are generated in chunks, each seeded from one numpy SeedSequence, so a
+seed gives the same walks whether they run in this process or across a
+process pool of any size.
+
+This module requires numpy.
+"""
+import itertools
+
+import numpy
+
+
+class Sampler():
+    '''
+    Samples walks and neighborhoods of a graph.
+
+    The graph is read once, so the sampler doesn't follow later changes to
+    it.
+
+    Args:
+        graph: the graph
+        weighted (optional): Boolean value, True to pick the next node in
+        proportion to the weight of the edge leading to it.  A node whose
+        edges all weigh 0 (or None) picks uniformly.
+
+    Raises:
+        ValueError: for a negative edge weight in a weighted sampler
+    '''
+
+    def __init__(self, graph, weighted=False):
+        self.weighted = weighted
+        self.nodes = list(graph.node_store.keys())
+        #numbered by UUID, which is cheaper to hash than the nodes
+        self._numbers = {node.id.int: i for i, node in enumerate(self.nodes)}
+
+        node_store = graph.node_store
+        if node_store is graph.backend.node_store and hasattr(graph.backend, 'scan_adjacency'):
+            adjacencies = graph.backend.scan_adjacency()
+        else:
+            adjacencies = node_store.items()
+
+        size = len(self.nodes)
+        rows = [()] * size
+        row_weights = [()] * size
+        weight_store = graph.weight_store
+        numbers = self._numbers
+        for node, adjacency in adjacencies:
+            i = numbers[node.id.int]
+            rows[i] = [numbers[neighbor.id.int] for neighbor in adjacency.values()]
+            if weighted:
+                row_weights[i] = [weight_store.get(edge) or 0 for edge in adjacency.keys()]
+
+        degrees = numpy.fromiter((len(row) for row in rows), dtype=numpy.int64, count=size)
+        indptr = numpy.zeros(size + 1, dtype=numpy.int64)
+        numpy.cumsum(degrees, out=indptr[1:])
+        indices = numpy.fromiter(itertools.chain.from_iterable(rows),
+                                 dtype=numpy.int64, count=int(indptr[-1]))
+        probability = alias = None
+        if weighted:
+            probability = numpy.ones(len(indices), dtype=numpy.float64)
+            alias = numpy.zeros(len(indices), dtype=numpy.int64)
+            for i, weights in enumerate(row_weights):
+                if weights and min(weights) != max(weights):
+                    start = indptr[i]
+                    prob, local = _alias_table(weights)
+                    probability[start:start + len(weights)] = prob
+                    alias[start:start + len(weights)] = local
+                elif weights and weights[0] < 0:
+                    raise ValueError('edge weights must not be negative')
+        self.tables = Tables(indptr, indices, probability, alias)
+
+    def numbers(self, nodes):
+        '''
+        Args:
+            nodes: an iterable of nodes of the graph
+
+        Returns:
+            an array of their numbers, i.e. their indexes into nodes
+        '''
+        numbers = self._numbers
+        return numpy.fromiter((numbers[node.id.int] for node in nodes), dtype=numpy.int64)
+
+    def to_nodes(self, numbers):
+        '''
+        Args:
+            numbers: an array (of any shape) of node numbers, as returned by
+            walks() or sample_neighbors()
+
+        Returns:
+            the same as nested lists of nodes, leaving out the -1 padding
+        '''
+        nodes = self.nodes
+        numbers = numpy.asarray(numbers)
+        if numbers.ndim == 1:
+            return [nodes[i] for i in numbers.tolist() if i >= 0]
+        return [self.to_nodes(row) for row in numbers]
+
+    def walks(self, length, starts=None, walks_per_node=1, p=1, q=1, seed=None,
+              processes=None, chunk_size=10000):
+        '''
+        Generate random walks.
+
+        Args:
+            length: the number of nodes in each walk, including its start
+            starts (optional): an iterable of the nodes to start from, by
+            default every node
+            walks_per_node (optional): the number of walks from each start
+            p (optional): the node2vec return parameter
+            q (optional): the node2vec in-out parameter
+            seed (optional): an int seed, for reproducible walks
+            processes (optional): the number of worker processes to spread
+            the chunks over, by default the walks run in this process
+            chunk_size (optional): the number of walks per chunk
+
+        Returns:
+            a numpy array of node numbers (see nodes and to_nodes()) with a
+            row per walk: walks_per_node rows for the first start, then for
+            the second, and so on.  Walks reaching a node without neighbors
+            stop there, and the rest of their row is -1.
+        '''
+        if p <= 0 or q <= 0:
+            raise ValueError('p and q must be positive')
+        if starts is None:
+            starts = numpy.arange(len(self.nodes), dtype=numpy.int64)
+        else:
+            starts = self.numbers(starts)
+        starts = numpy.repeat(starts, walks_per_node)
+        chunks = [starts[i:i + chunk_size] for i in range(0, len(starts), chunk_size)]
+        tasks = [(chunk, child, length, p, q) for chunk, child in
+                 zip(chunks, numpy.random.SeedSequence(seed).spawn(len(chunks)))]
+        if not tasks:
+            return numpy.zeros((0, length), dtype=numpy.int64)
+        if processes is None:
+            results = [self.tables.walks(*task) for task in tasks]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(processes, initializer=_set_tables,
+                                     initargs=(self.tables,)) as pool:
+                results = list(pool.map(_walks, tasks))
+        return numpy.concatenate(results)
+
+    def sample_neighbors(self, nodes, fanouts, seed=None):
+        '''
+        Sample fixed size neighborhoods, e.g. for GNN mini-batches.
+
+        Args:
+            nodes: an iterable of the nodes of the batch
+            fanouts: a list of the number of neighbors to sample for each
+            node at each hop, e.g. [10, 5]
+            seed (optional): an int seed, for reproducible samples
+
+        Returns:
+            a list of a numpy array per hop.  The array of hop h has a row per
+            node of the previous hop (the batch for hop 0, else the previous
+            array flattened) holding fanouts[h] neighbors of that node,
+            sampled with replacement.  Nodes without neighbors (and the -1
+            padding) get rows of -1.
+        '''
+        rng = numpy.random.default_rng(seed)
+        frontier = self.numbers(nodes)
+        layers = []
+        for fanout in fanouts:
+            sources = numpy.repeat(frontier, fanout)
+            sampled = self.tables.step(sources, rng)
+            layers.append(sampled.reshape(len(frontier), fanout))
+            frontier = sampled
+        return layers
+
+
+class Tables():
+    '''
+    The arrays a Sampler samples from, picklable to send to worker
+    processes.
+
+    Args:
+        indptr: the offsets of the row of each node in indices
+        indices: the neighbors of every node, row by row
+        probability: for weighted sampling, the alias table probabilities
+        of each entry of indices, or None
+        alias: for weighted sampling, the entry of the row to take instead
+        of each entry, or None
+    '''
+
+    def __init__(self, indptr, indices, probability=None, alias=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.degrees = numpy.diff(indptr)
+        self.probability = probability
+        self.alias = alias
+        self._keys = None
+
+    def step(self, sources, rng):
+        '''
+        Returns:
+            an array of a random neighbor of each of sources, or -1 for
+            sources that are -1 or have no neighbors
+        '''
+        result = numpy.full(len(sources), -1, dtype=numpy.int64)
+        valid = sources >= 0
+        active = numpy.flatnonzero(valid)
+        active = active[self.degrees[sources[active]] > 0]
+        current = sources[active]
+        degrees = self.degrees[current]
+        local = (rng.random(len(current)) * degrees).astype(numpy.int64)
+        #guards against rounding up to the degree
+        numpy.minimum(local, degrees - 1, out=local)
+        entries = self.indptr[current] + local
+        if self.probability is not None:
+            rejected = rng.random(len(current)) >= self.probability[entries]
+            entries[rejected] = self.indptr[current[rejected]] + self.alias[entries[rejected]]
+        result[active] = self.indices[entries]
+        return result
+
+    def _neighbors(self, sources, targets):
+        '''
+        Returns:
+            a boolean array, True where targets is a neighbor of sources
+        '''
+        if self._keys is None:
+            size = len(self.degrees)
+            rows = numpy.repeat(numpy.arange(size, dtype=numpy.int64), self.degrees)
+            self._keys = numpy.sort(rows * size + self.indices)
+        keys = sources * len(self.degrees) + targets
+        positions = numpy.searchsorted(self._keys, keys)
+        found = positions < len(self._keys)
+        found[found] = self._keys[positions[found]] == keys[found]
+        return found
+
+    def walks(self, starts, seed, length, p=1, q=1):
+        '''
+        Returns:
+            an array of a walk of length nodes from each of starts, seeded
+            with seed (anything numpy.random.default_rng() takes)
+        '''
+        rng = numpy.random.default_rng(seed)
+        walks = numpy.full((len(starts), length), -1, dtype=numpy.int64)
+        if length == 0:
+            return walks
+        walks[:, 0] = starts
+        biased = p != 1 or q != 1
+        bias = numpy.array([1 / p, 1.0, 1 / q])
+        bias /= bias.max()
+        for position in range(1, length):
+            current = walks[:, position - 1]
+            if not biased or position == 1:
+                walks[:, position] = self.step(current, rng)
+                continue
+            previous = walks[:, position - 2]
+            pending = numpy.flatnonzero(current >= 0)
+            pending = pending[self.degrees[current[pending]] > 0]
+            while len(pending):
+                proposed = self.step(current[pending], rng)
+                back = previous[pending]
+                #0 returns to the previous node, 1 stays at its distance 1,
+                #2 moves away from it
+                distance = numpy.where(self._neighbors(back, proposed), 1, 2)
+                distance[proposed == back] = 0
+                accepted = rng.random(len(pending)) < bias[distance]
+                walks[pending[accepted], position] = proposed[accepted]
+                pending = pending[~accepted]
+        return walks
+
+
+def _alias_table(weights):
+    '''
+    Build the alias table of weights with Vose's method.
+
+    Returns:
+        a list of the probability of keeping each entry, and a list of the
+        entry to take instead
+    '''
+    if min(weights) < 0:
+        raise ValueError('edge weights must not be negative')
+    size = len(weights)
+    total = sum(weights)
+    scaled = [weight * size / total for weight in weights]
+    probability = [1.0] * size
+    alias = list(range(size))
+    small = [i for i, value in enumerate(scaled) if value < 1]
+    large = [i for i, value in enumerate(scaled) if value >= 1]
+    while small and large:
+        less = small.pop()
+        more = large[-1]
+        probability[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1 - scaled[less]
+        if scaled[more] < 1:
+            small.append(large.pop())
+    return probability, alias
+
+
+_tables = None
+
+
+def _set_tables(tables):
+    '''
+    Initialize a worker process with the tables to sample from.
+    '''
+    global _tables
+    _tables = tables
+
+
+def _walks(task):
+    return _tables.walks(*task)
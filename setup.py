@@ -4,8 +4,14 @@ setup(
     version = "0.03",
     description = "A simple Graph Processing System",
     author = "James Lee Vann",
-    py_modules = ['db', 'backends', 'weighted_graph'],
+    py_modules = ['db', 'backends', 'weighted_graph', 'instrumentation',
+                  'views', 'columnar', 'components',
+                  'changefeed', 'bulk', 'memory', 'frozen', 'triangles',
+                  'sampling', 'cache'],
     extras_require = {
         'ZODB Storage':  ["ZODB"],
+        'Columnar Attributes':  ["numpy"],
+        'Sparse Matrices':  ["scipy"],
+        'Sampling':  ["numpy"],
     }
 )
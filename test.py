@@ -1,12 +1,26 @@
 import unittest
 import tempfile
+import itertools
+import os
+import random
+import subprocess
+import sys
+import io
+import collections
+import gc
+import threading
+import json
 
 from tempfile import NamedTemporaryFile
 from ZODB import DB, config
 from ZODB.FileStorage import FileStorage
 
 from db import Graph, Element, Edge, Node
-from backends import DictionaryBackend, ZODBBTreeBackend
+import backends
+from backends import DictionaryBackend, ZODBBTreeBackend, ShardedBackend
+from backends.mvcc import Versions, VersionedDict
+from weighted_graph import WeightedGraph
+from triangles import TriangleCounter
 
 
 class TestGraph(unittest.TestCase):
@@ -124,6 +138,244 @@ class TestGraph(unittest.TestCase):
         for a in self.g.attribute_store:
             self.assertIn(e,[node,node2,node3,edge,edge3])
 
+    def test_del_edge_cleanup(self):
+        nodes = self.g.add_nodes(2)
+        edge = self.g.add_edge(nodes[0], nodes[1], directed=True, weight=3)
+        self.g.del_edge(edge)
+        self.assertNotIn(edge, self.g.weight_store)
+        self.assertNotIn(edge, self.g.direction_store)
+        self.assertEqual(len(self.g.node_store[nodes[0]]), 0)
+
+    def test_del_node_directed(self):
+        nodes = self.g.add_nodes(2)
+        edge = self.g.add_edge(nodes[0], nodes[1], directed=True)
+        self.g.del_node(nodes[1])
+        self.assertNotIn(edge, self.g.edges)
+        self.assertNotIn(edge, self.g.node_store[nodes[0]])
+        self.assertNotIn(nodes[1], self.g.weight_store)
+
+    def test_del_nodes(self):
+        nodes = self.g.add_nodes(4)
+        e1 = self.g.add_edge(nodes[0], nodes[1])
+        e2 = self.g.add_edge(nodes[1], nodes[2], directed=True)
+        e3 = self.g.add_edge(nodes[2], nodes[3])
+        self.g.del_nodes(nodes[1:3])
+        self.assertEqual(sorted(self.g.nodes), sorted([nodes[0], nodes[3]]))
+        self.assertEqual(list(self.g.edges), [])
+        self.assertEqual(sorted(self.g), sorted([nodes[0], nodes[3]]))
+        self.assertEqual(sorted(self.g.weight_store.keys()),
+                         sorted([nodes[0], nodes[3]]))
+        self.assertEqual(len(self.g.direction_store), 0)
+        self.assertEqual(len(self.g.incoming_store), 0)
+        self.assertEqual(len(self.g.node_store[nodes[0]]), 0)
+
+    def test_del_node_incoming(self):
+        nodes = self.g.add_nodes(3)
+        e1 = self.g.add_edge(nodes[0], nodes[2], directed=True)
+        e2 = self.g.add_edge(nodes[1], nodes[2], directed=True)
+        e3 = self.g.add_edge(nodes[2], nodes[0], directed=True)
+        self.assertEqual(dict(self.g.incoming_store[nodes[2]]),
+                         {e1: nodes[0], e2: nodes[1]})
+        self.g.del_edge(e2)
+        self.assertEqual(dict(self.g.incoming_store[nodes[2]]), {e1: nodes[0]})
+        self.g.del_node(nodes[2])
+        self.assertEqual(list(self.g.edges), [])
+        self.assertEqual(len(self.g.incoming_store), 0)
+        self.assertEqual(len(self.g.node_store[nodes[0]]), 0)
+
+    def test_del_edges(self):
+        nodes = self.g.add_nodes(3)
+        e1 = self.g.add_edge(nodes[0], nodes[1])
+        e2 = self.g.add_edge(nodes[1], nodes[2])
+        e3 = self.g.add_edge(nodes[0], nodes[2])
+        self.g.del_edges([e1, e2])
+        self.assertEqual(list(self.g.edges), [e3])
+        self.assertEqual(list(nodes[1].edges), [])
+
+    def test_compact(self):
+        nodes = self.g.add_nodes(3)
+        edge = self.g.add_edge(nodes[0], nodes[1], directed=True)
+        #orphans as left behind by older versions
+        del self.g.node_store[nodes[1]]
+        del self.g.attribute_store[nodes[1]]
+        del self.g.attribute_store[nodes[2]]
+        del self.g.node_store[nodes[2]]
+        self.assertEqual(self.g.compact(), 8)
+        self.assertEqual(len(self.g.pair_store), 0)
+        self.assertEqual(list(self.g.nodes), [nodes[0]])
+        self.assertEqual(list(self.g), [nodes[0]])
+        self.assertEqual(list(self.g.weight_store.keys()), [nodes[0]])
+        self.assertEqual(len(self.g.direction_store), 0)
+        self.assertEqual(len(self.g.node_store[nodes[0]]), 0)
+        self.assertEqual(self.g.compact(), 0)
+
+    def test_compact_reindex(self):
+        nodes = self.g.add_nodes(2)
+        edge = self.g.add_edge(nodes[0], nodes[1])
+        #an edge added before the pair_store existed
+        del self.g.pair_store[(nodes[0], nodes[1])]
+        del self.g.pair_store[(nodes[1], nodes[0])]
+        self.g.compact()
+        self.assertEqual(self.g.edges_between(nodes[1], nodes[0]), {edge})
+
+    def test_compact_reindex_incoming(self):
+        nodes = self.g.add_nodes(2)
+        edge = self.g.add_edge(nodes[0], nodes[1], directed=True)
+        #a directed edge added before the incoming_store existed
+        del self.g.incoming_store[nodes[1]]
+        self.g.compact()
+        self.g.del_node(nodes[1])
+        self.assertEqual(list(self.g.edges), [])
+        self.assertEqual(len(self.g.node_store[nodes[0]]), 0)
+
+    def test_has_edge(self):
+        nodes = self.g.add_nodes(3)
+        e1 = self.g.add_edge(nodes[0], nodes[1])
+        e2 = self.g.add_edge(nodes[1], nodes[2], directed=True)
+        self.assertTrue(self.g.has_edge(nodes[0], nodes[1]))
+        self.assertTrue(self.g.has_edge(nodes[1], nodes[0]))
+        self.assertTrue(self.g.has_edge(nodes[1], nodes[2]))
+        self.assertFalse(self.g.has_edge(nodes[2], nodes[1]))
+        self.assertFalse(self.g.has_edge(nodes[0], nodes[2]))
+        self.g.del_edge(e1)
+        self.assertFalse(self.g.has_edge(nodes[0], nodes[1]))
+        self.g.del_node(nodes[2])
+        self.assertFalse(self.g.has_edge(nodes[1], nodes[2]))
+        self.assertEqual(len(self.g.pair_store), 0)
+
+    def test_edges_between(self):
+        nodes = self.g.add_nodes(2)
+        e1 = self.g.add_edge(nodes[0], nodes[1])
+        e2 = self.g.add_edge(nodes[1], nodes[0])
+        e3 = self.g.add_edge(nodes[0], nodes[1], directed=True)
+        self.assertEqual(self.g.edges_between(nodes[0], nodes[1]), {e1, e2, e3})
+        self.assertEqual(self.g.edges_between(nodes[1], nodes[0]), {e1, e2})
+        self.g.del_edge(e2)
+        self.assertEqual(self.g.edges_between(nodes[1], nodes[0]), {e1})
+
+    def test_pair_store(self):
+        nodes = self.g.add_nodes(2)
+        e1 = self.g.add_edge(nodes[0], nodes[1])
+        #a single edge is stored as is, parallel edges in a frozenset
+        self.assertEqual(self.g.pair_store[(nodes[1], nodes[0])], e1)
+        e2 = self.g.add_edge(nodes[0], nodes[1])
+        self.assertEqual(self.g.pair_store[(nodes[1], nodes[0])], {e1, e2})
+        self.g.del_edge(e1)
+        self.assertEqual(self.g.pair_store[(nodes[1], nodes[0])], e2)
+        #as stored by older versions
+        self.g.pair_store[(nodes[0], nodes[1])] = frozenset([e2])
+        self.assertEqual(self.g.edges_between(nodes[0], nodes[1]), {e2})
+        self.assertEqual(self.g.compact(), 0)
+        self.assertEqual(self.g.pair_store[(nodes[0], nodes[1])], e2)
+
+    def test_add_edge_unique(self):
+        nodes = self.g.add_nodes(2)
+        e1 = self.g.add_edge(nodes[0], nodes[1], {'a': 1}, unique=True)
+        e2 = self.g.add_edge(nodes[1], nodes[0], {'b': 2}, weight=3, unique=True)
+        self.assertEqual(e1, e2)
+        self.assertEqual(self.g[e1], {'a': 1, 'b': 2})
+        self.assertEqual(e1.weight, 3)
+        e3 = self.g.add_edge(nodes[0], nodes[1], directed=True, unique=True)
+        self.assertNotEqual(e1, e3)
+        self.assertEqual(len(list(self.g.edges)), 2)
+
+    def test_khop(self):
+        n = self.g.add_nodes(6)
+        self.g.add_edge(n[0], n[1])
+        self.g.add_edge(n[1], n[2], weight=5)
+        self.g.add_edge(n[2], n[3])
+        self.g.add_edge(n[0], n[4], directed=True)
+        self.g.add_edge(n[5], n[0], directed=True)
+        levels = list(self.g.khop([n[0]], 2))
+        self.assertEqual(levels, [(0, {n[0]}), (1, {n[1], n[4]}), (2, {n[2]})])
+        levels = list(self.g.khop([n[2]], 5))
+        self.assertEqual(levels, [(0, {n[2]}), (1, {n[1], n[3]}), (2, {n[0]}),
+                                  (3, {n[4]})])
+
+    def test_khop_filters(self):
+        n = self.g.add_nodes(5)
+        self.g.add_edge(n[0], n[1])
+        self.g.add_edge(n[1], n[2], weight=5)
+        self.g.add_edge(n[0], n[3], directed=True)
+        self.g[n[4]] = {'skip': True}
+        self.g.add_edge(n[0], n[4])
+        levels = dict(self.g.khop([n[0]], 3, directed=False))
+        self.assertEqual(levels[1], {n[1], n[4]})
+        levels = dict(self.g.khop([n[0]], 3, max_weight=1,
+                                  node_filter=lambda node: 'skip' not in node.graph[node]))
+        self.assertEqual(levels, {0: {n[0]}, 1: {n[1], n[3]}})
+        levels = dict(self.g.khop([n[0]], 3, min_weight=1, directed=False))
+        self.assertEqual(levels, {0: {n[0]}})
+        levels = list(self.g.khop([n[0]], 3, max_nodes=2))
+        self.assertEqual(sum(len(nodes) for depth, nodes in levels), 2)
+        levels = dict(self.g.khop([n[0]], 1, fanout=1))
+        self.assertEqual(len(levels[1]), 1)
+
+    def test_aggregate_neighbors(self):
+        n = self.g.add_nodes(4)
+        self.g[n[1]] = {'type': 'a', 'age': 10}
+        self.g[n[2]] = {'type': 'a', 'age': 20}
+        self.g[n[3]] = {'type': 'b', 'age': 30}
+        self.g.add_edge(n[0], n[1], weight=1)
+        self.g.add_edge(n[0], n[2], weight=2)
+        self.g.add_edge(n[0], n[3], weight=4, directed=True)
+        counts = self.g.aggregate_neighbors()
+        self.assertEqual(counts, {n[0]: 3, n[1]: 1, n[2]: 1, n[3]: 0})
+        weights = self.g.aggregate_neighbors('sum', of='weight')
+        self.assertEqual(weights[n[0]], 7)
+        self.assertEqual(weights[n[1]], 1)
+        grouped = self.g.aggregate_neighbors(group_by='type', nodes=[n[0]])
+        self.assertEqual(grouped, {n[0]: {'a': 2, 'b': 1}})
+        means = self.g.aggregate_neighbors('mean', of='age', where={'type': 'a'})
+        self.assertEqual(means[n[0]], 15)
+        self.assertEqual(means[n[1]], None)
+        self.assertEqual(self.g.aggregate_neighbors('max', of='age')[n[0]], 30)
+        self.assertEqual(self.g.aggregate_neighbors('min', of='weight')[n[0]], 1)
+
+    def test_components(self):
+        n = self.g.add_nodes(5)
+        self.g.enable_component_index()
+        e1 = self.g.add_edge(n[0], n[1])
+        e2 = self.g.add_edge(n[1], n[2], directed=True)
+        self.g.add_edge(n[3], n[4])
+        self.assertTrue(self.g.same_component(n[0], n[2]))
+        self.assertFalse(self.g.same_component(n[0], n[3]))
+        self.assertEqual(self.g.component_size(n[2]), 3)
+        self.assertEqual(sorted(self.g.component_sizes().values()), [2, 3])
+        self.assertEqual(self.g.component_of(n[0]), self.g.component_of(n[2]))
+        self.g.del_edge(e2)
+        self.assertFalse(self.g.same_component(n[0], n[2]))
+        self.assertEqual(sorted(self.g.component_sizes().values()), [1, 2, 2])
+        node = self.g.add_node()
+        self.g.add_edge(node, n[2])
+        self.assertEqual(self.g.component_size(node), 2)
+        self.g.del_node(n[0])
+        self.assertEqual(self.g.component_size(n[1]), 1)
+
+    def test_components_other_graphs(self):
+        #a graph created before the index is enabled clears it
+        early = Graph(self.g.backend)
+        self.g.enable_component_index()
+        a, b = self.g.add_node(), self.g.add_node()
+        c = early.add_node()
+        early.add_edge(a, c)
+        self.assertFalse(self.g.same_component(a, b))
+        self.assertTrue(self.g.same_component(a, c))
+        self.g.add_edge(a, b)
+        self.assertEqual(self.g.component_size(b), 3)
+        #one created after keeps it up to date
+        weighted = WeightedGraph(self.g.backend)
+        d = weighted.add_node()
+        weighted.add_edge(d, b)
+        self.assertEqual(len(self.g.backend.component_store), 4)
+        self.assertEqual(self.g.component_size(a), 4)
+        self.assertTrue(weighted.same_component(d, c))
+
+    def test_components_disabled(self):
+        node = self.g.add_node()
+        with self.assertRaises(ValueError):
+            self.g.component_of(node)
+
     def test_graph(self):
         n1 = self.g.add_node()
         n2 = self.g.add_node()
@@ -148,12 +400,1387 @@ class TestGraphZODB(TestGraph):
 
     def setUp(self):
 
-        storage = FileStorage(NamedTemporaryFile().name)
-        db = DB(storage)
+        self.storage = FileStorage(NamedTemporaryFile().name)
+        db = DB(self.storage)
         connection = db.open()
         root = connection.root
         self.g = Graph(backend=ZODBBTreeBackend(root))
 
+    def transactions(self):
+        return len(list(self.storage.iterator()))
+
+    def test_del_commits(self):
+        nodes = self.g.add_nodes(10)
+        edges = [self.g.add_edge(nodes[i], nodes[i + 1], directed=i % 2)
+                 for i in range(9)]
+        committed = self.transactions()
+        self.g.del_edges(edges[:3])
+        self.assertEqual(self.transactions(), committed + 1)
+        self.g.del_nodes(nodes[5:])
+        self.assertEqual(self.transactions(), committed + 2)
+        self.assertEqual(list(self.g.edges), [edges[3]])
+
+    def test_components_reopen(self):
+        path = NamedTemporaryFile().name
+
+        def open_graph():
+            return Graph(ZODBBTreeBackend(DB(FileStorage(path)).open().root))
+
+        g = open_graph()
+        g.enable_component_index()
+        nodes = g.add_nodes(4)
+        g.add_edge(nodes[0], nodes[1])
+        g.add_edge(nodes[2], nodes[3])
+        self.assertFalse(g.same_component(nodes[0], nodes[3]))
+        g.backend.connection.db().close()
+
+        #a session without the index joins the components
+        g = open_graph()
+        g.add_edge(nodes[1], nodes[2])
+        g.backend.connection.db().close()
+
+        g = open_graph()
+        g.enable_component_index()
+        self.assertTrue(g.same_component(nodes[0], nodes[3]))
+        self.assertEqual(g.component_size(nodes[0]), 4)
+        g.backend.connection.db().close()
+
+    def test_reopen(self):
+        path = NamedTemporaryFile().name
+
+        def open_graph():
+            return Graph(ZODBBTreeBackend(DB(FileStorage(path)).open().root))
+
+        g = open_graph()
+        nodes = g.add_nodes(2)
+        edge = g.add_edge(nodes[0], nodes[1])
+        graph_id = g.backend.graph_id
+        g.backend.connection.db().close()
+
+        g = open_graph()
+        self.assertEqual(g.backend.graph_id, graph_id)
+        #the elements read back belong to the graph opened last
+        node = [node for node in g.nodes if node == nodes[0]][0]
+        self.assertIs(node.graph, g)
+        self.assertIs(list(node.neighbors)[0].graph, g)
+        self.assertEqual(list(node.neighbors), [nodes[1]])
+        self.assertIn(edge, g.edge_store)
+        g.backend.connection.db().close()
+
+class TestGraphSnapshots(TestGraph):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend(snapshots=True))
+        #writes keep versions for the open snapshot
+        self.snapshot = self.g.snapshot()
+
+    def tearDown(self):
+        self.snapshot.close()
+
+class TestGraphSharded(TestGraph):
+
+    def setUp(self):
+        self.g = Graph(backend=ShardedBackend([DictionaryBackend()
+                                                for i in range(3)]))
+
+    def test_shards(self):
+        nodes = self.g.add_nodes(30)
+        for idx, val in enumerate(nodes[1:]):
+            self.g.add_edge(nodes[idx], val)
+        for shard in self.g.backend.backends:
+            self.assertTrue(len(shard.node_store) > 0)
+        for node in nodes:
+            self.assertIn(node, self.g.backend.shard_of(node).node_store)
+        for edge in self.g.edges:
+            node1, node2 = edge.nodes
+            self.assertIn(edge, self.g.backend.shard_of(node1).node_store[node1])
+            self.assertIn(edge, self.g.backend.shard_of(node2).node_store[node2])
+        self.assertEqual(len(list(self.g.nodes)), 30)
+        self.assertEqual(len(list(self.g.edges)), 29)
+
+class TestGraphShardedZODB(TestGraphSharded):
+
+    def setUp(self):
+        backends = []
+        for i in range(3):
+            storage = FileStorage(NamedTemporaryFile().name)
+            db = DB(storage)
+            connection = db.open()
+            backends.append(ZODBBTreeBackend(connection.root))
+        self.g = Graph(backend=ShardedBackend(backends))
+
+    def test_reopen(self):
+        paths = [NamedTemporaryFile().name for i in range(3)]
+
+        def open_graph():
+            return Graph(ShardedBackend([ZODBBTreeBackend(DB(FileStorage(path)).open().root)
+                                         for path in paths]))
+
+        g = open_graph()
+        nodes = g.add_nodes(12, {'key': 'value'})
+        edges = [g.add_edge(node1, node2, {'keye': 'valuee'}, weight=i)
+                 for i, (node1, node2) in enumerate(zip(nodes, nodes[1:]))]
+        directed = g.add_edge(nodes[0], nodes[5], directed=True)
+        g[nodes[3]] = {'key': 'other'}
+        g.del_node(nodes[11])
+        for backend in g.backend.backends:
+            backend.connection.db().close()
+
+        g = open_graph()
+        self.assertEqual(sorted(g.nodes), sorted(nodes[:11]))
+        self.assertEqual(sorted(g.edges), sorted(edges[:10] + [directed]))
+        for node in nodes[:11]:
+            self.assertIn(node, g.backend.shard_of(node).node_store)
+        self.assertEqual(g[nodes[3]], {'key': 'other'})
+        self.assertEqual(g[edges[2]], {'keye': 'valuee'})
+        node = [node for node in g.nodes if node == nodes[0]][0]
+        self.assertIs(node.graph, g)
+        self.assertEqual(sorted(node.neighbors), sorted([nodes[1], nodes[5]]))
+        edge = [edge for edge in g.edges if edge == directed][0]
+        self.assertTrue(edge.directed)
+        self.assertEqual(list(edge.nodes), [nodes[0], nodes[5]])
+        self.assertEqual(g.weight_store[edges[4]], 4)
+        for backend in g.backend.backends:
+            backend.connection.db().close()
+
+class TestOpen(unittest.TestCase):
+
+    def test_memory(self):
+        g = Graph.open('memory://')
+        self.assertIsInstance(g.backend, DictionaryBackend)
+        self.assertIsInstance(WeightedGraph.open('memory://'), WeightedGraph)
+
+    def test_zodb(self):
+        self.assertIsInstance(Graph.open('zodb://').backend, ZODBBTreeBackend)
+        path = NamedTemporaryFile(suffix='.fs').name
+        g = Graph.open('zodb://' + path)
+        self.assertIsInstance(g.backend, ZODBBTreeBackend)
+        node = g.add_node({'a': 1})
+        self.assertEqual(g[node], {'a': 1})
+        g.close()
+
+    def test_zodb_reopen(self):
+        url = 'zodb://' + NamedTemporaryFile(suffix='.fs').name
+        g = Graph.open(url)
+        nodes = g.add_nodes(2, {'a': 1})
+        edge = g.add_edge(nodes[0], nodes[1], {'b': 2}, directed=True, weight=3)
+        nodes[1]['a'] = 4
+        g.commit()
+        g.close()
+        with Graph.open(url) as g:
+            self.assertEqual(sorted(g.nodes), sorted(nodes))
+            self.assertEqual(list(g.edges), [edge])
+            self.assertEqual(g[nodes[0]], {'a': 1})
+            self.assertEqual(g[nodes[1]], {'a': 4})
+            self.assertEqual(g[edge], {'b': 2})
+            self.assertEqual(list(g.node_store[nodes[0]].values()), [nodes[1]])
+            self.assertIn(edge, g.direction_store)
+            self.assertEqual(g.weight_store[edge], 3)
+            g.add_node()
+        #closed, so the FileStorage can be opened again
+        with Graph.open(url) as g:
+            self.assertEqual(len(list(g.nodes)), 3)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            Graph.open('memory')
+        with self.assertRaises(ValueError):
+            Graph.open('nosuchbackend://')
+
+    def test_register(self):
+        opened = []
+        def opener(url):
+            opened.append(url)
+            return DictionaryBackend()
+        backends.register_backend('test', opener)
+        backends.register_backend('test2', 'backends.in_memory:open_url')
+        try:
+            Graph.open('test://somewhere')
+            self.assertEqual(opened, ['test://somewhere'])
+            self.assertIsInstance(Graph.open('test2://').backend, DictionaryBackend)
+        finally:
+            del backends._openers['test']
+            del backends._openers['test2']
+
+    def test_lazy_import(self):
+        code = ("import sys, db; db.Graph.open('memory://'); "
+                "sys.exit('ZODB' in sys.modules or 'BTrees' in sys.modules)")
+        here = os.path.dirname(os.path.abspath(__file__))
+        self.assertEqual(subprocess.call([sys.executable, '-c', code], cwd=here), 0)
+
+class TestWeightedGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.g = WeightedGraph(DictionaryBackend())
+
+    def populate(self):
+        self.nodes = [self.g.add_node(weight=w) for w in (5, 1, 3, 3, 8, 0)]
+        n = self.nodes
+        self.edges = [self.g.add_edge(n[i], n[i + 1], weight=w)
+                      for i, w in enumerate((2, 9, 2, 7, 4))]
+
+    def sorted_by_weight(self, elements, reverse=False):
+        return sorted(elements, key=lambda e: (e.weight, e), reverse=reverse)
+
+    def test_top_k(self):
+        self.populate()
+        self.assertEqual(self.g.top_k_nodes(3),
+                         self.sorted_by_weight(self.nodes, True)[:3])
+        self.assertEqual(self.g.top_k_nodes(2, lightest=True),
+                         self.sorted_by_weight(self.nodes)[:2])
+        self.assertEqual(self.g.top_k_edges(10),
+                         self.sorted_by_weight(self.edges, True))
+        self.assertEqual(self.g.top_k_edges(3, lightest=True),
+                         self.sorted_by_weight(self.edges)[:3])
+
+    def test_weight_range(self):
+        self.populate()
+        self.assertEqual(list(self.g.weight_range(2, 3, elements='nodes')),
+                         self.sorted_by_weight(self.nodes[2:4]))
+        self.assertEqual(list(self.g.weight_range(2, 4, elements='edges')),
+                         self.sorted_by_weight([self.edges[0], self.edges[2],
+                                                self.edges[4]]))
+        self.assertEqual(list(self.g.weight_range(hi=1)),
+                         self.sorted_by_weight(self.nodes[1::4]))
+        self.assertEqual(len(list(self.g.weight_range(lo=7))), 3)
+        self.assertEqual(len(list(self.g.weight_range())), 11)
+        with self.assertRaises(ValueError):
+            self.g.weight_range(elements='both')
+
+    def test_sync(self):
+        self.populate()
+        n, e = self.nodes, self.edges
+        n[1].weight = 10
+        self.assertEqual(self.g.top_k_nodes(1), [n[1]])
+        self.g.add_edge(n[0], n[1], weight=1, unique=True)
+        self.assertEqual(self.g.top_k_edges(1, lightest=True), [e[0]])
+        self.g.del_edge(e[1])
+        self.assertNotIn(e[1], self.g.top_k_edges(10))
+        self.g.del_node(n[4])
+        self.assertNotIn(n[4], self.g.top_k_nodes(10))
+        self.assertNotIn(e[3], self.g.top_k_edges(10))
+        self.assertEqual(self.g.top_k_edges(10),
+                         self.sorted_by_weight(self.g.edges, True))
+        self.assertEqual(self.g.top_k_nodes(10),
+                         self.sorted_by_weight(self.g.nodes, True))
+        self.assertEqual(len(self.g.node_weight_index), 5)
+
+    def test_rebuild(self):
+        plain = Graph(self.g.backend)
+        nodes = [plain.add_node(weight=w) for w in (4, 2, 6)]
+        g = WeightedGraph(self.g.backend)
+        self.assertEqual(g.top_k_nodes(3), [nodes[2], nodes[0], nodes[1]])
+
+    def test_stale(self):
+        nodes = [self.g.add_node(weight=w) for w in (4, 2, 6)]
+        #a graph not maintaining the indexes changes the weights
+        plain = Graph(self.g.backend)
+        nodes.append(plain.add_node(weight=5))
+        plain._set_weight(nodes[1], 8)
+        g = WeightedGraph(self.g.backend)
+        self.assertEqual(g.top_k_nodes(4), [nodes[1], nodes[2], nodes[3], nodes[0]])
+
+    def test_stale_in_use(self):
+        node = self.g.add_node(weight=1)
+        edge = self.g.add_edge(node, self.g.add_node(), weight=3)
+        Graph(self.g.backend).add_node()
+        self.assertEqual(self.g.top_k_edges(1), [edge])
+        self.assertEqual(list(self.g.weight_range(3, 3)), [edge])
+        self.g.del_node(node)
+        self.assertEqual(self.g.top_k_edges(1), [])
+        self.assertEqual(len(self.g.top_k_nodes(3)), 2)
+
+class TestWeightedGraphZODB(TestWeightedGraph):
+
+    def setUp(self):
+        storage = FileStorage(NamedTemporaryFile().name)
+        db = DB(storage)
+        connection = db.open()
+        self.g = WeightedGraph(ZODBBTreeBackend(connection.root))
+
+class TestWeightedGraphSharded(TestWeightedGraph):
+
+    def setUp(self):
+        self.g = WeightedGraph(ShardedBackend([DictionaryBackend()
+                                               for i in range(3)]))
+
+class TestWeightIndex(unittest.TestCase):
+
+    def test_chunks(self):
+        from backends.in_memory import WeightIndex
+        index = WeightIndex()
+        index.load = 2
+        keys = [(weight, i) for i, weight in enumerate([3, 1, 4, 1, 5, 9, 2, 6, 5, 3])]
+        for key in keys:
+            index.add(key)
+        self.assertTrue(len(index.chunks) > 1)
+        self.assertEqual(list(index), sorted(keys))
+        for key in keys[::3]:
+            index.remove(key)
+            keys.remove(key)
+        with self.assertRaises(KeyError):
+            index.remove((7, 0))
+        self.assertEqual(len(index), len(keys))
+        self.assertIn(keys[0], index)
+        self.assertEqual(list(index.ascending(2, 5)),
+                         sorted(key for key in keys if 2 <= key[0] <= 5))
+        self.assertEqual(list(index.descending(2, 5)),
+                         sorted((key for key in keys if 2 <= key[0] <= 5), reverse=True))
+        self.assertEqual(list(index.descending()), sorted(keys, reverse=True))
+
+class TestSubgraph(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+        self.nodes = self.g.add_nodes(4, {'key': 'value'})
+        n = self.nodes
+        self.e1 = self.g.add_edge(n[0], n[1], {'keye': 'valuee'})
+        self.e2 = self.g.add_edge(n[1], n[2], directed=True, weight=5)
+        self.e3 = self.g.add_edge(n[2], n[3])
+
+    def test_subgraph(self):
+        n = self.nodes
+        sub = self.g.subgraph(n[:3])
+        self.assertEqual(sorted(sub.nodes), sorted(n[:3]))
+        self.assertEqual(sorted(sub.edges), sorted([self.e1, self.e2]))
+        self.assertEqual(sorted(sub), sorted(n[:3] + [self.e1, self.e2]))
+        self.assertEqual(sub[self.e1], {'keye': 'valuee'})
+        with self.assertRaises(KeyError):
+            sub[n[3]]
+
+    def test_elements(self):
+        n = self.nodes
+        sub = self.g.subgraph(n[1:])
+        for node in sub.nodes:
+            self.assertIs(node.graph, sub)
+        node2 = [node for node in sub.nodes if node == n[2]][0]
+        self.assertEqual(list(node2.neighbors), [n[3]])
+        self.assertEqual(list(node2.edges), [self.e3])
+        edge = [e for e in sub.edges if e == self.e2][0]
+        self.assertTrue(edge.directed)
+        self.assertEqual(edge.weight, 5)
+        self.assertEqual(list(edge.nodes), [n[1], n[2]])
+        self.assertEqual(node2['key'], 'value')
+
+    def test_has_edge(self):
+        n = self.nodes
+        sub = self.g.subgraph(n[:3])
+        self.assertTrue(sub.has_edge(n[0], n[1]))
+        self.assertTrue(sub.has_edge(n[1], n[2]))
+        self.assertFalse(sub.has_edge(n[2], n[3]))
+        self.assertEqual(sub.edges_between(n[1], n[0]), {self.e1})
+        self.assertEqual(len(sub.pair_store), 3)
+
+    def test_khop(self):
+        n = self.nodes
+        sub = self.g.subgraph(n[:3])
+        self.assertEqual(list(sub.khop([n[0]], 5)),
+                         [(0, {n[0]}), (1, {n[1]}), (2, {n[2]})])
+
+    def test_edge_subgraph(self):
+        n = self.nodes
+        sub = self.g.edge_subgraph([self.e1, self.e3])
+        self.assertEqual(sorted(sub.nodes), sorted(n))
+        self.assertEqual(sorted(sub.edges), sorted([self.e1, self.e3]))
+        node1 = [node for node in sub.nodes if node == n[1]][0]
+        self.assertEqual(list(node1.neighbors), [n[0]])
+
+    def test_live(self):
+        n = self.nodes
+        sub = self.g.subgraph(n[:3])
+        edge = self.g.add_edge(n[0], n[2])
+        self.assertIn(edge, sub.edges)
+        self.g.del_node(n[0])
+        self.assertEqual(sorted(sub.nodes), sorted(n[1:3]))
+        self.assertEqual(list(sub.edges), [self.e2])
+
+    def test_nested(self):
+        n = self.nodes
+        sub = self.g.subgraph(n[:3]).subgraph(n[1:])
+        self.assertEqual(sorted(sub.nodes), sorted(n[1:3]))
+        self.assertEqual(list(sub.edges), [self.e2])
+
+    def test_read_only(self):
+        sub = self.g.subgraph(self.nodes)
+        with self.assertRaises(TypeError):
+            sub.add_node()
+        with self.assertRaises(TypeError):
+            sub[self.nodes[0]] = {'key': 'other'}
+        with self.assertRaises(TypeError):
+            sub[self.nodes[0]]['key'] = 'other'
+        with self.assertRaises(TypeError):
+            list(sub.nodes)[0].weight = 3
+        self.assertEqual(self.g[self.nodes[0]], {'key': 'value'})
+
+    def test_keys(self):
+        n = self.nodes
+        sub = self.g.subgraph(n[:3])
+        nodes = sub.nodes
+        self.assertEqual(len(nodes), 3)
+        self.assertEqual(sorted(nodes), sorted(n[:3]))
+        self.assertEqual(sorted(nodes), sorted(n[:3]))
+        self.assertIn(n[0], nodes)
+        self.assertNotIn(n[3], nodes)
+        self.assertEqual(len(sub.edges), 2)
+        self.assertEqual(len(sub.pair_store.keys()), 3)
+        self.assertEqual(len(list(sub.pair_store.keys())), 3)
+
+    def test_snapshot(self):
+        g = Graph(DictionaryBackend(snapshots=True))
+        nodes = g.add_nodes(2)
+        with self.assertRaises(TypeError):
+            g.subgraph(nodes[:1]).snapshot()
+
+    def test_component_index(self):
+        nodes = self.g.add_nodes(4)
+        self.g.add_edge(nodes[0], nodes[1])
+        self.g.add_edge(nodes[2], nodes[3])
+        with self.assertRaises(TypeError):
+            self.g.subgraph(nodes[:2]).enable_component_index()
+        self.assertEqual(len(self.g.backend.component_store), 0)
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend(snapshots=True))
+        self.nodes = self.g.add_nodes(4, {'key': 'value'})
+        n = self.nodes
+        self.e1 = self.g.add_edge(n[0], n[1], {'keye': 'valuee'})
+        self.e2 = self.g.add_edge(n[1], n[2], directed=True, weight=5)
+        self.e3 = self.g.add_edge(n[2], n[3])
+
+    def test_unchanged(self):
+        n = self.nodes
+        with self.g.snapshot() as snapshot:
+            self.assertEqual(sorted(snapshot.nodes), sorted(n))
+            self.assertEqual(sorted(snapshot.edges), sorted([self.e1, self.e2, self.e3]))
+            self.assertEqual(snapshot[self.e1], {'keye': 'valuee'})
+            edge = [e for e in snapshot.edges if e == self.e2][0]
+            self.assertIs(edge.graph, snapshot)
+            self.assertTrue(edge.directed)
+            self.assertEqual(edge.weight, 5)
+            self.assertEqual(snapshot.edges_between(n[0], n[1]), {self.e1})
+
+    def test_isolation(self):
+        n = self.nodes
+        snapshot = self.g.snapshot()
+        added = self.g.add_node()
+        edge = self.g.add_edge(n[0], added)
+        self.g[n[0]] = {'key': 'other'}
+        self.g.del_node(n[2])
+        weights = dict(snapshot.weight_store.items())
+        for edge in self.g.edges:
+            edge.weight = 7
+        self.assertEqual(sorted(snapshot.nodes), sorted(n))
+        self.assertEqual(sorted(snapshot.edges), sorted([self.e1, self.e2, self.e3]))
+        self.assertNotIn(added, snapshot.node_store)
+        self.assertNotIn(edge, snapshot.edge_store)
+        self.assertEqual(snapshot[n[0]], {'key': 'value'})
+        self.assertEqual(dict(snapshot.weight_store.items()), weights)
+        node2 = [node for node in snapshot.nodes if node == n[2]][0]
+        self.assertEqual(list(node2.neighbors), [n[3]])
+        self.assertIn(self.e2, snapshot.direction_store)
+        self.assertTrue(snapshot.has_edge(n[1], n[2]))
+        self.assertEqual(sorted(self.g.nodes), sorted(n[:2] + [n[3], added]))
+        self.assertEqual(self.g[n[0]], {'key': 'other'})
+        snapshot.close()
+        self.assertTrue(snapshot.closed)
+
+    def test_epochs(self):
+        n = self.nodes
+        snapshots = []
+        for i in range(3):
+            snapshots.append(self.g.snapshot())
+            self.g[n[0]] = {'key': i}
+        self.g.del_node(n[0])
+        self.assertEqual([s[n[0]] for s in snapshots],
+                         [{'key': 'value'}, {'key': 0}, {'key': 1}])
+        snapshots[0].close()
+        self.assertEqual([s[n[0]] for s in snapshots[1:]], [{'key': 0}, {'key': 1}])
+        self.assertNotIn(n[0], self.g.snapshot().node_store)
+
+    def test_garbage_collection(self):
+        n = self.nodes
+        versions = self.g.backend.versions
+        snapshot = self.g.snapshot()
+        self.g.del_node(n[0])
+        self.assertTrue(versions.dirty)
+        later = self.g.snapshot()
+        self.g.del_node(n[1])
+        snapshot.close()
+        #only the versions the later snapshot reads are left
+        self.assertNotIn(n[0], later.node_store)
+        self.assertIn(n[1], later.node_store)
+        for store in versions.dirty.values():
+            self.assertNotIn(n[0], store.history or {})
+        del later
+        gc.collect()
+        self.assertEqual(versions.open, {})
+        self.assertEqual(versions.dirty, {})
+
+    def test_threads(self):
+        n = self.nodes
+        errors = []
+        done = threading.Event()
+
+        def write():
+            try:
+                for i in range(5000):
+                    self.g[n[i % 4]] = {'key': i}
+                    self.g.del_node(self.g.add_node())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.set()
+
+        def read():
+            try:
+                while not done.is_set():
+                    with self.g.snapshot() as snapshot:
+                        nodes = sorted(snapshot.nodes)
+                        values = [snapshot[node]['key'] for node in n]
+                        #the snapshot doesn't see later writes
+                        self.assertEqual(sorted(snapshot.nodes), nodes)
+                        self.assertEqual([snapshot[node]['key'] for node in n], values)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write)]
+        threads += [threading.Thread(target=read) for i in range(3)]
+        #switch threads often, to interleave the writes with the snapshots
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(self.g.backend.versions.open, {})
+        self.assertEqual(self.g.backend.versions.dirty, {})
+
+    def test_release_during_write(self):
+        #as when a snapshot is garbage collected in the middle of a write
+        versions = Versions()
+        store = VersionedDict(versions)
+        epochs = [versions.acquire()]
+
+        class Key():
+            def __hash__(self):
+                if epochs:
+                    versions.release(epochs.pop())
+                return 0
+
+        key = Key()
+        store[key] = 1
+        self.assertEqual(store[key], 1)
+        self.assertEqual(versions.open, {})
+        self.assertEqual(versions.dirty, {})
+        self.assertIsNone(store.history)
+
+    def test_read_only(self):
+        snapshot = self.g.snapshot()
+        with self.assertRaises(TypeError):
+            snapshot.add_node()
+        with self.assertRaises(TypeError):
+            snapshot[self.nodes[0]]['key'] = 'other'
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            Graph(DictionaryBackend()).snapshot()
+
+class TestFrozenGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+        self.nodes = self.g.add_nodes(5, {'key': 'value'})
+        n = self.nodes
+        n[4]['other'] = 1
+        self.e1 = self.g.add_edge(n[0], n[1], {'keye': 'valuee'}, weight=2)
+        self.e2 = self.g.add_edge(n[1], n[2], directed=True, weight=5)
+        self.e3 = self.g.add_edge(n[2], n[3])
+        self.e4 = self.g.add_edge(n[1], n[0])
+        self.e5 = self.g.add_edge(n[3], n[3])
+        self.frozen = self.g.freeze()
+
+    def test_structure(self):
+        f = self.frozen
+        self.assertEqual(sorted(f.nodes), sorted(self.g.nodes))
+        self.assertEqual(sorted(f.edges), sorted(self.g.edges))
+        self.assertEqual(sorted(f), sorted(self.g))
+        frozen_nodes = {node: node for node in f.nodes}
+        for node in self.nodes:
+            frozen_node = frozen_nodes[node]
+            self.assertEqual(sorted(frozen_node.neighbors), sorted(node.neighbors))
+            self.assertEqual(sorted(frozen_node.edges), sorted(node.edges))
+            self.assertEqual(f.degree(node), len(node.edges))
+            self.assertIs(frozen_node.graph, f)
+        for edge in self.g.edges:
+            self.assertEqual(f.edge_store[edge], edge.nodes)
+            self.assertEqual(f.weight_store[edge], edge.weight)
+            self.assertEqual(edge in f.direction_store, edge.directed)
+        self.assertEqual(list(f.direction_store), [self.e2])
+        self.assertEqual(len(f.direction_store), 1)
+
+    def test_attributes(self):
+        f = self.frozen
+        n = self.nodes
+        self.assertEqual(f[n[0]], {'key': 'value'})
+        self.assertEqual(f[n[4]], {'key': 'value', 'other': 1})
+        self.assertEqual(f[self.e1], {'keye': 'valuee'})
+        self.assertEqual(f.weight_store[self.e2], 5)
+        n[0]['key'] = 'changed'
+        self.assertEqual(f[n[0]]['key'], 'value')
+
+    def test_pairs(self):
+        f = self.frozen
+        n = self.nodes
+        self.assertTrue(f.has_edge(n[0], n[1]))
+        self.assertTrue(f.has_edge(n[1], n[2]))
+        self.assertFalse(f.has_edge(n[2], n[1]))
+        self.assertFalse(f.has_edge(n[0], n[3]))
+        self.assertEqual(f.edges_between(n[0], n[1]), {self.e1, self.e4})
+        self.assertEqual(f.edges_between(n[3], n[3]), {self.e5})
+        self.assertEqual(f.edges_between(n[0], n[4]), frozenset())
+        self.assertEqual(sorted(f.pair_store.keys()), sorted(self.g.pair_store.keys()))
+
+    def test_queries(self):
+        f = self.frozen
+        n = self.nodes
+        self.assertEqual(list(f.khop([n[0]], 3)), list(self.g.khop([n[0]], 3)))
+        self.assertEqual(f.aggregate_neighbors('sum', of='weight'),
+                         self.g.aggregate_neighbors('sum', of='weight'))
+        sub = f.subgraph(n[:3])
+        self.assertEqual(sorted(sub.edges), sorted([self.e1, self.e2, self.e4]))
+        node = [node for node in sub.nodes if node == n[1]][0]
+        self.assertEqual(sorted(node.neighbors), sorted([n[0], n[0], n[2]]))
+
+    def test_read_only(self):
+        f = self.frozen
+        n = list(f.nodes)
+        with self.assertRaises(TypeError):
+            f.add_node()
+        with self.assertRaises(TypeError):
+            f.del_node(n[0])
+        with self.assertRaises(TypeError):
+            n[0]['key'] = 'other'
+        with self.assertRaises(TypeError):
+            n[0].weight = 3
+        with self.assertRaises(TypeError):
+            f[n[0]]['key'] = 'other'
+        with self.assertRaises(TypeError):
+            f.node_store[n[0]] = {}
+        self.assertIs(f.freeze(), f)
+        self.assertIs(f.snapshot(), f)
+        self.g.add_node()
+        self.assertEqual(len(f.node_store), 5)
+
+    def test_memory_usage(self):
+        usage = self.frozen.memory_usage()
+        self.assertTrue(usage['stores']['direction_store'] > 0)
+        self.assertTrue(usage['types']['FrozenEdge'] > 0)
+        self.assertEqual(dict(self.frozen.direction_store.items()), {self.e2: True})
+        with self.assertRaises(KeyError):
+            self.frozen.direction_store[self.e1]
+
+    def test_query_cache(self):
+        f = self.frozen
+        cache = f.enable_query_cache()
+        sums = f.cached('aggregate_neighbors', 'sum', of='weight')
+        self.assertIs(f.cached('aggregate_neighbors', 'sum', of='weight'), sums)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_zodb(self):
+        storage = FileStorage(NamedTemporaryFile().name)
+        connection = DB(storage).open()
+        g = Graph(ZODBBTreeBackend(connection.root))
+        n = g.add_nodes(3)
+        edge = g.add_edge(n[0], n[1], directed=True)
+        f = g.freeze()
+        self.assertEqual(f.edges_between(n[0], n[1]), {edge})
+        self.assertEqual(len(f.node_store), 3)
+
+class TestTriangles(unittest.TestCase):
+
+    #the arcs of each connected triad type between nodes A, B and C
+    TRIAD_ARCS = {
+        '021D': 'BA BC', '021U': 'AB CB', '021C': 'AB BC',
+        '111D': 'AB BA CB', '111U': 'AB BA BC',
+        '030T': 'AB CB AC', '030C': 'BA CB AC', '201': 'AB BA BC CB',
+        '120D': 'BA BC AC CA', '120U': 'AB CB AC CA', '120C': 'AB BC AC CA',
+        '210': 'AB BC CB AC CA', '300': 'AB BA BC CB AC CA',
+    }
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.g = Graph(DictionaryBackend())
+        self.nodes = self.g.add_nodes(12)
+        for i in range(40):
+            node1, node2 = rng.choice(self.nodes), rng.choice(self.nodes)
+            self.g.add_edge(node1, node2, directed=rng.random() < 0.8)
+
+    def arcs(self):
+        arcs = set()
+        for edge, (node1, node2) in self.g.edge_store.items():
+            if node1 != node2:
+                arcs.add((node1, node2))
+                if edge not in self.g.direction_store:
+                    arcs.add((node2, node1))
+        return arcs
+
+    def brute_force(self):
+        arcs = self.arcs()
+        connected = lambda a, b: (a, b) in arcs or (b, a) in arcs
+        triangles = [t for t in itertools.combinations(self.nodes, 3)
+                     if connected(t[0], t[1]) and connected(t[1], t[2])
+                     and connected(t[0], t[2])]
+        census = dict.fromkeys(self.TRIAD_ARCS, 0)
+        for triple in itertools.combinations(self.nodes, 3):
+            for a, b, c in itertools.permutations(triple):
+                names = {a: 'A', b: 'B', c: 'C'}
+                found = {names[x] + names[y] for x, y in
+                         itertools.permutations(triple, 2) if (x, y) in arcs}
+                matches = [triad for triad, pattern in self.TRIAD_ARCS.items()
+                           if set(pattern.split()) == found]
+                if matches:
+                    census[matches[0]] += 1
+                    break
+        return triangles, census
+
+    def test_triangles(self):
+        triangles, census = self.brute_force()
+        self.assertTrue(triangles)
+        for method in ('sets', 'sparse'):
+            counter = TriangleCounter(self.g, method)
+            self.assertEqual(counter.count(), len(triangles))
+            counts = counter.node_triangles()
+            for node in self.nodes:
+                self.assertEqual(counts[node], sum(node in t for t in triangles))
+        self.assertEqual(self.g.triangle_count(), len(triangles))
+        self.assertEqual(self.g.freeze().triangle_count(), len(triangles))
+
+    def test_clustering(self):
+        triangles, census = self.brute_force()
+        arcs = self.arcs()
+        clustering = self.g.clustering()
+        self.assertEqual(clustering, self.g.clustering(method='sparse'))
+        for node in self.nodes:
+            neighbors = {b for a, b in arcs if a == node} | {a for a, b in arcs if b == node}
+            pairs = len(neighbors) * (len(neighbors) - 1) / 2
+            expected = sum(node in t for t in triangles) / pairs if pairs else 0
+            self.assertAlmostEqual(clustering[node], expected)
+        self.assertEqual(self.g.clustering(self.nodes[:2]),
+                         {node: clustering[node] for node in self.nodes[:2]})
+        counter = TriangleCounter(self.g)
+        self.assertAlmostEqual(counter.average_clustering(),
+                               sum(clustering.values()) / len(clustering))
+        self.assertTrue(0 < counter.transitivity() < 1)
+
+    def test_motifs(self):
+        triangles, census = self.brute_force()
+        self.assertEqual(self.g.motif_counts(), census)
+
+    def test_method(self):
+        with self.assertRaises(ValueError):
+            TriangleCounter(self.g, 'loops')
+
+class TestSampling(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(2)
+        self.g = Graph(DictionaryBackend())
+        self.nodes = self.g.add_nodes(40)
+        for i in range(120):
+            self.g.add_edge(rng.choice(self.nodes), rng.choice(self.nodes),
+                            directed=rng.random() < 0.3, weight=rng.randrange(5))
+        self.dead_end = self.g.add_node()
+        self.g.add_edge(self.nodes[0], self.dead_end, directed=True)
+
+    def assertWalk(self, walk):
+        for node1, node2 in zip(walk, walk[1:]):
+            self.assertIn(node2, list(node1.neighbors))
+
+    def test_walks(self):
+        sampler = self.g.sampler()
+        walks = sampler.walks(8, walks_per_node=2, seed=0)
+        self.assertEqual(walks.shape, (82, 8))
+        self.assertEqual(list(walks[::2, 0]), list(range(41)))
+        for walk in sampler.to_nodes(walks):
+            self.assertWalk(walk)
+        dead_end = sampler.walks(4, starts=[self.dead_end], seed=0)
+        self.assertEqual(dead_end.tolist(), [[sampler.numbers([self.dead_end])[0], -1, -1, -1]])
+
+    def test_seeds(self):
+        sampler = self.g.sampler()
+        walks = sampler.walks(6, seed=1, chunk_size=7)
+        self.assertTrue((walks == sampler.walks(6, seed=1, chunk_size=7)).all())
+        self.assertTrue((walks == sampler.walks(6, seed=1, chunk_size=7, processes=2)).all())
+        self.assertFalse((walks == sampler.walks(6, seed=2, chunk_size=7)).all())
+
+    def test_weighted(self):
+        g = Graph(DictionaryBackend())
+        a, b, c, d = g.add_nodes(4)
+        g.add_edge(a, b, weight=1)
+        g.add_edge(a, c, weight=3)
+        g.add_edge(a, d, weight=0)
+        sampler = g.sampler(weighted=True)
+        walks = sampler.walks(2, starts=[a], walks_per_node=4000, seed=0)
+        counts = collections.Counter(sampler.to_nodes(walks[:, 1]))
+        self.assertNotIn(d, counts)
+        self.assertAlmostEqual(counts[c] / 4000, 0.75, delta=0.03)
+        sampler = self.g.sampler(weighted=True)
+        for walk in sampler.to_nodes(sampler.walks(8, seed=0)):
+            self.assertWalk(walk)
+        with self.assertRaises(ValueError):
+            g.add_edge(b, c, weight=-1)
+            g.sampler(weighted=True)
+
+    def test_node2vec(self):
+        g = Graph(DictionaryBackend())
+        nodes = g.add_nodes(10)
+        for node1, node2 in zip(nodes, nodes[1:]):
+            g.add_edge(node1, node2)
+        sampler = g.sampler()
+        #a low p returns to the previous node almost every time
+        walks = sampler.to_nodes(sampler.walks(5, starts=nodes[4:5], walks_per_node=50, p=0.001, seed=0))
+        returns = sum(walk[2] == walk[0] for walk in walks)
+        self.assertGreater(returns, 45)
+        #a low q moves away from it
+        walks = sampler.to_nodes(sampler.walks(5, starts=nodes[4:5], walks_per_node=50, q=0.001, seed=0))
+        returns = sum(walk[2] == walk[0] for walk in walks)
+        self.assertLess(returns, 5)
+        sampler = self.g.sampler()
+        for walk in sampler.to_nodes(sampler.walks(8, p=0.5, q=2, seed=0)):
+            self.assertWalk(walk)
+
+    def test_sample_neighbors(self):
+        sampler = self.g.sampler()
+        batch = self.nodes[:5] + [self.dead_end]
+        hops = sampler.sample_neighbors(batch, [3, 2], seed=0)
+        self.assertEqual([hop.shape for hop in hops], [(6, 3), (18, 2)])
+        self.assertEqual(hops[0][5].tolist(), [-1, -1, -1])
+        frontier = sampler.numbers(batch)
+        for hop in hops:
+            for source, row in zip(frontier, hop):
+                for target in row:
+                    if source < 0:
+                        self.assertEqual(target, -1)
+                    elif target >= 0:
+                        self.assertIn(sampler.nodes[target], list(sampler.nodes[source].neighbors))
+            frontier = hop.ravel()
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+        self.nodes = self.g.add_nodes(3, {'score': 1.5, 'kind': 'a'})
+        self.store = self.g.set_attribute_schema({'score': float,
+                                                  'count': int,
+                                                  'kind': str})
+
+    def test_persistent_backend(self):
+        storage = FileStorage(NamedTemporaryFile().name)
+        g = Graph(ZODBBTreeBackend(DB(storage).open().root))
+        with self.assertRaises(TypeError):
+            g.set_attribute_schema({'score': float})
+        with self.assertRaises(TypeError):
+            g.compact_attributes()
+
+    def test_attributes(self):
+        n = self.nodes
+        self.assertEqual(self.g[n[0]], {'score': 1.5, 'kind': 'a'})
+        node = self.g.add_node({'count': 3, 'name': 'x'})
+        self.assertEqual(self.g[node], {'count': 3, 'name': 'x'})
+        self.g[node] = {'score': 2}
+        self.assertEqual(node['score'], 2.0)
+        node['kind'] = 'b'
+        self.assertEqual(self.g[node], {'count': 3, 'name': 'x',
+                                        'score': 2.0, 'kind': 'b'})
+        edge = self.g.add_edge(n[0], n[1], {'count': 1})
+        self.assertEqual(edge['count'], 1)
+        with self.assertRaises(KeyError):
+            n[0]['count']
+
+    def test_delete(self):
+        n = self.nodes
+        self.g.add_edge(n[0], n[1], {'count': 1})
+        self.g.del_node(n[0])
+        self.assertEqual(sorted(self.g), sorted(n[1:]))
+        node = self.g.add_node({'count': 2})
+        self.assertEqual(self.g[node], {'count': 2})
+        self.assertEqual(self.store.count('count'), 1)
+
+    def test_filter(self):
+        n = self.nodes
+        n[1]['score'] = 3.0
+        self.assertEqual(sorted(self.store.filter('score', '>', 2)), [n[1]])
+        self.assertEqual(sorted(self.store.filter('kind', '==', 'a')), sorted(n))
+        self.assertEqual(self.store.filter('kind', '==', 'z'), [])
+
+    def test_filter_categories(self):
+        for node, kind in zip(self.nodes, ('zebra', 'apple', 'mango')):
+            node['kind'] = kind
+        n = self.nodes
+        self.assertEqual(self.store.filter('kind', '>', 'm'), [n[0], n[2]])
+        self.assertEqual(self.store.filter('kind', '<', 'b'), [n[1]])
+        self.assertEqual(self.store.filter('kind', '<=', 'mango'), [n[1], n[2]])
+
+    def test_types(self):
+        n = self.nodes
+        for name, value in (('count', 2.9), ('count', True), ('kind', 7),
+                            ('score', 'x')):
+            with self.assertRaises(TypeError):
+                n[0][name] = value
+        with self.assertRaises(TypeError):
+            self.g[n[0]] = {'count': 1, 'kind': 5}
+        self.assertEqual(self.g[n[0]], {'score': 1.5, 'kind': 'a'})
+        g = Graph(DictionaryBackend())
+        node = g.add_node({'flag': 'False'})
+        with self.assertRaises(TypeError):
+            g.set_attribute_schema({'flag': bool})
+        self.assertEqual(g[node], {'flag': 'False'})
+
+    def test_aggregate(self):
+        n = self.nodes
+        n[1]['score'] = 3.0
+        n[2]['kind'] = 'b'
+        self.assertEqual(self.store.sum('score'), 6.0)
+        self.assertEqual(self.store.mean('score'), 2.0)
+        self.assertEqual(self.store.mean('count'), None)
+        self.assertEqual(self.store.groupby('kind'), {'a': 2, 'b': 1})
+        self.assertEqual(self.store.groupby('kind', 'score', 'sum'),
+                         {'a': 4.5, 'b': 1.5})
+        self.assertEqual(self.store.groupby('kind', 'score', 'mean'),
+                         {'a': 2.25, 'b': 1.5})
+
+    def test_grow(self):
+        nodes = self.g.add_nodes(3000, {'count': 1})
+        self.assertEqual(self.store.sum('count'), 3000)
+        self.assertEqual(nodes[-1]['count'], 1)
+
+class TestChangeFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+        self.batches = []
+
+    def test_events(self):
+        self.g.subscribe(self.batches.append)
+        nodes = self.g.add_nodes(2)
+        edge = self.g.add_edge(nodes[0], nodes[1])
+        nodes[0]['key'] = 'value'
+        edge.weight = 4
+        self.g.del_node(nodes[1])
+        events = [event for batch in self.batches for event in batch]
+        self.assertEqual([event.kind for event in events],
+                         ['node_added', 'node_added', 'edge_added',
+                          'attributes_updated', 'weight_changed',
+                          'edge_deleted', 'node_deleted'])
+        self.assertEqual([event.sequence for event in events], list(range(1, 8)))
+        self.assertEqual(events[2].data, (nodes[0], nodes[1]))
+        self.assertEqual(events[3].data, {'key': 'value'})
+        self.assertEqual(events[4].element, edge)
+        self.assertEqual(events[4].data, 4)
+        #the cascade is delivered in one batch on commit
+        self.assertEqual(len(self.batches[-1]), 2)
+
+    def test_attributes_in_place(self):
+        node = self.g.add_node({'key': 'value'})
+        self.g.subscribe(self.batches.append)
+        self.g[node]['key'] = 'other'
+        del self.g[node]['key']
+        self.g.commit()
+        events = self.batches[-1]
+        self.assertEqual([(event.kind, event.data) for event in events],
+                         [('attributes_updated', {'key': 'other'}),
+                          ('attributes_updated', {'key': None})])
+        self.assertEqual(self.g[node], {})
+
+    def test_unsubscribed(self):
+        feed = self.g.subscribe(self.batches.append)
+        self.g.unsubscribe(self.batches.append)
+        self.assertEqual(self.g._listeners, [])
+        self.g.add_node()
+        self.assertEqual(self.batches, [])
+        self.assertEqual(feed.sequence, 0)
+
+    def test_resume_after_unsubscribed(self):
+        from changefeed import ChangeFeed
+        self.g._changes = ChangeFeed(capacity=4)
+        self.g.subscribe(self.batches.append)
+        self.g.add_node()
+        last = self.batches[-1][-1].sequence
+        self.g.unsubscribe(self.batches.append)
+        #the changes made with no subscribers weren't recorded
+        self.g.add_nodes(2)
+        with self.assertRaises(LookupError):
+            self.g.subscribe(self.batches.append, since=last)
+        self.assertEqual(self.g._listeners, [])
+        self.g.subscribe(self.batches.append)
+        self.g.add_node()
+        self.assertEqual(self.batches[-1][-1].sequence, last + 1)
+        resumed = []
+        self.g.subscribe(resumed.append, since=last + 1)
+        self.assertEqual(resumed, [])
+        with self.assertRaises(LookupError):
+            self.g.subscribe(resumed.append, since=last)
+
+    def test_resume(self):
+        feed = self.g.subscribe(self.batches.append)
+        others = []
+        self.g.subscribe(others.append)
+        self.g.add_nodes(3)
+        self.g.unsubscribe(self.batches.append)
+        #the other subscriber kept the feed recording
+        self.g.add_node()
+        resumed = []
+        self.g.subscribe(resumed.append, since=1)
+        self.assertEqual([event.sequence for event in resumed[0]], [2, 3, 4])
+        self.assertEqual(feed.events(4), [])
+        with self.assertRaises(ValueError):
+            feed.events(5)
+
+    def test_reopen(self):
+        path = NamedTemporaryFile().name
+        db = DB(FileStorage(path))
+        g = Graph(ZODBBTreeBackend(db.open().root))
+        g.subscribe(self.batches.append)
+        g.add_nodes(3)
+        last = self.batches[-1][-1].sequence
+        db.close()
+        db = DB(FileStorage(path))
+        g = Graph(ZODBBTreeBackend(db.open().root))
+        resumed = []
+        #the changes after a reopen can't be resumed from the last session
+        with self.assertRaises(LookupError):
+            g.subscribe(resumed.append, since=last)
+        g.subscribe(resumed.append)
+        g.add_node()
+        self.assertEqual(resumed[-1][-1].sequence, last + 1)
+        db.close()
+
+    def test_overflow(self):
+        from changefeed import ChangeFeed
+        self.g._changes = ChangeFeed(capacity=2)
+        self.g.subscribe(self.batches.append)
+        self.g.add_nodes(3)
+        with self.assertRaises(LookupError):
+            self.g._changes.events(0)
+        self.assertEqual(len(self.g._changes.events(1)), 2)
+
+class TestBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+
+    def test_import_csv(self):
+        source = io.StringIO('a,b,2\nb,c,3\nc,a,4.5\n')
+        key_map = {}
+        count = self.g.import_edges(source, weight_field=2, key_map=key_map,
+                                    commit_every=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(list(self.g.nodes)), 3)
+        self.assertEqual(sorted(key_map), ['a', 'b', 'c'])
+        nodes = {self.g[node]['key']: node for node in self.g.nodes}
+        self.assertTrue(self.g.has_edge(nodes['a'], nodes['b']))
+        weights = sorted(edge.weight for edge in self.g.edges)
+        self.assertEqual(weights, [2, 3, 4.5])
+        self.g.import_edges(io.StringIO('a\td\n'), 'tsv', key_map=key_map)
+        self.assertEqual(len(list(self.g.nodes)), 4)
+        self.assertEqual(len(list(nodes['a'].neighbors)), 3)
+
+    def test_import_jsonl(self):
+        lines = [{'source': 1, 'target': 2, 'label': 'x'},
+                 {'source': 2, 'target': 3, 'label': 'y'}]
+        source = io.StringIO('\n'.join(json.dumps(line) for line in lines))
+        self.g.import_edges(source, 'jsonl', attribute_fields=['label'],
+                            directed=True)
+        self.assertEqual(sorted(self.g[edge]['label'] for edge in self.g.edges),
+                         ['x', 'y'])
+        self.assertTrue(all(edge.directed for edge in self.g.edges))
+
+    def test_round_trip(self):
+        for format in ('csv', 'tsv', 'jsonl'):
+            g = Graph(DictionaryBackend())
+            g.import_edges(io.StringIO('a,b,1\nb,c,2\n'), weight_field=2)
+            edge = list(g.edges)[0]
+            g.add_edge(*edge.nodes, directed=True, weight=5)
+            exported = io.StringIO()
+            self.assertEqual(g.export_edges(exported, format), 3)
+            copy = Graph(DictionaryBackend())
+            copy.import_edges(io.StringIO(exported.getvalue()), format,
+                              header=True, weight_field='weight',
+                              directed_field='directed')
+            self.assertEqual(len(list(copy.nodes)), 3)
+            self.assertEqual(sorted(e.weight for e in copy.edges), [1, 2, 5])
+            self.assertEqual(len(copy.direction_store), 1)
+
+    def test_round_trip_attributes(self):
+        nodes = self.g.add_nodes(3)
+        self.g.add_edge(nodes[0], nodes[1], {'label': 'x'}, weight=2)
+        self.g.add_edge(nodes[1], nodes[2], weight=None)
+        for format in ('csv', 'jsonl'):
+            exported = io.StringIO()
+            self.g.export_edges(exported, format)
+            copy = Graph(DictionaryBackend())
+            copy.import_edges(io.StringIO(exported.getvalue()), format,
+                              header=True, weight_field='weight',
+                              directed_field='directed',
+                              attributes_field='attributes' if format == 'jsonl' else None)
+            edges = sorted(copy.edges, key=lambda edge: edge.weight is None)
+            self.assertEqual([edge.weight for edge in edges], [2, None])
+            if format == 'jsonl':
+                self.assertEqual([copy[edge] for edge in edges], [{'label': 'x'}, {}])
+
+    def test_commit_every(self):
+        lines = ''.join('%d,%d\n' % (i % 50, i % 7) for i in range(2001))
+        for backend, commits in ((DictionaryBackend(), 1),
+                                 (ZODBBTreeBackend(DB(None).open().root), 3)):
+            g = Graph(backend)
+            committed = []
+            commit = g.commit_func
+            g.commit_func = lambda: committed.append(commit())
+            self.assertEqual(g.import_edges(io.StringIO(lines)), 2001)
+            self.assertEqual(len(committed), commits)
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+        self.nodes = self.g.add_nodes(10, {'a': 1, 'b': 'two'})
+        self.g.add_edge(self.nodes[0], self.nodes[1], {'c': 3})
+
+    def test_memory_usage(self):
+        usage = self.g.memory_usage()
+        self.assertEqual(set(usage['stores']), set(Graph.instrumented_stores))
+        self.assertTrue(usage['stores']['attribute_store'] > 0)
+        self.assertTrue(usage['types']['Node'] > usage['types']['Edge'] > 0)
+        self.assertEqual(usage['total'],
+                         sum(usage['stores'].values()) + usage['elements'])
+
+    def test_compact_attributes(self):
+        before = self.g.memory_usage()['stores']['attribute_store']
+        store = self.g.compact_attributes()
+        after = self.g.memory_usage()['stores']['attribute_store']
+        self.assertTrue(after < before)
+        n = self.nodes
+        self.assertEqual(self.g[n[0]], {'a': 1, 'b': 'two'})
+        self.assertIs(self.g[n[0]].table, self.g[n[1]].table)
+        n[0]['c'] = 3
+        self.assertEqual(self.g[n[0]], {'a': 1, 'b': 'two', 'c': 3})
+        self.assertEqual(self.g[n[1]], {'a': 1, 'b': 'two'})
+        self.assertIsNot(self.g[n[0]].table, self.g[n[1]].table)
+        n[1]['c'] = 4
+        self.assertIs(self.g[n[0]].table, self.g[n[1]].table)
+        del self.g[n[1]]['a']
+        self.assertEqual(self.g[n[1]], {'b': 'two', 'c': 4})
+        node = self.g.add_node({'a': 5, 'b': 'six'})
+        self.assertIs(self.g[node].table, self.g[n[2]].table)
+        self.g.del_node(node)
+        self.assertNotIn(node, self.g.attribute_store)
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+        self.nodes = self.g.add_nodes(5, {'age': 1})
+        n = self.nodes
+        self.e1 = self.g.add_edge(n[0], n[1], weight=2)
+        self.e2 = self.g.add_edge(n[1], n[2], weight=3)
+        self.e3 = self.g.add_edge(n[3], n[4], weight=4)
+        self.cache = self.g.enable_query_cache()
+        self.calls = 0
+
+    def count_calls(self, graph, *args, **kwargs):
+        self.calls += 1
+        return graph.aggregate_neighbors(*args, **kwargs)
+
+    def test_hits(self):
+        first = self.g.cached(self.count_calls, 'sum', of='weight')
+        self.assertIs(self.g.cached(self.count_calls, 'sum', of='weight'), first)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first[self.nodes[1]], 5)
+        self.g.cached(self.count_calls, 'sum', of='age')
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.g.cached('khop', [self.nodes[0]], 2),
+                         [(0, {self.nodes[0]}), (1, {self.nodes[1]}), (2, {self.nodes[2]})])
+        self.g.cached('aggregate_neighbors', where={'age': 1}, nodes=[self.nodes[0]])
+        self.g.cached('aggregate_neighbors', where={'age': 1}, nodes=[self.nodes[0]])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (2, 4, 4))
+        self.assertEqual(stats['hit_rate'], 2 / 6)
+
+    def test_graph_wide(self):
+        n = self.nodes
+        for change in (lambda: self.g.add_node(),
+                       lambda: self.g.add_edge(n[0], n[4]),
+                       lambda: self.g.__setitem__(n[2], {'age': 2}),
+                       lambda: setattr(self.e3, 'weight', 1),
+                       lambda: self.g.del_edge(self.e3),
+                       lambda: self.g.del_node(n[4])):
+            before = self.g.cached('aggregate_neighbors', 'sum', of='weight')
+            change()
+            after = self.g.cached('aggregate_neighbors', 'sum', of='weight')
+            self.assertIsNot(after, before)
+            self.assertEqual(after, self.g.aggregate_neighbors('sum', of='weight'))
+        self.assertEqual(self.cache.stats()['invalidations'], 6)
+
+    def test_observed_attributes(self):
+        n = self.nodes
+        self.assertEqual(self.g.cached('aggregate_neighbors', 'sum', of='age')[n[1]], 2)
+        self.g[n[0]]['age'] = 2
+        self.assertEqual(self.g[n[0]], {'age': 2})
+        after = self.g.cached('aggregate_neighbors', 'sum', of='age')
+        self.assertEqual(after[n[1]], 3)
+        self.g[n[0]].update(age=4)
+        self.assertEqual(self.g.cached('aggregate_neighbors', 'sum', of='age')[n[1]], 5)
+        del self.g[n[0]]['age']
+        self.assertEqual(self.g.cached('aggregate_neighbors', 'sum', of='age')[n[1]], 1)
+        self.g.remove_listener(self.cache)
+        self.g[n[0]]['age'] = 3
+        self.assertIs(type(self.g[n[0]]), dict)
+
+    def test_compact(self):
+        n = self.nodes
+        depends_on = self.cache.neighborhood([n[1]])
+        before = self.g.cached('edges_between', n[0], n[1], depends_on=depends_on)
+        self.assertEqual(before, {self.e1})
+        #an orphan as left behind by older versions
+        del self.g.node_store[n[0]]
+        self.g.compact()
+        self.assertNotIn(self.e1, self.g.edge_store)
+        self.assertEqual(self.g.cached('edges_between', n[0], n[1], depends_on=depends_on),
+                         frozenset())
+
+    def test_per_node(self):
+        n = self.nodes
+        depends_on = self.cache.neighborhood([n[0]])
+        self.assertEqual(depends_on, {n[0], n[1]})
+
+        def query():
+            return self.g.cached(self.count_calls, 'sum', of='age', nodes=[n[0]],
+                                 depends_on=depends_on)
+
+        self.assertEqual(query(), {n[0]: 1})
+        #changes elsewhere keep the result
+        self.g.add_edge(n[2], n[3])
+        self.g[n[4]] = {'age': 5}
+        self.g.add_node()
+        self.assertEqual(query(), {n[0]: 1})
+        self.assertEqual(self.calls, 1)
+        #changing a neighbor drops it
+        self.g[n[1]] = {'age': 3}
+        self.assertEqual(query(), {n[0]: 3})
+        self.assertEqual(self.calls, 2)
+        self.e1.weight = 7
+        query()
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+
+    def test_change_while_computing(self):
+        n = self.nodes
+
+        def query(graph):
+            graph[n[0]] = {'age': 2}
+            return graph[n[0]]['age']
+
+        self.g.cached(query, depends_on=[n[0]])
+        self.g.cached(query)
+        self.assertEqual(self.cache.stats()['size'], 0)
+        self.assertEqual(self.cache.watched, {})
+
+    def test_eviction(self):
+        cache = Graph(DictionaryBackend()).enable_query_cache(maxsize=2, ttl=60)
+        for agg in ('count', 'count', 'min', 'max', 'count'):
+            cache.get('aggregate_neighbors', agg, of='age')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['evictions'], stats['size']), (1, 2, 2))
+        cache.ttl = 0
+        cache.get('aggregate_neighbors', 'min', of='age')
+        cache.get('aggregate_neighbors', 'min', of='age')
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_not_enabled(self):
+        with self.assertRaises(ValueError):
+            Graph(DictionaryBackend()).cached('khop', [], 1)
+        with self.assertRaises(TypeError):
+            self.g.subgraph(self.nodes).enable_query_cache()
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Graph(DictionaryBackend())
+
+    def test_disabled(self):
+        self.g.add_node()
+        self.assertIs(type(self.g), Graph)
+        self.assertEqual(self.g.metrics(), {'operations': {}, 'stores': {}})
+
+    def test_operations(self):
+        self.g.enable_metrics()
+        nodes = self.g.add_nodes(3)
+        edge = self.g.add_edge(nodes[0], nodes[1])
+        self.g[nodes[0]]
+        self.g.del_node(nodes[2])
+        operations = self.g.metrics()['operations']
+        self.assertEqual(operations['add_nodes']['count'], 1)
+        self.assertEqual(operations['add_node']['count'], 3)
+        self.assertEqual(operations['add_edge']['count'], 1)
+        self.assertEqual(operations['__getitem__']['count'], 1)
+        self.assertEqual(operations['del_node']['count'], 1)
+        self.assertEqual(sum(operations['add_node']['histogram'].values()), 3)
+
+    def test_stores(self):
+        self.g.enable_metrics()
+        nodes = self.g.add_nodes(2)
+        self.g.add_edge(nodes[0], nodes[1])
+        list(nodes[0].neighbors)
+        stores = self.g.metrics()['stores']
+        self.assertEqual(stores['edge_store']['writes'], 1)
+        self.assertEqual(stores['node_store']['writes'], 2)
+        self.assertTrue(stores['node_store']['reads'] >= 3)
+
+    def test_traversal(self):
+        self.g.enable_metrics()
+        nodes = self.g.add_nodes(2)
+        self.g.add_edge(nodes[0], nodes[1])
+        levels = self.g.khop(nodes[:1], 2)
+        self.assertNotIn('khop', self.g.metrics()['operations'])
+        self.assertEqual(len(list(levels)), 2)
+        self.assertEqual(self.g.metrics()['operations']['khop']['count'], 1)
+
+    def test_hook(self):
+        calls = []
+        self.g.enable_metrics(lambda name, seconds: calls.append(name))
+        self.g.add_node()
+        self.assertIn('add_node', calls)
+
+    def test_disable(self):
+        store = self.g.node_store
+        self.g.enable_metrics()
+        self.g.add_node()
+        self.g.disable_metrics()
+        self.assertIs(type(self.g), Graph)
+        self.assertIs(self.g.node_store, store)
+        self.g.add_node()
+        self.assertEqual(self.g.metrics()['operations']['add_node']['count'], 1)
+
+    def test_replaced_attribute_store(self):
+        node = self.g.add_node({'a': 1, 'b': 'two'})
+        self.g.enable_metrics()
+        store = self.g.set_attribute_schema({'a': int})
+        self.g.disable_metrics()
+        self.assertIs(self.g.attribute_store, store)
+        self.assertEqual(self.g[node], {'a': 1, 'b': 'two'})
+        self.g.enable_metrics()
+        store = self.g.compact_attributes()
+        self.assertEqual(self.g[node], {'a': 1, 'b': 'two'})
+        self.assertTrue(self.g.metrics()['stores']['attribute_store']['reads'])
+        self.g.disable_metrics()
+        self.assertIs(self.g.attribute_store, store)
+
 class TestElement(unittest.TestCase):
 
     def setUp(self):
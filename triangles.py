@@ -0,0 +1,302 @@
+"""
+Triangle counting, clustering coefficients and directed motif counts.
+
+Triangles are counted on the simple undirected graph underlying a graph:
+every edge connects its two nodes whatever its direction, parallel edges
+count once and self loops are ignored.  Nodes are ranked by degree, and each
+edge is only followed from its lower to its higher ranked node, so every
+triangle is found exactly once by intersecting the sets of higher ranked
+neighbors of an edge's two nodes.  High degree nodes have few higher ranked
+neighbors, which keeps the work at O(m^1.5) for m edges instead of the
+O(sum of degree^2) of comparing the neighbors of every node pairwise.
+
+With method='sparse' the counts are computed with scipy sparse matrix
+products instead, which is faster on large graphs when scipy is installed.
+
+Motifs are counted on the directed graph given by the direction_store: an
+undirected edge is an arc in both directions.
+"""
+import itertools
+
+
+METHODS = ('sets', 'sparse')
+
+#the connected triads, named as in the triad census of Holland and Leinhardt
+#(M mutual, A asymmetric and N null dyads, with a letter for the variants)
+TRIADS = ('021D', '021U', '021C', '111D', '111U', '030T', '030C', '201',
+          '120D', '120U', '120C', '210', '300')
+
+#the open triad formed at a center node by two neighbors it connects to with
+#an arc out, an arc in or mutual arcs
+OPEN_TRIADS = {
+    ('out', 'out'): '021D',
+    ('in', 'in'): '021U',
+    ('in', 'out'): '021C',
+    ('out', 'in'): '021C',
+    ('mutual', 'in'): '111D',
+    ('in', 'mutual'): '111D',
+    ('mutual', 'out'): '111U',
+    ('out', 'mutual'): '111U',
+    ('mutual', 'mutual'): '201',
+}
+
+
+class TriangleCounter():
+    '''
+    Counts the triangles of a graph.
+
+    The graph is read once, into sets of node numbers, so the counter can
+    answer several queries.  It doesn't follow later changes to the graph.
+
+    Args:
+        graph: the graph
+        method (optional): 'sets' to intersect neighbor sets, or 'sparse'
+        to use scipy sparse matrices
+
+    Raises:
+        ValueError: for an unknown method
+    '''
+
+    def __init__(self, graph, method='sets'):
+        if method not in METHODS:
+            raise ValueError('unsupported method %r, use one of %s' % (method, ', '.join(METHODS)))
+        self.method = method
+        self.nodes = list(graph.node_store.keys())
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        #numbered by UUID, which is cheaper to hash than the nodes
+        numbers = {node.id.int: i for i, node in enumerate(self.nodes)}
+
+        node_store = graph.node_store
+        if node_store is graph.backend.node_store and hasattr(graph.backend, 'scan_adjacency'):
+            adjacencies = graph.backend.scan_adjacency()
+        else:
+            adjacencies = node_store.items()
+
+        #the arcs of the directed graph, out of and into each node.  Directed
+        #edges are only in the adjacency list of their first node, so the
+        #adjacency lists give the direction of every edge.
+        successors = [set() for node in self.nodes]
+        predecessors = [set() for node in self.nodes]
+        for node, adjacency in adjacencies:
+            i = numbers[node.id.int]
+            out = successors[i]
+            for neighbor in adjacency.values():
+                j = numbers[neighbor.id.int]
+                if i != j:
+                    out.add(j)
+                    predecessors[j].add(i)
+        self.successors = successors
+        self.predecessors = predecessors
+        self.neighbors = [s | p for s, p in zip(successors, predecessors)]
+        self._per_node = None
+
+    def _higher(self):
+        '''
+        Returns:
+            for each node, the set of its neighbors ranked above it by degree
+        '''
+        neighbors = self.neighbors
+        rank = [0] * len(neighbors)
+        order = sorted(range(len(neighbors)), key=lambda i: len(neighbors[i]))
+        for position, i in enumerate(order):
+            rank[i] = position
+        return [{j for j in adjacent if rank[j] > rank[i]}
+                for i, adjacent in enumerate(neighbors)]
+
+    def triangles(self):
+        '''
+        Returns:
+            an iterator of every triangle once, as a tuple of three node
+            numbers (indexes into nodes)
+        '''
+        higher = self._higher()
+        for i, above in enumerate(higher):
+            for j in above:
+                for k in above & higher[j]:
+                    yield i, j, k
+
+    def _matrix(self):
+        '''
+        Returns:
+            the symmetric adjacency matrix of the graph, as a scipy sparse
+            matrix
+        '''
+        import numpy
+        from scipy import sparse
+
+        neighbors = self.neighbors
+        degrees = numpy.fromiter((len(adjacent) for adjacent in neighbors),
+                                 dtype=numpy.int64, count=len(neighbors))
+        indptr = numpy.zeros(len(neighbors) + 1, dtype=numpy.int64)
+        numpy.cumsum(degrees, out=indptr[1:])
+        indices = numpy.fromiter(itertools.chain.from_iterable(neighbors),
+                                 dtype=numpy.int64, count=int(indptr[-1]))
+        data = numpy.ones(len(indices), dtype=numpy.int64)
+        size = len(neighbors)
+        return sparse.csr_matrix((data, indices, indptr), shape=(size, size))
+
+    def count(self):
+        '''
+        Returns:
+            the number of triangles in the graph
+        '''
+        if self.method == 'sparse':
+            adjacency = self._matrix()
+            return int(adjacency.multiply(adjacency @ adjacency).sum()) // 6
+        higher = self._higher()
+        return sum(len(above & higher[j]) for above in higher for j in above)
+
+    def _counts(self):
+        '''
+        Returns:
+            a list of the number of triangles of each node
+        '''
+        if self._per_node is not None:
+            return self._per_node
+        if self.method == 'sparse':
+            adjacency = self._matrix()
+            counts = adjacency.multiply(adjacency @ adjacency).sum(axis=1)
+            self._per_node = [int(count) // 2 for count in counts.A1]
+            return self._per_node
+        counts = [0] * len(self.neighbors)
+        higher = self._higher()
+        for i, above in enumerate(higher):
+            for j in above:
+                common = above & higher[j]
+                if common:
+                    counts[i] += len(common)
+                    counts[j] += len(common)
+                    for k in common:
+                        counts[k] += 1
+        self._per_node = counts
+        return counts
+
+    def _select(self, values, nodes):
+        if nodes is None:
+            return dict(zip(self.nodes, values))
+        index = self.index
+        return {node: values[index[node]] for node in nodes}
+
+    def node_triangles(self, nodes=None):
+        '''
+        Args:
+            nodes (optional): an iterable of the nodes to count for, by
+            default all of them
+
+        Returns:
+            a dictionary of node to the number of triangles it is part of
+        '''
+        return self._select(self._counts(), nodes)
+
+    def clustering(self, nodes=None):
+        '''
+        The local clustering coefficient of a node is the fraction of the
+        pairs of its neighbors which are neighbors of each other.
+
+        Args:
+            nodes (optional): an iterable of the nodes, by default all of them
+
+        Returns:
+            a dictionary of node to its clustering coefficient, 0 for nodes
+            with fewer than two neighbors
+        '''
+        coefficients = []
+        for triangles, adjacent in zip(self._counts(), self.neighbors):
+            degree = len(adjacent)
+            coefficients.append(2 * triangles / (degree * (degree - 1)) if degree > 1 else 0.0)
+        return self._select(coefficients, nodes)
+
+    def average_clustering(self):
+        '''
+        Returns:
+            the mean of the clustering coefficients of all the nodes, 0 for an
+            empty graph
+        '''
+        coefficients = self.clustering()
+        if not coefficients:
+            return 0.0
+        return sum(coefficients.values()) / len(coefficients)
+
+    def transitivity(self):
+        '''
+        Returns:
+            the global clustering coefficient: three times the number of
+            triangles over the number of connected triples of nodes
+        '''
+        triples = sum(len(adjacent) * (len(adjacent) - 1) // 2 for adjacent in self.neighbors)
+        if not triples:
+            return 0.0
+        #every triangle is counted once for each of its three nodes
+        return sum(self._counts()) / triples
+
+    def _dyad(self, center, other):
+        '''
+        Returns:
+            'out', 'in' or 'mutual': how center connects to other
+        '''
+        out = other in self.successors[center]
+        into = other in self.predecessors[center]
+        if out and into:
+            return 'mutual'
+        return 'out' if out else 'in'
+
+    def _closed_triad(self, i, j, k):
+        dyads = {(a, b): self._dyad(a, b) for a, b in ((i, j), (j, k), (i, k))}
+        mutual = [pair for pair, dyad in dyads.items() if dyad == 'mutual']
+        if len(mutual) == 3:
+            return '300'
+        if len(mutual) == 2:
+            return '210'
+        if len(mutual) == 1:
+            #the node outside the mutual pair either sends both its arcs,
+            #receives both, or one of each
+            outside = ({i, j, k} - set(mutual[0])).pop()
+            arcs = {self._dyad(outside, other) for other in mutual[0]}
+            if arcs == {'out'}:
+                return '120D'
+            if arcs == {'in'}:
+                return '120U'
+            return '120C'
+        out_degrees = [len(self.successors[a] & {i, j, k}) for a in (i, j, k)]
+        return '030C' if out_degrees == [1, 1, 1] else '030T'
+
+    def motifs(self):
+        '''
+        Count the connected three node motifs of the directed graph.
+
+        Returns:
+            a dictionary of the name of each connected triad type in the
+            triad census (from '021D' to '300') to the number of sets of
+            three nodes forming it
+
+        Note:
+            Open triads are counted from the degrees of their middle node,
+            without enumerating them: only the triangles are enumerated.
+        '''
+        census = dict.fromkeys(TRIADS, 0)
+        for center in range(len(self.neighbors)):
+            kinds = {'out': 0, 'in': 0, 'mutual': 0}
+            for other in self.neighbors[center]:
+                kinds[self._dyad(center, other)] += 1
+            out, into, mutual = kinds['out'], kinds['in'], kinds['mutual']
+            census['021D'] += out * (out - 1) // 2
+            census['021U'] += into * (into - 1) // 2
+            census['021C'] += out * into
+            census['111D'] += mutual * into
+            census['111U'] += mutual * out
+            census['201'] += mutual * (mutual - 1) // 2
+        for triangle in self.triangles():
+            census[self._closed_triad(*triangle)] += 1
+            #the pairs of neighbors counted above as open triads
+            for center, a, b in _around(triangle):
+                census[OPEN_TRIADS[self._dyad(center, a), self._dyad(center, b)]] -= 1
+        return census
+
+
+def _around(triangle):
+    '''
+    Returns:
+        each node of triangle with the two other nodes
+    '''
+    i, j, k = triangle
+    return ((i, j, k), (j, i, k), (k, i, j))
@@ -0,0 +1,376 @@
+"""
+Read-only views of part of a graph.
+
+A view holds only the set of elements selected from its parent graph.  Its
+stores filter the parent's stores on every access, so no node, edge or
+attribute data is copied, and changes to the parent show through the view.
+
+Views are Graph objects, so the whole read API (and anything built on the
+stores, such as traversals) works on them unchanged.  The elements a view
+returns belong to the view: a node's neighbors and edges are limited to the
+view too.
+
+A SnapshotView is a view of a graph as it was at one point in time, read
+from the versioned stores of a DictionaryBackend(snapshots=True).
+"""
+from collections.abc import KeysView
+from types import MappingProxyType
+
+from db import Graph, _pair_edges
+
+
+class GraphView(Graph):
+    '''
+    Base class for read-only views of a parent graph.
+
+    Subclasses implement _has_node, _has_edge, _node_keys and _edge_keys to
+    select the elements of the view.
+    '''
+
+    def __init__(self, graph, parent=None):
+
+        #the stores are read from parent, by default the graph itself
+        if parent is None:
+            parent = graph
+        self.parent = parent
+        self.backend = graph.backend
+        self.node_store = ViewNodeStore(self, parent.node_store)
+        self.attribute_store = ViewAttributeStore(self, parent.attribute_store)
+        self.edge_store = ViewEdgeStore(self, parent.edge_store)
+        self.weight_store = ViewWeightStore(self, parent.weight_store)
+        self.direction_store = ViewDirectionStore(self, parent.direction_store)
+        self.pair_store = ViewPairStore(self, parent.pair_store)
+        self.commit_func = None
+        self.abort_func = None
+        self.node_type = graph.node_type
+        self.edge_type = graph.edge_type
+        self._metrics = None
+        self._listeners = []
+        self._components = None
+        self._changes = None
+        self._unmaintained = []
+        self._cache = None
+
+    def _has_element(self, element):
+        return self._has_node(element) or self._has_edge(element)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("'" + self.__class__.__name__ + "' objects are read-only")
+
+    add_node = add_nodes = add_edge = add_edges = _read_only
+    del_node = del_nodes = del_edge = del_edges = compact = _read_only
+    __setitem__ = _set_weight = _read_only
+    #a view isn't told about the changes to its parent
+    enable_query_cache = _read_only
+
+    def close(self):
+        #the backend belongs to the parent graph
+        pass
+
+    def snapshot(self):
+        #the backend would snapshot the whole parent graph, not the view
+        raise TypeError("'" + self.__class__.__name__ + "' objects don't support "
+                        "snapshots, take one of the parent graph instead")
+
+    def enable_component_index(self):
+        #the backend's component_store indexes the whole parent graph, and
+        #a view isn't told about the changes to its parent
+        raise TypeError("'" + self.__class__.__name__ + "' objects don't support "
+                        "a component index, enable it on the parent graph")
+
+
+class SubgraphView(GraphView):
+    '''
+    The subgraph induced by a set of nodes: the nodes, and every edge of the
+    parent graph between two of them.
+
+    Args:
+        graph: the parent graph
+        nodes: an iterable of nodes of the parent graph
+    '''
+
+    def __init__(self, graph, nodes):
+        super().__init__(graph)
+        self._nodes = frozenset(nodes)
+
+    def _has_node(self, node):
+        return node in self._nodes and node in self.parent.node_store
+
+    def _has_edge(self, edge):
+        try:
+            node1, node2 = self.parent.edge_store[edge]
+        except KeyError:
+            return False
+        return node1 in self._nodes and node2 in self._nodes
+
+    def _node_keys(self):
+        parent_nodes = self.parent.node_store
+        return (node for node in self._nodes if node in parent_nodes)
+
+    def _edge_keys(self):
+        seen = set()
+        parent_nodes = self.parent.node_store
+        for node in self._node_keys():
+            for edge, neighbor in parent_nodes[node].items():
+                if neighbor in self._nodes and edge not in seen:
+                    seen.add(edge)
+                    yield edge
+
+
+class EdgeSubgraphView(GraphView):
+    '''
+    The subgraph made of a set of edges and the nodes they connect.
+
+    Args:
+        graph: the parent graph
+        edges: an iterable of edges of the parent graph
+    '''
+
+    def __init__(self, graph, edges):
+        super().__init__(graph)
+        self._edges = frozenset(edges)
+        self._nodes = frozenset(node for edge in self._edges
+                                for node in graph.edge_store[edge])
+
+    def _has_node(self, node):
+        return node in self._nodes and node in self.parent.node_store
+
+    def _has_edge(self, edge):
+        return edge in self._edges and edge in self.parent.edge_store
+
+    def _node_keys(self):
+        parent_nodes = self.parent.node_store
+        return (node for node in self._nodes if node in parent_nodes)
+
+    def _edge_keys(self):
+        parent_edges = self.parent.edge_store
+        return (edge for edge in self._edges if edge in parent_edges)
+
+
+class SnapshotView(GraphView):
+    '''
+    The graph as it was when the snapshot was taken.  Later changes to the
+    graph don't show in the view.
+
+    Close the view (or use it as a context manager) when done with it, so
+    the backend stops keeping the old versions it reads.  It is closed when
+    garbage collected otherwise.
+
+    Args:
+        graph: the graph
+        snapshot: a backends.mvcc.Snapshot of the graph's backend
+    '''
+
+    def __init__(self, graph, snapshot):
+        super().__init__(graph, snapshot)
+        self.snapshot = snapshot
+
+    def _has_node(self, node):
+        return node in self.parent.node_store
+
+    def _has_edge(self, edge):
+        return edge in self.parent.edge_store
+
+    def _node_keys(self):
+        return self.parent.node_store.keys()
+
+    def _edge_keys(self):
+        return self.parent.edge_store.keys()
+
+    def close(self):
+        '''
+        Release the old versions kept for the view.  It must not be read
+        afterwards.
+        '''
+        self.snapshot.close()
+
+    @property
+    def closed(self):
+        return self.snapshot.closed
+
+
+class ViewStore():
+    '''
+    Base class for the read-only stores of a view.
+    '''
+
+    def __init__(self, view, store):
+        self.view = view
+        self.store = store
+
+    def _contains(self, key):
+        return self.view._has_element(key)
+
+    def _keys(self):
+        return self.view._node_keys()
+
+    def _value(self, value):
+        return value
+
+    def __getitem__(self, key):
+        if not self._contains(key):
+            raise KeyError(key)
+        return self._value(self.store[key])
+
+    def __contains__(self, key):
+        return self._contains(key)
+
+    def get(self, key, default=None):
+        if not self._contains(key):
+            return default
+        return self._value(self.store[key])
+
+    def keys(self):
+        #re-iterable and sized, like the keys of a dictionary
+        return KeysView(self)
+
+    def __iter__(self):
+        view = self.view
+        return (key._bind(view) for key in self._keys())
+
+    def values(self):
+        return (self._value(self.store[key]) for key in self._keys())
+
+    def items(self):
+        view = self.view
+        return ((key._bind(view), self._value(self.store[key]))
+                for key in self._keys())
+
+    def __len__(self):
+        return sum(1 for key in self._keys())
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('views are read-only')
+
+    __setitem__ = __delitem__ = pop = append = remove = _read_only
+
+
+class ViewNodeStore(ViewStore):
+
+    def _contains(self, key):
+        return self.view._has_node(key)
+
+    def _value(self, adjacency):
+        return ViewAdjacency(self.view, adjacency)
+
+
+class ViewEdgeStore(ViewStore):
+
+    def _contains(self, key):
+        return self.view._has_edge(key)
+
+    def _keys(self):
+        return self.view._edge_keys()
+
+    def _value(self, nodes):
+        view = self.view
+        return tuple(node._bind(view) for node in nodes)
+
+
+class ViewAttributeStore(ViewStore):
+
+    def _keys(self):
+        view = self.view
+        for node in view._node_keys():
+            yield node
+        for edge in view._edge_keys():
+            yield edge
+
+    def _value(self, attributes):
+        return MappingProxyType(attributes)
+
+
+class ViewWeightStore(ViewAttributeStore):
+
+    def _value(self, weight):
+        return weight
+
+
+class ViewDirectionStore(ViewStore):
+
+    def _contains(self, edge):
+        return self.view._has_edge(edge) and edge in self.store
+
+    def _keys(self):
+        return (edge for edge in self.view._edge_keys() if edge in self.store)
+
+
+class ViewPairStore(ViewStore):
+
+    def _contains(self, pair):
+        return bool(self._value(self.store.get(pair, ())))
+
+    def _keys(self):
+        view = self.view
+        seen = set()
+        for edge in view._edge_keys():
+            node1, node2 = view.parent.edge_store[edge]
+            pairs = [(node1, node2)]
+            if edge not in view.parent.direction_store:
+                pairs.append((node2, node1))
+            for pair in pairs:
+                if pair not in seen:
+                    seen.add(pair)
+                    yield pair
+
+    def _value(self, edges):
+        view = self.view
+        return frozenset(edge._bind(view) for edge in _pair_edges(edges)
+                         if view._has_edge(edge))
+
+    def __iter__(self):
+        view = self.view
+        return ((node1._bind(view), node2._bind(view)) for node1, node2 in self._keys())
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+
+class ViewAdjacency():
+    '''
+    The adjacency list of a node in a view: only edges in the view are
+    included.
+    '''
+
+    def __init__(self, view, adjacency):
+        self.view = view
+        self.adjacency = adjacency
+
+    def _edges(self):
+        has_edge = self.view._has_edge
+        return (edge for edge in self.adjacency if has_edge(edge))
+
+    def __getitem__(self, edge):
+        if not self.view._has_edge(edge):
+            raise KeyError(edge)
+        return self.adjacency[edge]._bind(self.view)
+
+    def __contains__(self, edge):
+        return edge in self.adjacency and self.view._has_edge(edge)
+
+    def get(self, edge, default=None):
+        if edge not in self:
+            return default
+        return self[edge]
+
+    def keys(self):
+        view = self.view
+        return [edge._bind(view) for edge in self._edges()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        view = self.view
+        return [self.adjacency[edge]._bind(view) for edge in self._edges()]
+
+    def items(self):
+        view = self.view
+        return [(edge._bind(view), self.adjacency[edge]._bind(view))
+                for edge in self._edges()]
+
+    def __len__(self):
+        return sum(1 for edge in self._edges())
+
+    def copy(self):
+        return dict(self.items())
@@ -1,3 +1,187 @@
+"""
+A graph keeping its elements ordered by weight.
+"""
+import heapq
+import itertools
 
+from db import Graph
+from backends.in_memory import WeightIndex
 
 
+class WeightedGraph(Graph):
+    """
+    A graph with sorted indexes of the weights of its nodes and edges, so the
+    heaviest or lightest elements, or the elements in a range of weights, are
+    found without sorting every element.
+
+    The indexes are kept in sync by add_node(), add_edge(), the deletions and
+    the Element.weight setter.  They live in the backend's node_weight_index
+    and edge_weight_index (a TreeSet with the ZODB backend), or in memory for
+    backends without them.  A plain Graph on the same backend clears them
+    when it commits changes, so they are rebuilt rather than trusted after
+    changes they missed: the indexes are checked before every use.
+
+    Args:
+        backend (optional): Backend object.  Defaults to an in-memory
+        DictionaryBackend.
+
+    Note:
+        Weights must be numbers that compare with each other.  Elements
+        weighing None are left out of the indexes.
+    """
+
+    instrumented_operations = Graph.instrumented_operations + (
+        'top_k_nodes', 'top_k_edges', 'weight_range')
+
+    def __init__(self, backend=None):
+        super().__init__(backend)
+        self.node_weight_index = getattr(self.backend, 'node_weight_index', None)
+        if self.node_weight_index is None:
+            self.node_weight_index = WeightIndex()
+        self.edge_weight_index = getattr(self.backend, 'edge_weight_index', None)
+        if self.edge_weight_index is None:
+            self.edge_weight_index = WeightIndex()
+        self._unmaintained = [name for name in self._unmaintained
+                              if name not in ('node_weight_index', 'edge_weight_index')]
+        self._weight_generation = self._weight_index_generation()
+        if not len(self.node_weight_index) and not len(self.edge_weight_index) \
+                and len(self.weight_store):
+            self.rebuild_weight_index()
+
+    def rebuild_weight_index(self):
+        """
+        Rebuild the weight indexes from the weight_store.
+        """
+        self.node_weight_index.clear()
+        self.edge_weight_index.clear()
+        self._weight_generation = self._weight_index_generation()
+        for element, weight in self.weight_store.items():
+            self._index_weight(element, weight)
+
+    def _weight_index_generation(self):
+        return (self._index_generation('node_weight_index'),
+                self._index_generation('edge_weight_index'))
+
+    def _check_weight_index(self):
+        #a graph on the same backend cleared the indexes, see Graph.commit()
+        if self._weight_generation != self._weight_index_generation():
+            self.rebuild_weight_index()
+
+    def _weight_index(self, element):
+        if element in self.edge_store:
+            return self.edge_weight_index
+        return self.node_weight_index
+
+    def _index_weight(self, element, weight, index=None):
+        if weight is None:
+            return
+        if index is None:
+            index = self._weight_index(element)
+        index.add((weight, element))
+
+    def _unindex_weight(self, element, weight, index=None):
+        if weight is None:
+            return
+        if index is None:
+            index = self._weight_index(element)
+        index.remove((weight, element))
+
+    def _add_node(self, attributes, weight):
+        self._check_weight_index()
+        node = super()._add_node(attributes, weight)
+        self._index_weight(node, weight, self.node_weight_index)
+        return node
+
+    def _add_edge(self, node1, node2, attributes, directed, weight):
+        self._check_weight_index()
+        edge = super()._add_edge(node1, node2, attributes, directed, weight)
+        self._index_weight(edge, weight, self.edge_weight_index)
+        return edge
+
+    def _store_weight(self, element, weight):
+        self._check_weight_index()
+        index = self._weight_index(element)
+        self._unindex_weight(element, self.weight_store.get(element), index)
+        super()._store_weight(element, weight)
+        self._index_weight(element, weight, index)
+
+    def _remove_edge(self, edge):
+        self._check_weight_index()
+        weight = self.weight_store.get(edge)
+        super()._remove_edge(edge)
+        self._unindex_weight(edge, weight, self.edge_weight_index)
+
+    def _remove_nodes(self, nodes):
+        self._check_weight_index()
+        nodes = set(nodes)
+        weights = [(node, self.weight_store.get(node)) for node in nodes]
+        super()._remove_nodes(nodes)
+        for node, weight in weights:
+            self._unindex_weight(node, weight, self.node_weight_index)
+
+    def compact(self):
+        """
+        Remove orphaned entries left in the stores, see Graph.compact(), and
+        rebuild the weight indexes.
+
+        Returns:
+            the number of entries removed
+        """
+        removed = super().compact()
+        self.rebuild_weight_index()
+        return removed
+
+    def top_k_nodes(self, k, lightest=False):
+        """
+        Args:
+            k: the number of nodes to return
+            lightest (optional): Boolean value, True for the lightest nodes
+
+        Returns:
+            a list of the k heaviest nodes, heaviest first (or the k
+            lightest, lightest first)
+        """
+        return self._top_k(self.node_weight_index, k, lightest)
+
+    def top_k_edges(self, k, lightest=False):
+        """
+        Args:
+            k: the number of edges to return
+            lightest (optional): Boolean value, True for the lightest edges
+
+        Returns:
+            a list of the k heaviest edges, heaviest first (or the k
+            lightest, lightest first)
+        """
+        return self._top_k(self.edge_weight_index, k, lightest)
+
+    def _top_k(self, index, k, lightest):
+        self._check_weight_index()
+        pairs = index.ascending() if lightest else index.descending()
+        return [element for weight, element in itertools.islice(pairs, k)]
+
+    def weight_range(self, lo=None, hi=None, elements=None):
+        """
+        Find the elements weighing between lo and hi.
+
+        Args:
+            lo (optional): the lowest weight, unbounded by default
+            hi (optional): the highest weight, unbounded by default
+            elements (optional): 'nodes' or 'edges' to only find nodes or
+            edges, both by default
+
+        Returns:
+            an iterator of the elements with lo <= weight <= hi, lightest
+            first
+        """
+        self._check_weight_index()
+        if elements == 'nodes':
+            pairs = self.node_weight_index.ascending(lo, hi)
+        elif elements == 'edges':
+            pairs = self.edge_weight_index.ascending(lo, hi)
+        elif elements is None:
+            pairs = heapq.merge(self.node_weight_index.ascending(lo, hi),
+                                self.edge_weight_index.ascending(lo, hi))
+        else:
+            raise ValueError("elements must be 'nodes', 'edges' or None")
+        return (element for weight, element in pairs)